@@ -0,0 +1,398 @@
+"""
+Several API calls in one HTTP request.
+
+POST /api/batch/
+    {
+        "requests": [
+            {"method": "GET", "url": "/api/v4/tags/<uuid>"},
+            {"method": "PATCH", "url": "/api/v4/tasks/<uuid>", "body": {...}},
+            ...
+        ]
+    }
+returns the responses in the order of the requests:
+[{"status": 200, "body": <the response envelope>}, ...]
+
+The sub-requests are dispatched in-process through the URL resolver, so
+they skip the middlewares and share the authentication of the batch
+request: the JWT is verified once, but each of them is rate limited like a
+request of its own (see core/throttling.py). The requests are run in order,
+but the consecutive GET requests don't depend on each other and are run
+concurrently, in threads, when the batch is served under ASGI.
+
+The sub-requests of a batch share a BatchCache (see get_batch_cached):
+records read by one of them, e.g. the tags and users, are reused by the
+others. The views can fill it beforehand for a group of GET requests with a
+`prefetch_batch(cache, sub_requests)` classmethod. The cache is cleared
+after every write so that the following requests see its changes.
+
+Settings (BATCH_REQUESTS):
+    MAX_REQUESTS: maximum number of sub-requests of a batch
+    CONCURRENCY: maximum number of GET requests run at the same time
+"""
+import asyncio
+import io
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.parsers import get_api_parser_classes
+from core.renderers import (
+    EnvelopeMixin, decode_fragments, get_api_renderer_classes
+)
+from core.throttling import release_leases
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "MAX_REQUESTS": 30,
+    "CONCURRENCY": 8,
+}
+
+ALLOWED_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'}
+SAFE_METHODS = {'GET', 'HEAD'}
+
+# Meta keys of the batch request copied to the sub-requests
+COPIED_META_KEYS = {
+    'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL',
+    'SCRIPT_NAME',
+}
+
+# Headers of the batch request which don't apply to each sub-request: the
+# Idempotency-Key of a batch would make its creates replay each other
+DROPPED_META_KEYS = {'HTTP_IDEMPOTENCY_KEY'}
+
+
+def get_batch_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "BATCH_REQUESTS", {}))
+    return config
+
+
+# |================================= Cache ================================| #
+class BatchCache:
+    """
+    Records shared by the sub-requests of a batch, by namespace and key.
+    Two concurrent requests missing the same key may both load it, which
+    is harmless.
+    """
+
+    def __init__(self):
+        self.values = defaultdict(dict)
+        self.lock = threading.Lock()
+
+    def get_or_load(self, namespace, key, load):
+        values = self.values[namespace]
+        if key in values:
+            return values[key]
+        value = load()
+        with self.lock:
+            values[key] = value
+        return value
+
+    def set_many(self, namespace, values):
+        with self.lock:
+            self.values[namespace].update(values)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+current_batch_cache = ContextVar("current_batch_cache", default=None)
+
+
+def get_batch_cached(namespace, key, load):
+    """
+    Return load(), cached for the other sub-requests when called while a
+    batch is running.
+    """
+    cache = current_batch_cache.get()
+    if cache is None:
+        return load()
+    return cache.get_or_load(namespace, key, load)
+
+
+# |============================== Sub-requests ============================| #
+class SubRequest:
+    """
+    A request of a batch, resolved to its view.
+    """
+
+    def __init__(self, index, method, url, body=None):
+        self.index = index
+        self.method = method
+        self.url = url
+        self.body = body
+        self.path, _, self.query_string = url.partition('?')
+        self.match = resolve(self.path)
+
+    @property
+    def view_class(self):
+        return getattr(self.match.func, 'cls', None)
+
+    @property
+    def action(self):
+        # The viewset action the method is mapped to
+        actions = getattr(self.match.func, 'actions', None) or {}
+        return actions.get(self.method.lower())
+
+    @property
+    def kwargs(self):
+        return self.match.kwargs
+
+    def build_request(self, batch_request):
+        payload = (
+            b'' if self.body is None
+            else json.dumps(self.body).encode()
+        )
+        environ = {
+            key: value for key, value in batch_request.META.items()
+            if (key.startswith('HTTP_') or key in COPIED_META_KEYS)
+            and key not in DROPPED_META_KEYS
+        }
+        environ.update({
+            'REQUEST_METHOD': self.method,
+            'PATH_INFO': self.path,
+            'QUERY_STRING': self.query_string,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(payload)),
+            # The responses are embedded in the batch response, which is
+            # encoded with the format accepted by the batch request
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(payload),
+            'wsgi.url_scheme': batch_request.scheme,
+        })
+        request = WSGIRequest(environ)
+        # The batch request was already authenticated, the sub-requests
+        # reuse its user instead of verifying the token again
+        request._force_auth_user = batch_request.user
+        request._force_auth_token = batch_request.auth
+        return request
+
+
+def get_response_body(response):
+    """
+    Return the body of a sub-response as data embedded in the batch
+    response.
+    """
+    renderer = getattr(response, 'accepted_renderer', None)
+    if isinstance(renderer, EnvelopeMixin):
+        # Wrapped like the renderer would, without encoding it
+        return renderer.get_envelope(
+            decode_fragments(response.data),
+            dict(response.renderer_context, response=response)
+        )
+    if response.streaming:
+        return None
+    if hasattr(response, 'render'):
+        response.render()
+    content_type = response.get('Content-Type', '')
+    if content_type.startswith('application/json'):
+        return json.loads(response.content or b'null')
+    if content_type.startswith('text/'):
+        return response.content.decode(response.charset)
+    return None
+
+
+# |================================= View =================================| #
+class BatchView(APIView):
+    """
+    Runs the API calls listed in the body, see the module docstring.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = "batch"
+    # The sub-requests run the same queries as each other, see
+    # core/query_budget.py
+    n_plus_one_threshold = None
+    renderer_classes = get_api_renderer_classes()
+    parser_classes = get_api_parser_classes()
+
+    def get_sub_requests(self, request):
+        config = get_batch_settings()
+        items = (
+            request.data.get("requests")
+            if isinstance(request.data, dict) else None
+        )
+        if not isinstance(items, list) or not items:
+            raise ValidationError(
+                detail={"message": "requests must be a non empty list"}
+            )
+        if len(items) > config["MAX_REQUESTS"]:
+            raise ValidationError(
+                detail={
+                    "message": (
+                        f"A batch has at most {config['MAX_REQUESTS']} "
+                        f"requests"
+                    )
+                }
+            )
+
+        sub_requests = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValidationError(
+                    detail={"message": f"Request {index} must be an object"}
+                )
+            method = str(item.get("method", "GET")).upper()
+            url = item.get("url")
+            if method not in ALLOWED_METHODS:
+                raise ValidationError(
+                    detail={
+                        "message": (
+                            f"Request {index}: method {method} is not "
+                            f"allowed"
+                        )
+                    }
+                )
+            if not isinstance(url, str) or not url.startswith('/'):
+                raise ValidationError(
+                    detail={
+                        "message": (
+                            f"Request {index}: url must be an absolute path"
+                        )
+                    }
+                )
+            try:
+                sub_request = SubRequest(index, method, url, item.get("body"))
+            except Resolver404:
+                sub_request = None
+            else:
+                if sub_request.view_class is type(self):
+                    raise ValidationError(
+                        detail={
+                            "message": (
+                                f"Request {index}: batches can't be nested"
+                            )
+                        }
+                    )
+            sub_requests.append((index, url, sub_request))
+        return sub_requests
+
+    def get_groups(self, sub_requests):
+        """
+        Split the requests into groups run one after the other: every write
+        is a group of its own, consecutive reads are grouped.
+        """
+        groups = []
+        for sub_request in sub_requests:
+            read = sub_request.method in SAFE_METHODS
+            if read and groups and groups[-1][0]:
+                groups[-1][1].append(sub_request)
+            else:
+                groups.append((read, [sub_request]))
+        return groups
+
+    def prefetch(self, cache, sub_requests):
+        by_view_class = defaultdict(list)
+        for sub_request in sub_requests:
+            if hasattr(sub_request.view_class, 'prefetch_batch'):
+                by_view_class[sub_request.view_class].append(sub_request)
+        for view_class, view_sub_requests in by_view_class.items():
+            view_class.prefetch_batch(cache, view_sub_requests)
+
+    def run_sub_request(self, request, sub_request, in_thread=False):
+        django_request = None
+        try:
+            django_request = sub_request.build_request(request)
+            response = sub_request.match.func(
+                django_request,
+                *sub_request.match.args,
+                **sub_request.match.kwargs
+            )
+            return {
+                "status": response.status_code,
+                "body": get_response_body(response),
+            }
+        except Exception:
+            logger.exception(
+                "Batch request %s %s failed", sub_request.method,
+                sub_request.url
+            )
+            return {
+                "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "body": {"message": "Internal server error"},
+            }
+        finally:
+            # The sub-requests skip AdmissionControlMiddleware
+            if django_request is not None:
+                release_leases(django_request)
+            if in_thread:
+                close_old_connections()
+
+    def run_concurrently(self, request, sub_requests):
+        semaphore_size = get_batch_settings()["CONCURRENCY"]
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(semaphore_size)
+            run = sync_to_async(self.run_sub_request, thread_sensitive=False)
+
+            async def run_one(sub_request):
+                async with semaphore:
+                    return await run(request, sub_request, in_thread=True)
+
+            return await asyncio.gather(
+                *(run_one(sub_request) for sub_request in sub_requests)
+            )
+
+        return async_to_sync(run_all)()
+
+    def post(self, request, *args, **kwargs):
+        sub_requests = self.get_sub_requests(request)
+        results = [None] * len(sub_requests)
+        for index, url, sub_request in sub_requests:
+            if sub_request is None:
+                results[index] = {
+                    "status": status.HTTP_404_NOT_FOUND,
+                    "body": {"message": f"No API matches {url}"},
+                }
+
+        concurrent = isinstance(request._request, ASGIRequest)
+        cache = BatchCache()
+        # The records created by the authenticated user are the most common
+        cache.set_many("users", {request.user.pk: request.user})
+        token = current_batch_cache.set(cache)
+        try:
+            groups = self.get_groups([
+                sub_request for _, _, sub_request in sub_requests
+                if sub_request is not None
+            ])
+            for read, group in groups:
+                if not read:
+                    results[group[0].index] = self.run_sub_request(
+                        request, group[0]
+                    )
+                    # The following requests must see the changes
+                    cache.clear()
+                    continue
+                self.prefetch(cache, group)
+                if concurrent and len(group) > 1:
+                    group_results = self.run_concurrently(request, group)
+                else:
+                    group_results = [
+                        self.run_sub_request(request, sub_request)
+                        for sub_request in group
+                    ]
+                for sub_request, result in zip(group, group_results):
+                    results[sub_request.index] = result
+        finally:
+            current_batch_cache.reset(token)
+        return Response(results)
+
+    def get_renderer_context(self):
+        context = super().get_renderer_context()
+        context["message"] = "Batch results"
+        return context
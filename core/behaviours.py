@@ -1,6 +1,9 @@
 import uuid
 
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
+
+from core.signals import post_soft_delete, pre_soft_delete
 
 
 class UUIDMixin(models.Model):
@@ -8,3 +11,121 @@ class UUIDMixin(models.Model):
 
     class Meta:
         abstract = True
+
+
+class VersionConflict(Exception):
+    """
+    The record was changed by someone else since it was read.
+    """
+
+
+class VersionMixin(models.Model):
+    """
+    Optimistic concurrency control.
+
+    Every UPDATE of a record is conditioned on the version it was read with
+    (`UPDATE ... WHERE id = <id> AND version = <version>`) and increments
+    the version. When no row matches, the record was changed since it was
+    read and VersionConflict is raised instead of overwriting the change.
+    Set `version` to the version a client has seen before saving to detect
+    the changes made since that client read the record.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or (
+            update_fields is not None and not update_fields
+        ):
+            return super().save(*args, **kwargs)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        self._expected_version = self.version
+        self.version += 1
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            self.version = self._expected_version
+            raise
+        finally:
+            del self._expected_version
+
+    def _do_update(
+        self, base_qs, using, pk_val, values, update_fields, forced_update
+    ):
+        expected_version = getattr(self, '_expected_version', None)
+        if expected_version is None:
+            return super()._do_update(
+                base_qs, using, pk_val, values, update_fields, forced_update
+            )
+        updated = super()._do_update(
+            base_qs.filter(version=expected_version), using, pk_val, values,
+            update_fields, forced_update
+        )
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(
+                f"{self._meta.object_name} {pk_val} was changed since "
+                f"version {expected_version} was read"
+            )
+        return updated
+
+
+class SoftDeleteManager(models.Manager):
+    """
+    Default manager of the soft deletable models, it hides the deleted
+    records.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class SoftDeleteMixin(models.Model):
+    """
+    Records are marked as deleted instead of being deleted, the rows are
+    physically deleted later by the `purge_deleted` management command.
+
+    `objects` (the default manager, also used by the related managers)
+    only returns the records which aren't deleted, `all_objects` returns
+    all of them.
+    `QuerySet.delete()` still deletes the rows physically.
+    """
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        abstract = True
+
+    def delete(self, using=None, keep_parents=False):
+        self.soft_delete(using=using)
+        return 1, {self._meta.label: 1}
+
+    def soft_delete(self, using=None):
+        """
+        Mark the record as deleted with a single UPDATE, nothing is
+        cascaded.
+        """
+        using = using or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            pre_soft_delete.send(
+                sender=self.__class__, instance=self, using=using
+            )
+            self.deleted_at = timezone.now()
+            self.__class__.all_objects.using(using).filter(
+                pk=self.pk
+            ).update(deleted_at=self.deleted_at)
+            post_soft_delete.send(
+                sender=self.__class__, instance=self, using=using
+            )
+
+    soft_delete.alters_data = True
+
+    def hard_delete(self, using=None, keep_parents=False):
+        return super().delete(using=using, keep_parents=keep_parents)
+
+    hard_delete.alters_data = True
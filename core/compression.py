@@ -0,0 +1,252 @@
+"""
+Content-Encoding support for API responses.
+
+This module holds the codecs used by the compression middleware, the
+``Accept-Encoding`` negotiation and a small in-process cache of already
+compressed bodies.
+
+gzip is always available (standard library). brotli and zstd are used only
+when the optional ``brotli`` and ``zstandard`` packages are installed.
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+# Compression levels per codec for each named profile.
+# "fast" favours CPU, "max" favours bytes on the wire.
+DEFAULT_PROFILES = {
+    "fast": {"zstd": 1, "br": 1, "gzip": 1},
+    "balanced": {"zstd": 3, "br": 4, "gzip": 6},
+    "max": {"zstd": 19, "br": 11, "gzip": 9},
+}
+
+DEFAULT_SETTINGS = {
+    # Bodies smaller than this (in bytes) are sent uncompressed
+    "MIN_SIZE": 512,
+    # Profile used for regular responses
+    "PROFILE": "balanced",
+    # Profile used for streaming responses, where latency matters more
+    "STREAMING_PROFILE": "fast",
+    # Server preference used to break ties between equal q-values
+    "ENCODINGS": ["zstd", "br", "gzip"],
+    "PROFILES": DEFAULT_PROFILES,
+    # Number of compressed bodies kept in the pre-compressed cache.
+    # Set it to 0 to disable the cache.
+    "CACHE_ENTRIES": 256,
+    # Bodies larger than this are never put in the pre-compressed cache
+    "CACHE_MAX_BODY_SIZE": 1024 * 1024,
+}
+
+
+def get_compression_settings():
+    """
+    Return the RESPONSE_COMPRESSION setting merged over the defaults.
+    """
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "RESPONSE_COMPRESSION", {}))
+    # A profile may set the level of some codecs only, the others keep the
+    # level of the default profile of that name (or of "balanced")
+    config["PROFILES"] = {
+        name: {
+            **DEFAULT_PROFILES.get(name, DEFAULT_PROFILES["balanced"]),
+            **levels,
+        }
+        for name, levels in {
+            **DEFAULT_PROFILES, **config["PROFILES"]
+        }.items()
+    }
+    return config
+
+
+# |================================ Codecs ================================| #
+class GzipCodec:
+    name = "gzip"
+
+    def compress(self, data, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            # Sync flush so the client receives every chunk straight away
+            # instead of waiting for the compressor's internal buffer to fill
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliCodec:
+    name = "br"
+
+    def compress(self, data, level):
+        return brotli.compress(data, quality=level)
+
+    def stream(self, chunks, level):
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def compress(self, data, level):
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    def stream(self, chunks, level):
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            data += compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def get_available_codecs():
+    """
+    Return the codecs usable in this process keyed by their encoding token.
+    """
+    codecs = {"gzip": GzipCodec()}
+    if brotli is not None:
+        codecs["br"] = BrotliCodec()
+    if zstandard is not None:
+        codecs["zstd"] = ZstdCodec()
+    return codecs
+
+
+CODECS = get_available_codecs()
+
+
+# |============================= Negotiation ==============================| #
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into a dict of {encoding: q-value}.
+    """
+    accepted = {}
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        encoding = parts[0].strip().lower()
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[encoding] = quality
+    return accepted
+
+
+def negotiate_encoding(header, preference=None):
+    """
+    Pick the best available codec for the given Accept-Encoding header.
+    Returns None when the response should be sent uncompressed.
+    """
+    if not header:
+        return None
+    if preference is None:
+        preference = get_compression_settings()["ENCODINGS"]
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+
+    best, best_quality = None, 0.0
+    for encoding in preference:
+        if encoding not in CODECS:
+            continue
+        quality = accepted.get(encoding, wildcard)
+        # The preference list is ordered, so only a strictly higher q-value
+        # can win over an encoding we already picked
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+# |========================= Pre-compressed cache =========================| #
+class CompressedBodyCache:
+    """
+    A thread safe LRU cache of compressed bodies keyed by the digest of the
+    uncompressed body, the encoding and the level.
+    Hot responses (for example a cached first page of tasks) are rendered to
+    the same bytes over and over again, so they are compressed only once.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(body, encoding, level):
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        return (digest, encoding, level)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def compress_body(body, encoding, level, cache=None):
+    """
+    Compress a whole body, going through the pre-compressed cache if given.
+    """
+    codec = CODECS[encoding]
+    if cache is None:
+        return codec.compress(body, level)
+    key = cache.make_key(body, encoding, level)
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = codec.compress(body, level)
+        cache.set(key, compressed)
+    return compressed
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compress an iterable of byte chunks without buffering it.
+    """
+    return CODECS[encoding].stream(chunks, level)
@@ -0,0 +1,26 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class Conflict(APIException):
+    """
+    The request conflicts with the current state of the record, e.g. the
+    record was changed by another request since the client read it.
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = {
+        "message": "The record was changed by another request"
+    }
+    default_code = 'conflict'
+
+
+class Gone(APIException):
+    """
+    The record exists but what it points to doesn't anymore, e.g. the file
+    of an export was deleted.
+    """
+    status_code = status.HTTP_410_GONE
+    default_detail = {
+        "message": "The resource is no longer available"
+    }
+    default_code = 'gone'
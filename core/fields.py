@@ -0,0 +1,124 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import translation
+from django.utils.encoding import smart_str
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import ReadOnlyField
+from rest_framework.relations import (
+    MANY_RELATION_KWARGS, ManyRelatedField, SlugRelatedField
+)
+
+
+# {(model, field_name): {language: {value: label}}}
+_choice_label_cache = {}
+
+
+def get_choice_labels(model, field_name):
+    """
+    Return a {value: label} dict for a model field with choices, with the
+    labels resolved once for the active language and cached afterwards.
+    """
+    language = translation.get_language()
+    per_language = _choice_label_cache.get((model, field_name))
+    if per_language is None:
+        per_language = _choice_label_cache.setdefault((model, field_name), {})
+    labels = per_language.get(language)
+    if labels is None:
+        choices = model._meta.get_field(field_name).flatchoices
+        # str() forces the lazy translation proxies for this language
+        labels = {value: str(label) for value, label in choices}
+        per_language[language] = labels
+    return labels
+
+
+def get_choice_label(model, field_name, value):
+    """
+    The cached equivalent of `instance.get_<field_name>_display()`.
+    Values that are not part of the choices are returned as they are.
+    """
+    return get_choice_labels(model, field_name).get(value, value)
+
+
+class ChoiceLabelField(ReadOnlyField):
+    """
+    A read only field that returns the label of a model field with choices
+    instead of the stored value.
+    The label mapping is built once per language instead of looking up the
+    choices enum and resolving the lazy translation for every row.
+
+    The model field is the source of the serializer field, so the field can
+    be used for any field with choices:
+        completion_status = ChoiceLabelField()
+        status_label = ChoiceLabelField(source="completion_status")
+    """
+
+    def bind(self, field_name, parent):
+        super().bind(field_name, parent)
+        self.model = parent.Meta.model
+        self.model_field_name = self.source
+        self._labels = None
+
+    def to_representation(self, value):
+        # Serializer fields are bound per serializer instance, which lives
+        # for a single request, so the active language can't change between
+        # the rows of a list
+        labels = self._labels
+        if labels is None:
+            labels = self._labels = get_choice_labels(
+                self.model, self.model_field_name
+            )
+        return labels.get(value, value)
+
+
+class SlugManyRelatedField(ManyRelatedField):
+    """
+    The many=True field of a SlugRelatedField, which loads the objects of
+    all the slugs with a single query instead of one query per slug.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        slug_field = child.queryset.model._meta.get_field(child.slug_field)
+        slugs = []
+        for item in data:
+            try:
+                slugs.append(slug_field.to_python(item))
+            except DjangoValidationError as error:
+                raise ValidationError(error.messages)
+            except (TypeError, ValueError):
+                child.fail('invalid')
+        objects_by_slug = {
+            getattr(obj, child.slug_field): obj
+            for obj in child.get_queryset().filter(
+                **{f'{child.slug_field}__in': slugs}
+            )
+        }
+        objects = []
+        for item, slug in zip(data, slugs):
+            if slug not in objects_by_slug:
+                child.fail(
+                    'does_not_exist',
+                    slug_name=child.slug_field,
+                    value=smart_str(item)
+                )
+            objects.append(objects_by_slug[slug])
+        return objects
+
+
+class BulkSlugRelatedField(SlugRelatedField):
+    """
+    A SlugRelatedField whose many=True version looks up its slugs in one
+    query (see SlugManyRelatedField).
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return SlugManyRelatedField(**list_kwargs)
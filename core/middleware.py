@@ -0,0 +1,106 @@
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+
+from core.compression import (
+    CompressedBodyCache,
+    compress_body,
+    compress_stream,
+    get_compression_settings,
+    negotiate_encoding,
+)
+
+re_accepts_any_encoding = _lazy_re_compile(r'\S')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress the response content with the best encoding accepted by the
+    client (zstd, br or gzip).
+
+    This works like django's GZipMiddleware but adds encoding negotiation,
+    compression level profiles, a minimum size threshold and a cache of
+    pre-compressed bodies. Streaming responses are compressed chunk by chunk
+    and are never buffered.
+
+    A view can choose a profile for its response by setting
+    ``response.compression_profile`` or opt out with
+    ``response.compression_profile = None``.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.config = get_compression_settings()
+        self.cache = None
+        if self.config["CACHE_ENTRIES"]:
+            self.cache = CompressedBodyCache(self.config["CACHE_ENTRIES"])
+
+    def get_level(self, response, encoding):
+        default_profile = (
+            self.config["STREAMING_PROFILE"] if response.streaming
+            else self.config["PROFILE"]
+        )
+        profile = getattr(response, "compression_profile", default_profile)
+        if profile is None:
+            return None
+        return self.config["PROFILES"][profile][encoding]
+
+    def process_response(self, request, response):
+        # Don't compress responses that are already encoded
+        if response.has_header('Content-Encoding'):
+            return response
+        # The response depends on Accept-Encoding from here on
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if not re_accepts_any_encoding.search(accept_encoding):
+            return response
+        # Range requests are served on the identity representation
+        if response.has_header('Content-Range'):
+            return response
+
+        encoding = negotiate_encoding(
+            accept_encoding, self.config["ENCODINGS"]
+        )
+        if encoding is None:
+            return response
+        level = self.get_level(response, encoding)
+        if level is None:
+            return response
+
+        if response.streaming:
+            if getattr(response, 'is_async', False):
+                # Async iterators are left untouched, as they can't be
+                # wrapped by the synchronous codecs
+                return response
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding, level
+            )
+            # Delete the `Content-Length` header for streaming content,
+            # because we won't know the compressed size until we stream it
+            del response['Content-Length']
+        else:
+            # Don't spend CPU on short responses
+            if len(response.content) < self.config["MIN_SIZE"]:
+                return response
+            cache = self.cache
+            if len(response.content) > self.config["CACHE_MAX_BODY_SIZE"]:
+                cache = None
+            compressed_content = compress_body(
+                response.content, encoding, level, cache=cache
+            )
+            # Return the uncompressed content if compression didn't help
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response['Content-Length'] = str(len(response.content))
+
+        # If there is a strong ETag, make it weak to fulfill the requirements
+        # of RFC 9110 Section 8.8.1 while also allowing conditional request
+        # matches on ETags.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
@@ -0,0 +1,119 @@
+"""
+Declarative ordering of querysets from client input.
+
+Clients only choose among the keys declared on an OrderingSpec; each key is
+mapped to a model expression. An `id` tiebreaker is always added so that
+pages are stable, in the direction of the last key so that a composite
+(<key>, id) index can serve the whole ORDER BY.
+
+Orderings which aren't served by a declared index are only allowed on result
+sets small enough to be sorted cheaply, otherwise they are rejected with an
+explanation.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+class OrderingSpec:
+    """
+    fields: {key sent by the client: model field or lookup}
+    indexed: the orderings (tuples of keys) served by an index
+    default: ordering used when the client doesn't send one
+    max_keys: maximum number of keys in an ordering
+    unindexed_sort_limit: maximum number of rows sorted without an index
+    """
+
+    def __init__(
+        self, fields, indexed=(), default=('id',), tiebreaker='id',
+        max_keys=2, unindexed_sort_limit=10000
+    ):
+        self.fields = fields
+        self.indexed = {tuple(keys) for keys in indexed}
+        self.default = list(default)
+        self.tiebreaker = tiebreaker
+        self.max_keys = max_keys
+        self.unindexed_sort_limit = unindexed_sort_limit
+
+    def parse(self, value):
+        """
+        Parse a comma separated string (or a list of them) into a list of
+        (key, descending) tuples, validating the keys.
+        """
+        if isinstance(value, str):
+            value = [value]
+        items = [
+            item.strip()
+            for part in (value or [])
+            for item in part.split(',')
+            if item.strip()
+        ]
+        if not items:
+            items = self.default
+
+        ordering = []
+        for item in items:
+            descending = item.startswith('-')
+            key = item.lstrip('-')
+            if key not in self.fields:
+                raise ValidationError(
+                    detail={
+                        "message": (
+                            f"Ordering by '{key}' is not allowed. Allowed "
+                            f"keys are {', '.join(self.fields)}"
+                        )
+                    }
+                )
+            if key not in (seen_key for seen_key, _ in ordering):
+                ordering.append((key, descending))
+
+        if len(ordering) > self.max_keys:
+            raise ValidationError(
+                detail={
+                    "message": (
+                        f"At most {self.max_keys} ordering keys are allowed"
+                    )
+                }
+            )
+        return ordering
+
+    def is_indexed(self, ordering):
+        keys = tuple(key for key, _ in ordering)
+        # A trailing tiebreaker is part of every declared index
+        if keys and keys[-1] == self.tiebreaker:
+            keys = keys[:-1]
+        return not keys or keys in self.indexed
+
+    def get_order_by(self, ordering):
+        order_by = [
+            ('-' if descending else '') + self.fields[key]
+            for key, descending in ordering
+        ]
+        tiebreaker_field = self.fields.get(self.tiebreaker, self.tiebreaker)
+        if self.tiebreaker not in (key for key, _ in ordering):
+            descending = ordering[-1][1] if ordering else False
+            order_by.append(('-' if descending else '') + tiebreaker_field)
+        return order_by
+
+    def apply(self, queryset, value):
+        """
+        Return the queryset ordered by the client's ordering, raising a
+        ValidationError when it isn't allowed or too expensive.
+        """
+        ordering = self.parse(value)
+        if not self.is_indexed(ordering):
+            row_count = queryset.count()
+            if row_count > self.unindexed_sort_limit:
+                keys = ','.join(key for key, _ in ordering)
+                raise ValidationError(
+                    detail={
+                        "message": (
+                            f"Ordering by '{keys}' is not served by an index "
+                            f"and would sort {row_count} records, the limit "
+                            f"is {self.unindexed_sort_limit}. Narrow the "
+                            f"results with filters or order by one of: "
+                            + ', '.join(
+                                ','.join(keys) for keys in sorted(self.indexed)
+                            )
+                        )
+                    }
+                )
+        return queryset.order_by(*self.get_order_by(ordering))
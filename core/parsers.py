@@ -0,0 +1,73 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import (
+    BaseParser, FormParser, JSONParser, MultiPartParser
+)
+
+from core.renderers import (
+    CBORRenderer,
+    MessagePackRenderer,
+    XMessagePackRenderer,
+    cbor2,
+    msgpack,
+    msgpack_ext_hook,
+)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack request bodies for single and bulk (list) payloads.
+    UUID and timestamp extension types are decoded back to uuid.UUID and
+    datetime instances.
+    """
+    media_type = MessagePackRenderer.media_type
+    renderer_class = MessagePackRenderer
+
+    @classmethod
+    def is_available(cls):
+        return msgpack is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(
+                stream.read(),
+                ext_hook=msgpack_ext_hook,
+                timestamp=3,
+                raw=False,
+                strict_map_key=False,
+            )
+        except (ValueError, msgpack.ExtraData) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class XMessagePackParser(MessagePackParser):
+    media_type = XMessagePackRenderer.media_type
+
+
+class CBORParser(BaseParser):
+    """
+    Parses CBOR request bodies for single and bulk (list) payloads.
+    """
+    media_type = CBORRenderer.media_type
+    renderer_class = CBORRenderer
+
+    @classmethod
+    def is_available(cls):
+        return cbor2 is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (ValueError, cbor2.CBORDecodeError) as exc:
+            raise ParseError(f'CBOR parse error - {exc}')
+
+
+def get_api_parser_classes():
+    """
+    Return the parsers used by the API viewsets.
+    The binary parsers are only added when their library is installed.
+    """
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+    for parser_class in (MessagePackParser, XMessagePackParser, CBORParser):
+        if parser_class.is_available():
+            parser_classes.append(parser_class)
+    return parser_classes
@@ -0,0 +1,271 @@
+"""
+Query budgets of the API endpoints and detection of the N+1 queries.
+
+QueryBudgetMiddleware records the queries run by every request, through
+`connection.execute_wrapper()` on each database connection, with their
+fingerprint (the SQL with its literals and IN lists collapsed) and the
+line of the project which ran them (the call site). Once the response is
+built it checks:
+    - the query budget of the endpoint, declared on the view as
+      `query_budget = <number of queries>` or
+      `query_budget = {<action or method>: <number of queries>}`, or
+      returned by its `get_query_budget()` when it depends on the settings;
+      the other views, like the function views, get the DEFAULT_BUDGET
+    - the N+1 queries: the same fingerprint run N_PLUS_ONE_THRESHOLD times
+      or more from the same call site on the same database, typically a
+      related record read in a loop (`task.created_by.email`); the same
+      query run on every shard (see todos/sharding.py) is not one
+
+The offenders are reported grouped by call site, and raised as
+QueryBudgetExceeded when RAISE is set (tests and CI), logged as warnings
+otherwise. The report of a request is also set on its response as
+`response.query_report`.
+
+Walking the stack of every query has a cost, the checks are meant for
+development and CI. Run `manage.py report_queries` to check the list
+endpoints against a seeded database.
+
+Only the queries of the request thread are recorded: the concurrent GET
+requests of a batch run in threads of their own (see core/batch.py).
+
+Settings (QUERY_BUDGETS):
+    ENABLED: record the queries of the requests
+    RAISE: raise QueryBudgetExceeded instead of logging the offenders
+    N_PLUS_ONE_THRESHOLD: repetitions of a query from a call site flagged
+        as N+1, a view can set `n_plus_one_threshold` (None disables it)
+    DEFAULT_BUDGET: budget of the views which don't declare one, None
+        leaves them unchecked
+"""
+import functools
+import logging
+import os
+import re
+import sys
+import sysconfig
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "ENABLED": False,
+    "RAISE": False,
+    "N_PLUS_ONE_THRESHOLD": 3,
+    "DEFAULT_BUDGET": None,
+}
+
+# Frames of these directories are skipped when looking for the call site of
+# a query: the standard library, the ORM, DRF and the other installed
+# packages, and this module
+LIBRARY_PATHS = tuple(
+    os.path.join(path, "")
+    for path in {
+        sysconfig.get_paths()[name]
+        for name in ("stdlib", "platstdlib", "purelib", "platlib")
+    }
+) + (os.path.abspath(__file__),)
+
+re_in_list = re.compile(r"\bIN \((?:%s, )*%s\)")
+re_string = re.compile(r"'(?:[^']|'')*'")
+re_number = re.compile(r"\b\d+(?:\.\d+)?\b")
+re_spaces = re.compile(r"\s+")
+
+
+def get_query_budget_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "QUERY_BUDGETS", {}))
+    return config
+
+
+@functools.lru_cache(maxsize=4096)
+def get_fingerprint(sql):
+    """
+    Return the shape of a query: the same query run with other values gives
+    the same fingerprint.
+    """
+    sql = re_in_list.sub("IN (...)", sql)
+    sql = re_string.sub("?", sql)
+    sql = re_number.sub("?", sql)
+    return re_spaces.sub(" ", sql).strip()
+
+
+def get_call_site():
+    """
+    Return "<file>:<line> in <function>" of the innermost frame of the
+    project running the query.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        # "<frozen ...>" and "<string>" frames have no file
+        if not filename.startswith(LIBRARY_PATHS + ("<",)):
+            filename = os.path.relpath(filename, settings.BASE_DIR)
+            return f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when RAISE is set and a request exceeds its query budget or runs
+    N+1 queries.
+    """
+
+    def __init__(self, report):
+        super().__init__(report.format())
+        self.report = report
+
+
+# |=============================== Recording ==============================| #
+class QueryTracker:
+    """
+    Records the queries run on every database connection of the thread
+    while it is active:
+
+        with QueryTracker() as tracker:
+            ...
+        tracker.queries  # [(fingerprint, call site, alias, seconds), ...]
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._exit_stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        call_site = get_call_site()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((
+                get_fingerprint(sql), call_site, context["connection"].alias,
+                time.perf_counter() - start
+            ))
+
+    def __enter__(self):
+        self._exit_stack = ExitStack()
+        for connection in connections.all():
+            self._exit_stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._exit_stack.close()
+        self._exit_stack = None
+
+    def get_report(self, name, budget=None, n_plus_one_threshold=None):
+        return QueryReport(name, self.queries, budget, n_plus_one_threshold)
+
+
+class QueryReport:
+    """
+    The queries of a request checked against its budget, with the N+1
+    queries grouped by call site.
+    """
+
+    def __init__(self, name, queries, budget=None, n_plus_one_threshold=None):
+        self.name = name
+        self.query_count = len(queries)
+        self.duration = sum(duration for *_, duration in queries)
+        self.budget = budget
+
+        groups = defaultdict(lambda: [0, 0.0])
+        for fingerprint, call_site, alias, duration in queries:
+            group = groups[call_site, alias, fingerprint]
+            group[0] += 1
+            group[1] += duration
+        # {call site: [(fingerprint, database, count, seconds), ...]}
+        self.n_plus_one = defaultdict(list)
+        if n_plus_one_threshold is not None:
+            for (call_site, alias, fingerprint), (count, duration) in sorted(
+                groups.items(), key=lambda item: -item[1][0]
+            ):
+                if count >= n_plus_one_threshold:
+                    self.n_plus_one[call_site].append(
+                        (fingerprint, alias, count, duration)
+                    )
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.query_count > self.budget
+
+    @property
+    def ok(self):
+        return not self.over_budget and not self.n_plus_one
+
+    def format(self):
+        lines = [
+            f"{self.name}: {self.query_count} queries "
+            f"({self.duration * 1000:.1f} ms), "
+            + ("no budget" if self.budget is None else f"budget {self.budget}")
+        ]
+        for call_site, offenders in self.n_plus_one.items():
+            lines.append(f"  N+1 at {call_site}")
+            for fingerprint, alias, count, duration in offenders:
+                lines.append(
+                    f"    {count}x on {alias} ({duration * 1000:.1f} ms) "
+                    f"{fingerprint}"
+                )
+        return "\n".join(lines)
+
+
+# |================================ Budgets ===============================| #
+def get_view_budget(view, request, config):
+    """
+    Return the query budget of the DRF view handling the request.
+    """
+    if hasattr(view, "get_query_budget"):
+        budget = view.get_query_budget()
+    else:
+        budget = getattr(view, "query_budget", config["DEFAULT_BUDGET"])
+    if isinstance(budget, dict):
+        action = getattr(view, "action", None) or request.method.lower()
+        budget = budget.get(action, config["DEFAULT_BUDGET"])
+    return budget
+
+
+def get_request_name(request, view):
+    name = f"{request.method} {request.path}"
+    if view is not None:
+        action = getattr(view, "action", None) or request.method.lower()
+        name += f" ({view.__class__.__name__}.{action})"
+    return name
+
+
+class QueryBudgetMiddleware:
+    """
+    Check the queries of the requests against the budgets of their views,
+    and look for N+1 queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_query_budget_settings()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+        with QueryTracker() as tracker:
+            response = self.get_response(request)
+
+        # The DRF views are found in the context of their response
+        view = getattr(response, "renderer_context", {}).get("view")
+        report = tracker.get_report(
+            get_request_name(request, view),
+            budget=(
+                get_view_budget(view, request, config) if view is not None
+                else config["DEFAULT_BUDGET"]
+            ),
+            n_plus_one_threshold=getattr(
+                view, "n_plus_one_threshold", config["N_PLUS_ONE_THRESHOLD"]
+            ),
+        )
+        response.query_report = report
+        if not report.ok:
+            if config["RAISE"]:
+                raise QueryBudgetExceeded(report)
+            logger.warning("Query budget exceeded\n%s", report.format())
+        return response
@@ -0,0 +1,104 @@
+"""
+Serving files with HTTP Range support (RFC 9110, section 14).
+
+Only single byte ranges are served as 206 responses. A request with several
+ranges gets the whole file, which the RFC allows. The ranges are only
+honoured when If-Range (if sent) matches the ETag, so that a client
+resuming a download never mixes two versions of a file.
+"""
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.http import quote_etag
+
+re_byte_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Size of the reads of the served part of the file
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range_header(header, size):
+    """
+    Return the (first, last) byte positions requested by a Range header,
+    None when the whole file should be served or "unsatisfiable".
+    """
+    match = re_byte_range.match(header.replace(' ', ''))
+    if match is None:
+        # Malformed, not in bytes or several ranges
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The last N bytes
+        suffix_length = int(last)
+        if suffix_length == 0:
+            return "unsatisfiable"
+        return max(size - suffix_length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        return "unsatisfiable"
+    return first, last
+
+
+def iter_file_range(file, first, last):
+    file.seek(first)
+    remaining = last - first + 1
+    try:
+        while remaining > 0:
+            data = file.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def ranged_file_response(
+    request, path, content_type, filename=None, etag=None
+):
+    """
+    Return a FileResponse of the file, or of the requested range of it.
+    Raises FileNotFoundError when the file is missing.
+    """
+    file = open(path, 'rb')
+    size = os.fstat(file.fileno()).st_size
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (
+        not if_range or (etag and if_range == quote_etag(etag))
+    ):
+        byte_range = parse_range_header(range_header, size)
+
+    if byte_range == "unsatisfiable":
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(
+            file, content_type=content_type, as_attachment=bool(filename),
+            filename=filename or '',
+        )
+    else:
+        first, last = byte_range
+        response = FileResponse(
+            iter_file_range(file, first, last), status=206,
+            content_type=content_type, as_attachment=bool(filename),
+            filename=filename or '',
+        )
+        # Only set by FileResponse for a file, Content-Length is replaced
+        response.set_headers(file)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Length'] = str(last - first + 1)
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = quote_etag(etag)
+    # The files served here are already compressed
+    response.compression_profile = None
+    return response
@@ -1,9 +1,36 @@
-from rest_framework.renderers import JSONRenderer
+import abc
+import datetime
+import decimal
+import json
+import uuid
 
+from django.db.models.query import QuerySet
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 
-class CustomRenderer(JSONRenderer):
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
 
-    def render(self, data, accepted_media_type=None, renderer_context=None):
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - optional dependency
+    cbor2 = None
+
+
+# MessagePack extension type code used for UUIDs. Datetimes use the
+# standard msgpack timestamp extension (-1).
+MSGPACK_UUID_EXT_TYPE = 1
+
+
+class EnvelopeMixin:
+    """
+    Wraps the response data in the envelope shared by all the API renderers:
+    {"message": ..., "status": ..., "code": ..., "data": ..., "page_info": ...}
+    """
+
+    def get_envelope(self, data, renderer_context):
         status_code = renderer_context.get(
             "response_data",
             renderer_context['response'].status_code
@@ -18,7 +45,8 @@ class CustomRenderer(JSONRenderer):
           "code": status_code,
           "data": data,
         }
-        if "page_info" in data:
+        # Responses without a body (e.g. 204 of destroy) have data=None
+        if isinstance(data, dict) and "page_info" in data:
             page_info = data.pop("page_info")
             response_dict["page_info"] = page_info
 
@@ -30,6 +58,201 @@ class CustomRenderer(JSONRenderer):
             except KeyError:
                 response_dict["data"] = data
 
-        return super(
+        return response_dict
+
+
+class JSONFragments(list):
+    """
+    A list whose items are encoded already, as JSON bytes (see
+    CustomRenderer.encode_fragment). CustomRenderer splices them into the
+    response as they are instead of encoding the items again.
+    """
+
+    def decode(self):
+        return [json.loads(fragment) for fragment in self]
+
+
+def replace_fragments(data, replace):
+    """
+    Return the data with the JSONFragments found in its dicts replaced by
+    replace(fragments). The lists are not searched.
+    """
+    if isinstance(data, JSONFragments):
+        return replace(data)
+    if isinstance(data, dict):
+        return {
+            key: replace_fragments(value, replace)
+            for key, value in data.items()
+        }
+    return data
+
+
+def decode_fragments(data):
+    """
+    Return the data with its JSONFragments decoded, for the consumers of the
+    data other than CustomRenderer (e.g. the batches).
+    """
+    return replace_fragments(data, JSONFragments.decode)
+
+
+class CustomRenderer(EnvelopeMixin, JSONRenderer):
+
+    def encode_fragment(self, data):
+        """
+        Encode data like it is encoded in the responses, for JSONFragments.
+        """
+        return super(CustomRenderer, self).render(data)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response_dict = self.get_envelope(data, renderer_context)
+        fragments = {}
+
+        def to_placeholder(items):
+            placeholder = f"@fragments:{uuid.uuid4().hex}@"
+            fragments[placeholder] = items
+            return placeholder
+
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            # Spliced fragments would not be indented
+            response_dict = decode_fragments(response_dict)
+        else:
+            response_dict = replace_fragments(response_dict, to_placeholder)
+        content = super(
             CustomRenderer, self
         ).render(response_dict, accepted_media_type, renderer_context)
+        for placeholder, items in fragments.items():
+            content = content.replace(
+                f'"{placeholder}"'.encode(), b"[" + b",".join(items) + b"]", 1
+            )
+        return content
+
+
+def to_builtin(value):
+    """
+    Convert the values that the binary encoders can't handle natively into
+    builtin types, the same way rest_framework's JSONEncoder does.
+    UUIDs and datetimes are not handled here as each format has a native
+    representation for them.
+    """
+    if isinstance(value, Promise):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(value.total_seconds())
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, QuerySet):
+        return list(value)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, '__getitem__'):
+        try:
+            return dict(value)
+        except (TypeError, ValueError):
+            pass
+    if hasattr(value, '__iter__'):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not encodable")
+
+
+def msgpack_default(value):
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(MSGPACK_UUID_EXT_TYPE, value.bytes)
+    return to_builtin(value)
+
+
+def msgpack_ext_hook(code, data):
+    if code == MSGPACK_UUID_EXT_TYPE:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def cbor_default(encoder, value):
+    encoder.encode(to_builtin(value))
+
+
+class BinaryRenderer(EnvelopeMixin, BaseRenderer, abc.ABC):
+    """
+    Base class of the binary renderers.
+    Binary renderers set `native_types` so that serializers can return UUIDs
+    and datetimes as they are instead of converting them to strings.
+    """
+    charset = None
+    render_style = 'binary'
+    native_types = True
+
+    @classmethod
+    @abc.abstractmethod
+    def is_available(cls):
+        """
+        Return True when the package of the format is installed.
+        """
+
+    @abc.abstractmethod
+    def encode(self, data):
+        """
+        Return the bytes of the response envelope.
+        """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response_dict = self.get_envelope(data, renderer_context)
+        return self.encode(response_dict)
+
+
+class MessagePackRenderer(BinaryRenderer):
+    """
+    Renders the response envelope as MessagePack.
+    UUIDs use the extension type 1 (16 raw bytes) and timezone aware datetimes
+    use the standard timestamp extension type.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    @classmethod
+    def is_available(cls):
+        return msgpack is not None
+
+    def encode(self, data):
+        return msgpack.packb(data, default=msgpack_default, datetime=True)
+
+
+class XMessagePackRenderer(MessagePackRenderer):
+    """
+    Same as MessagePackRenderer for clients still sending the legacy
+    application/x-msgpack media type.
+    """
+    media_type = 'application/x-msgpack'
+    format = 'x-msgpack'
+
+
+class CBORRenderer(BinaryRenderer):
+    """
+    Renders the response envelope as CBOR.
+    UUIDs use the semantic tag 37 and datetimes the standard tag 0.
+    """
+    media_type = 'application/cbor'
+    format = 'cbor'
+
+    @classmethod
+    def is_available(cls):
+        return cbor2 is not None
+
+    def encode(self, data):
+        return cbor2.dumps(data, default=cbor_default)
+
+
+def get_api_renderer_classes():
+    """
+    Return the renderers used by the API viewsets.
+    The binary renderers are only added when their library is installed.
+    """
+    renderer_classes = [CustomRenderer]
+    for renderer_class in (
+        MessagePackRenderer, XMessagePackRenderer, CBORRenderer
+    ):
+        if renderer_class.is_available():
+            renderer_classes.append(renderer_class)
+    return renderer_classes
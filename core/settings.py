@@ -40,11 +40,18 @@ INSTALLED_APPS = [
     'django_extensions',
     'rest_framework',
     'django_filters',
+    'jobs',
     'todos'
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Query budgets and N+1 detection, see core/query_budget.py
+    'core.query_budget.QueryBudgetMiddleware',
+    # Releases the concurrency slots of the requests, see core/throttling.py
+    'core.throttling.AdmissionControlMiddleware',
+    # Should be placed before any middleware that reads or changes the body
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,6 +62,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'core.urls'
 
+# API versions whose urls are included in core/urls.py.
+# The modules of the versions which are not listed are never imported.
+API_VERSIONS = ['v1', 'v2', 'v3', 'v4']
+
+# Include the hello world demo APIs
+DEMO_APIS_ENABLED = True
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -84,6 +98,41 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # The JSON fragments of the task lists, see todos/fragments.py
+    'task_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'task-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Partitioning of the tasks across SQLite files by creator, see
+# todos/sharding.py for the defaults of each key
+
+TASK_SHARDS = {
+    # Number of shard databases, 0 keeps the tasks in the default database
+    'COUNT': 0,
+    'DIR': BASE_DIR / 'shards',
+    # Seconds after which a process reloads the shards of the moved users
+    'DIRECTORY_MAX_AGE': 30,
+}
+
+for shard in range(TASK_SHARDS['COUNT']):
+    DATABASES[f'shard_{shard}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TASK_SHARDS['DIR'] / f'shard_{shard}.sqlite3',
+    }
+
+if TASK_SHARDS['COUNT']:
+    DATABASE_ROUTERS = ['todos.sharding.TaskShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -126,8 +175,182 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Warm-up before forking the WSGI workers, see core/warmup.py
+WSGI_WARM_UP = False
+
+# Seconds after which a process reloads its copy of the tag vocabulary
+TAG_VOCABULARY_MAX_AGE = 60
+
+# In-process task index used by TaskFilter, see todos/task_index.py
+TASK_INDEX = {
+    'ENABLED': False,
+    'MAX_AGE': 300,
+    'MAX_IDS': 5000,
+    'SNAPSHOT_PATH': None,
+}
+
+# Physical deletion of the soft deleted tasks and tags, see todos/purge.py
+SOFT_DELETE_PURGE = {
+    # Seconds a deleted record is kept before being purged
+    'RETENTION': 3600,
+    # Maximum number of rows deleted per transaction
+    'CHUNK_SIZE': 500,
+    # Seconds to wait between two transactions to let other writers in
+    'PAUSE': 0.05,
+}
+
+# Bulk imports of tasks, see todos/imports.py
+
+TASK_IMPORTS = {
+    # Where the uploaded files are kept until they are imported
+    'SPOOL_DIR': BASE_DIR / 'spool' / 'task_imports',
+    # Rows validated and inserted per transaction
+    'CHUNK_SIZE': 1000,
+    # Maximum number of rejected rows whose errors are kept
+    'MAX_ERRORS': 1000,
+    'MAX_UPLOAD_SIZE': 1024 ** 3,
+}
+
+# Exports of the tasks, see todos/exports.py
+
+TASK_EXPORTS = {
+    # Where the export files are written and served from
+    'DIR': BASE_DIR / 'spool' / 'task_exports',
+    # Tasks read and written per chunk
+    'CHUNK_SIZE': 5000,
+    'COMPRESS_LEVEL': 6,
+}
+
+# Write-behind buffer of the completion status toggles of
+# /api/v4/tasks/<uuid>/toggle
+# See todos/toggles.py for the defaults of each key
+
+TASK_TOGGLES = {
+    # SYNC, GROUP_COMMIT or WRITE_BEHIND
+    'DURABILITY': 'GROUP_COMMIT',
+    # Seconds the toggles are buffered before being written together
+    'FLUSH_INTERVAL': 0.05,
+    'MAX_PENDING': 200,
+}
+
+# Limits of the nested queries of /api/v4/query/
+# See todos/graph.py for the defaults of each key
+
+GRAPH_QUERY = {
+    # Maximum nesting of the selected fields
+    'MAX_DEPTH': 5,
+    # Maximum estimated number of records loaded by a query
+    'MAX_COST': 5000,
+    'MAX_PAGE_SIZE': 100,
+}
+
+# Idempotency-Key header of the create endpoints
+# See todos/idempotency.py for the defaults of each key
+
+IDEMPOTENCY = {
+    # Seconds a key and its response are remembered
+    'TTL': 24 * 3600,
+    # Seconds after which a request holding a key is considered lost
+    'LOCK_TIMEOUT': 60.0,
+    # Seconds a request repeating a running one is told to wait (Retry-After)
+    'RETRY_AFTER': 1,
+}
+
+# Materialized task list served by the v4 task list
+# See todos/task_list.py for the defaults of each key
+
+TASK_LIST_TABLE = {
+    # Run `manage.py rebuild_task_list` before enabling it
+    'ENABLED': False,
+}
+
+# Cache of the JSON encoded tasks of the v4 task list
+# See todos/fragments.py for the defaults of each key
+
+TASK_FRAGMENTS = {
+    # The fragments are invalidated in the cache of the process writing the
+    # change, enable it with a cache shared by all the processes
+    'ENABLED': False,
+    'CACHE': 'task_fragments',
+    # Seconds a fragment is kept
+    'TIMEOUT': 24 * 3600,
+}
+
+# Query budgets of the endpoints and N+1 detection
+# See core/query_budget.py for the defaults of each key
+
+QUERY_BUDGETS = {
+    # Walks the stack of every query, for development and CI
+    'ENABLED': DEBUG,
+    # Set in the test and CI settings to fail on the offenders
+    'RAISE': False,
+    # Repetitions of a query from the same line flagged as N+1
+    'N_PLUS_ONE_THRESHOLD': 3,
+}
+
+# Batches of API calls sent to /api/batch/
+# See core/batch.py for the defaults of each key
+
+BATCH_REQUESTS = {
+    'MAX_REQUESTS': 30,
+    # GET requests run at the same time under ASGI
+    'CONCURRENCY': 8,
+}
+
+# Background jobs run by `manage.py run_jobs`
+# See jobs/queue.py for the defaults of each key
+
+JOBS = {
+    'WORKERS': 4,
+    'POOL': 'thread',
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 2.0,
+    'LOCK_TIMEOUT': 600.0,
+}
+
+# Response compression
+# See core/compression.py for the defaults of each key
+
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 512,
+    'PROFILE': 'balanced',
+    'STREAMING_PROFILE': 'fast',
+}
+
+# Admission control of the API requests
+# See core/throttling.py for the defaults of each key
+
+RATE_LIMITS = {
+    'ENABLED': True,
+    # The buckets are shared by the worker processes through this file
+    'BACKEND': 'sqlite',
+    'PATH': BASE_DIR / 'spool' / 'rate_limits.sqlite3',
+    # (requests per second, burst) of a user per endpoint
+    'RATES': {
+        'default': (20, 40),
+        'tasks.list': (5, 20),
+        'task_exports.create': (0.1, 3),
+        'task_imports.create': (0.1, 3),
+        'batch.post': (2, 10),
+    },
+    # Requests of a user running at the same time per endpoint
+    'CONCURRENCY': {
+        'tasks.list': 4,
+        'query.query': 2,
+        'task_exports.create': 1,
+        'task_exports.download': 2,
+        'task_imports.create': 1,
+        'batch.post': 2,
+    },
+    'LEASE_TIMEOUT': 60.0,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.TokenBucketThrottle',
+        'core.throttling.ConcurrencyThrottle',
+    ],
 }
@@ -0,0 +1,60 @@
+"""
+API only settings for the API workers.
+
+Use it with DJANGO_SETTINGS_MODULE=core.settings_api.
+It drops the apps, middlewares and urls that the JWT authenticated v4 API
+doesn't need (admin, sessions, messages, static files, django_extensions,
+the demo APIs and the older API versions) to make the worker boot faster
+and use less memory.
+Run `manage.py import_time_report` to compare it with core.settings.
+WSGI_WARM_UP is left off like in core.settings, so the report measures the
+trimming alone, `manage.py bench_warmup` measures the warm-up.
+"""
+from core.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'django_filters',
+    'jobs',
+    'todos'
+]
+
+# The middlewares of core.settings, without those of the sessions, the
+# messages and the browser pages
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE  # noqa: F405
+    if middleware not in {
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    }
+]
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+            ],
+        },
+    },
+]
+
+API_VERSIONS = ['v4']
+
+DEMO_APIS_ENABLED = False
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    # The browsable API is not served by the API workers
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
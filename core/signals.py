@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent by SoftDeleteMixin.soft_delete() before and after a record is marked
+# as deleted, with the same arguments as pre_delete and post_delete
+# (sender, instance) so that the delete handlers can be reused for them.
+pre_soft_delete = Signal()
+post_soft_delete = Signal()
@@ -0,0 +1,370 @@
+"""
+Admission control of the API: per-user token buckets and concurrency caps.
+
+Every request takes a token from the bucket of its user (or of its address
+when anonymous) for its endpoint. A bucket holds at most BURST tokens and
+is refilled with RATE tokens per second, a request finding it empty gets a
+429 response whose Retry-After header tells when the next token is there.
+The endpoint (the scope) of a request is `<view.throttle_scope>.<action>`,
+e.g. "tasks.list", or `<view class name>.<method>` for the views without a
+throttle_scope. The scopes missing from RATES use the "default" rate.
+
+The expensive endpoints, like the task lists and the exports, are also
+capped by the number of requests of a user they run at the same time
+(CONCURRENCY). A request over the cap gets a 429 as well, its slot (a lease)
+is released by AdmissionControlMiddleware once the response is returned, or
+expires after LEASE_TIMEOUT seconds if the process died meanwhile.
+
+The buckets and the leases are kept by a backend:
+    memory: in the process, every worker process has its own buckets, so a
+        user gets up to the rate times the number of workers
+    sqlite: in a SQLite file shared by the processes of the host, written
+        without fsync (journal_mode=WAL, synchronous=OFF), the buckets
+        survive restarts but losing them is harmless
+
+Run `manage.py bench_rate_limits` to measure the cost of the checks.
+
+Settings (RATE_LIMITS):
+    ENABLED: False lets every request in
+    BACKEND: memory or sqlite
+    PATH: the SQLite file of the sqlite backend
+    RATES: {scope: (tokens per second, burst)}, "default" for the others
+    CONCURRENCY: {scope: maximum requests of a user running at once}
+    LEASE_TIMEOUT: seconds after which a concurrency lease is dropped
+"""
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_SETTINGS = {
+    "ENABLED": True,
+    "BACKEND": "memory",
+    "PATH": None,
+    "RATES": {
+        "default": (20, 40),
+    },
+    "CONCURRENCY": {},
+    "LEASE_TIMEOUT": 60.0,
+}
+
+# Seconds after which an untouched bucket is full again in any realistic
+# configuration and can be forgotten
+BUCKET_MAX_AGE = 3600
+
+# One take out of PRUNE_EVERY forgets the old buckets
+PRUNE_EVERY = 1000
+
+
+def get_rate_limit_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "RATE_LIMITS", {}))
+    return config
+
+
+def refill(tokens, updated, now, rate, burst):
+    """
+    Return the tokens of a bucket at `now`, after taking one when there is,
+    and the seconds to wait for a token (0 when one was taken).
+    """
+    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+# |=============================== Backends ===============================| #
+class MemoryBackend:
+    """
+    Buckets and leases of the process.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.leases = {}
+        self.lock = threading.Lock()
+        self.take_count = 0
+
+    def take(self, key, rate, burst, now):
+        """
+        Take a token of the bucket `key`, returns the seconds to wait for
+        one when it is empty, 0 otherwise.
+        """
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens, wait = refill(tokens, updated, now, rate, burst)
+            self.buckets[key] = (tokens, now)
+            self.take_count += 1
+            if self.take_count % PRUNE_EVERY == 0:
+                self.prune(now)
+        return wait
+
+    def prune(self, now):
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if bucket[1] > now - BUCKET_MAX_AGE
+        }
+
+    def acquire(self, key, limit, timeout, now):
+        """
+        Return a lease of one of the `limit` slots of `key`, None when they
+        are all taken.
+        """
+        with self.lock:
+            leases = {
+                lease: expires
+                for lease, expires in self.leases.get(key, {}).items()
+                if expires > now
+            }
+            if len(leases) >= limit:
+                self.leases[key] = leases
+                return None
+            lease = uuid.uuid4().hex
+            leases[lease] = now + timeout
+            self.leases[key] = leases
+        return lease
+
+    def release(self, key, lease):
+        with self.lock:
+            leases = self.leases.get(key)
+            if leases is not None:
+                leases.pop(lease, None)
+                if not leases:
+                    del self.leases[key]
+
+
+class SQLiteBackend:
+    """
+    Buckets and leases in a SQLite file shared by the processes, with a
+    connection per thread.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None and self.local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Every statement is a transaction of its own
+        connection = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None,
+            check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_leases ("
+            "lease TEXT PRIMARY KEY, key TEXT NOT NULL, "
+            "expires REAL NOT NULL) WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS rate_limit_leases_key "
+            "ON rate_limit_leases (key, expires)"
+        )
+        self.local.connection = connection
+        self.local.pid = os.getpid()
+        return connection
+
+    def take(self, key, rate, burst, now):
+        # A single statement is atomic across the processes, no explicit
+        # transaction (and its round trips) is needed. The assignments of
+        # an UPDATE all read the row as it was before it.
+        refilled = "MIN(:burst, tokens + MAX(:now - updated, 0) * :rate)"
+        connection = self.get_connection()
+        tokens, allowed = connection.execute(
+            "INSERT INTO rate_limit_buckets (key, tokens, updated, allowed) "
+            "VALUES (:key, :burst - 1, :now, 1) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            f"tokens = {refilled} - ({refilled} >= 1), "
+            f"allowed = {refilled} >= 1, "
+            "updated = :now "
+            "RETURNING tokens, allowed",
+            {"key": key, "rate": rate, "burst": burst, "now": now}
+        ).fetchone()
+        if random.randrange(PRUNE_EVERY) == 0:
+            connection.execute(
+                "DELETE FROM rate_limit_buckets WHERE updated < ?",
+                (now - BUCKET_MAX_AGE,)
+            )
+        return 0 if allowed else (1 - tokens) / rate
+
+    def acquire(self, key, limit, timeout, now):
+        connection = self.get_connection()
+        connection.execute(
+            "DELETE FROM rate_limit_leases WHERE key = ? AND expires <= ?",
+            (key, now)
+        )
+        # Counted and inserted by one statement, atomically
+        lease = uuid.uuid4().hex
+        cursor = connection.execute(
+            "INSERT INTO rate_limit_leases (lease, key, expires) "
+            "SELECT ?, ?, ? WHERE ("
+            "SELECT COUNT(*) FROM rate_limit_leases WHERE key = ?"
+            ") < ?",
+            (lease, key, now + timeout, key, limit)
+        )
+        return lease if cursor.rowcount else None
+
+    def release(self, key, lease):
+        self.get_connection().execute(
+            "DELETE FROM rate_limit_leases WHERE lease = ?", (lease,)
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(config):
+    if config["BACKEND"] == "memory":
+        return MemoryBackend()
+    if config["BACKEND"] == "sqlite":
+        path = config["PATH"] or (
+            settings.BASE_DIR / "spool" / "rate_limits.sqlite3"
+        )
+        return SQLiteBackend(path)
+    raise ValueError(f"Unknown rate limit backend {config['BACKEND']}")
+
+
+def get_rate_limit_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(get_rate_limit_settings())
+    return _backend
+
+
+def reset_rate_limit_backend():
+    """
+    Forget the backend, the next check creates it from the settings again.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+# |=============================== Throttles ==============================| #
+def get_scope(request, view):
+    scope = getattr(view, "throttle_scope", None) or type(view).__name__
+    action = getattr(view, "action", None) or request.method.lower()
+    return f"{scope}.{action}"
+
+
+class AdmissionThrottle(BaseThrottle):
+    """
+    Base of the throttles, keyed by the user (or the address) and the scope
+    of the request.
+    """
+
+    def __init__(self):
+        self.config = get_rate_limit_settings()
+        self.wait_seconds = None
+
+    def get_key(self, request, view):
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            ident = f"user:{user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return f"{get_scope(request, view)}:{ident}"
+
+    def wait(self):
+        # Retry-After is a whole number of seconds, rounded up so that the
+        # token is there when the client comes back
+        if self.wait_seconds is None:
+            return None
+        return math.ceil(self.wait_seconds)
+
+
+class TokenBucketThrottle(AdmissionThrottle):
+    """
+    RATES: a request takes a token of the bucket of its user and scope.
+    """
+
+    def allow_request(self, request, view):
+        if not self.config["ENABLED"]:
+            return True
+        rates = self.config["RATES"]
+        rate = rates.get(get_scope(request, view)) or rates.get("default")
+        if rate is None:
+            return True
+        tokens_per_second, burst = rate
+        self.wait_seconds = get_rate_limit_backend().take(
+            self.get_key(request, view), tokens_per_second, burst,
+            time.time()
+        )
+        return not self.wait_seconds
+
+
+class ConcurrencyThrottle(AdmissionThrottle):
+    """
+    CONCURRENCY: a request holds one of the slots of its user and scope
+    until its response is returned, see AdmissionControlMiddleware.
+    """
+
+    def allow_request(self, request, view):
+        if not self.config["ENABLED"]:
+            return True
+        limit = self.config["CONCURRENCY"].get(get_scope(request, view))
+        if limit is None:
+            return True
+        key = self.get_key(request, view)
+        lease = get_rate_limit_backend().acquire(
+            key, limit, self.config["LEASE_TIMEOUT"], time.time()
+        )
+        if lease is None:
+            # Nothing tells when a slot is released, retried after a second
+            self.wait_seconds = 1
+            return False
+        # Kept on the django request, which outlives the DRF request
+        django_request = getattr(request, "_request", request)
+        if not hasattr(django_request, "admission_leases"):
+            django_request.admission_leases = []
+        django_request.admission_leases.append((key, lease))
+        return True
+
+
+def release_leases(request):
+    """
+    Release the concurrency slots held by the (django) request.
+    """
+    leases = getattr(request, "admission_leases", None)
+    if not leases:
+        return
+    backend = get_rate_limit_backend()
+    while leases:
+        backend.release(*leases.pop())
+
+
+class AdmissionControlMiddleware:
+    """
+    Release the concurrency slots taken by ConcurrencyThrottle once the
+    response is returned. The body of a streaming response is sent after
+    that, the slot only covers building the response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            release_leases(request)
@@ -1,81 +1,148 @@
 """
 core URL Configuration
+
+Only the parts enabled in the settings are imported:
+the admin site when django.contrib.admin is installed, the demo APIs when
+DEMO_APIS_ENABLED is set, the API versions listed in API_VERSIONS and the
+batch API when any version is.
 """
-from django.contrib import admin
+from django.apps import apps
+from django.conf import settings
 from django.urls import path, include
-from rest_framework_simplejwt import views as jwt_views
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
 
-from core import views
+API_VERSIONS = getattr(settings, 'API_VERSIONS', ['v1', 'v2', 'v3', 'v4'])
 
-urlpatterns = [
 
-    # Admin site url
-    path(
-        route='admin/',
-        view=admin.site.urls,
-        name="admin-site"
-    ),
+def lazy_view(view_class_path):
+    """
+    Return a view that imports the given class based view on its first
+    call instead of at url loading time.
+    Used for views whose modules are slow to import.
+    """
+    view = None
 
-    # ============================= Demo APIs ============================== #
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(view_class_path).as_view()
+        return view(request, *args, **kwargs)
 
-    # API 101
-    path(
-        route='hello-world',
-        view=views.hello_world,
-        name="hello-world"
-    ),
-    path(
-        route='hello/<slug:user>/<int:num>',
-        view=views.hello_user,
-        name="hello-user"
-    ),
+    return wrapper
 
-    # ========================== Version 1 APIs =========================== #
-    # REST API 101
-    # Version 1 APIs
-    # These APIs use function based views
-    path(
-        route='api/v1/',
-        view=include("todos.api.v1.urls")
-    ),
 
-    # ========================== Version 2 APIs =========================== #
+urlpatterns = []
 
-    # # Version 2 APIs
-    # # These APIs use serializers classes for for validation & serialization,
-    # # pagination clases for pagination and filterset clases for filtering.
-    path(
-        route='api/v2/',
-        view=include("todos.api.v2.urls")
-    ),
+# Admin site url
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
 
-    # ========================== Version 3 APIs =========================== #
+    urlpatterns += [
+        path(
+            route='admin/',
+            view=admin.site.urls,
+            name="admin-site"
+        ),
+    ]
 
-    # # Version 3 APIs
-    # # These APIs use GenericAPIView and GenericViewset
-    path(
-        route='api/v3/',
-        view=include("todos.api.v3.urls")
-    ),
+# ============================= Demo APIs ============================== #
 
-    # ========================== Version 4 APIs =========================== #
+if getattr(settings, 'DEMO_APIS_ENABLED', True):
+    from core import views
 
-    # # Version 4 APIs
-    # # These APIs use mixins
-    path(
-        route='api/v4/',
-        view=include("todos.api.v4.urls")
-    ),
+    urlpatterns += [
+        # API 101
+        path(
+            route='hello-world',
+            view=views.hello_world,
+            name="hello-world"
+        ),
+        path(
+            route='hello/<slug:user>/<int:num>',
+            view=views.hello_user,
+            name="hello-user"
+        ),
+    ]
+
+# ========================== Version 1 APIs =========================== #
+# REST API 101
+# Version 1 APIs
+# These APIs use function based views
+if 'v1' in API_VERSIONS:
+    urlpatterns += [
+        path(
+            route='api/v1/',
+            view=include("todos.api.v1.urls", namespace="v1")
+        ),
+    ]
+
+# ========================== Version 2 APIs =========================== #
+
+# # Version 2 APIs
+# # These APIs use serializers classes for for validation & serialization,
+# # pagination clases for pagination and filterset clases for filtering.
+if 'v2' in API_VERSIONS:
+    urlpatterns += [
+        path(
+            route='api/v2/',
+            view=include("todos.api.v2.urls", namespace="v2")
+        ),
+    ]
+
+# ========================== Version 3 APIs =========================== #
+
+# # Version 3 APIs
+# # These APIs use GenericAPIView and GenericViewset
+if 'v3' in API_VERSIONS:
+    urlpatterns += [
+        path(
+            route='api/v3/',
+            view=include("todos.api.v3.urls", namespace="v3")
+        ),
+    ]
+
+# ========================== Version 4 APIs =========================== #
+
+# # Version 4 APIs
+# # These APIs use mixins
+if 'v4' in API_VERSIONS:
+    urlpatterns += [
+        path(
+            route='api/v4/',
+            view=include("todos.api.v4.urls", namespace="v4")
+        ),
+    ]
+
+# ============================== Batch API ============================ #
+
+# Several API calls in one request, see core/batch.py
+if API_VERSIONS:
+    from core.batch import BatchView
+
+    urlpatterns += [
+        path(
+            route='api/batch/',
+            view=BatchView.as_view(),
+            name="batch"
+        ),
+    ]
+
+urlpatterns += [
 
     # # Auth APIs
+    # rest_framework_simplejwt.views is imported on the first token request
     path(
         route='api/token/',
-        view=jwt_views.TokenObtainPairView.as_view(),
+        view=lazy_view(
+            "rest_framework_simplejwt.views.TokenObtainPairView"
+        ),
         name='token_obtain_pair'
     ),
     path(
         route='api/token/refresh/',
-        view=jwt_views.TokenRefreshView.as_view(),
+        view=lazy_view("rest_framework_simplejwt.views.TokenRefreshView"),
         name='token_refresh'
     ),
 
@@ -0,0 +1,79 @@
+"""
+Warm-up of a process before the WSGI workers are forked.
+
+Django and rest_framework build a lot of state lazily on the first requests
+of a worker: the url resolvers, the serializer fields, the filterset forms,
+the renderers... When this is done once in the master process, the forked
+workers start with it already built, and gc.freeze() keeps the gc from
+touching (and so copying) these pages in every worker.
+
+This only helps when the application is loaded before forking, e.g.
+`gunicorn --preload core.wsgi` or uWSGI without `lazy-apps`.
+"""
+import gc
+import logging
+import time
+
+from django.apps import apps
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_url_resolver():
+    """
+    Populate the resolvers of the url patterns and of all the includes.
+    """
+    def populate(resolver):
+        resolver._populate()
+        for pattern in resolver.url_patterns:
+            if hasattr(pattern, 'url_patterns'):
+                populate(pattern)
+
+    populate(get_resolver())
+
+
+def warm_up_renderers():
+    from core.parsers import get_api_parser_classes
+    from core.renderers import get_api_renderer_classes
+
+    for renderer_class in get_api_renderer_classes():
+        renderer_class()
+    for parser_class in get_api_parser_classes():
+        parser_class()
+
+
+def warm_up(freeze=True):
+    """
+    Build the lazily created state of the project and of every installed
+    app defining a `warm_up()` method on its AppConfig, then freeze the
+    objects allocated so far.
+    An app failing to read the database (not migrated yet, down) is logged
+    and skipped, its workers build the rest of its state on their first
+    requests.
+    """
+    start = time.perf_counter()
+    warm_up_url_resolver()
+    warm_up_renderers()
+    for app_config in apps.get_app_configs():
+        if not hasattr(app_config, 'warm_up'):
+            continue
+        try:
+            app_config.warm_up()
+        except DatabaseError as error:
+            logger.warning(
+                "Warm-up of the %s app stopped: %s", app_config.label, error
+            )
+
+    # Database connections must not be shared with the forked workers
+    connections.close_all()
+
+    if freeze:
+        # Collect first so that garbage isn't frozen with the live objects
+        gc.collect()
+        gc.freeze()
+    logger.info(
+        "Warm-up done in %.1f ms, %d objects frozen",
+        (time.perf_counter() - start) * 1000, gc.get_freeze_count()
+    )
@@ -3,6 +3,10 @@ WSGI config for core project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+When the WSGI_WARM_UP setting is on, the lazily built state of the project is
+built here, before the server forks its workers (see core/warmup.py). A
+database that can't be read yet doesn't fail the boot.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 """
@@ -14,3 +18,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WSGI_WARM_UP:
+    from core.warmup import warm_up
+
+    warm_up()
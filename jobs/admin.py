@@ -0,0 +1,13 @@
+from django.contrib import admin
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'uuid', 'name', 'status', 'attempts', 'run_after', 'wait_time',
+        'run_time'
+    )
+    list_filter = ('status', 'name')
+    search_fields = ("name__startswith", "idempotency_key")
+    readonly_fields = ('locked_by', 'locked_at', 'result', 'last_error')
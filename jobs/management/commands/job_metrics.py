@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.queue import get_job_metrics
+
+
+def format_seconds(value):
+    return '-' if value is None else f"{value * 1000:.1f}ms"
+
+
+class Command(BaseCommand):
+    help = "Show the number of jobs and their wait and run times per job name"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=24,
+            help="Only count the jobs created in the last hours",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+        header = (
+            f"{'job':<40} {'status':<10} {'jobs':>6} {'retried':>8} "
+            f"{'mean wait':>10} {'max wait':>10} {'mean run':>10} "
+            f"{'max run':>10}"
+        )
+        self.stdout.write(header)
+        for row in get_job_metrics(since):
+            self.stdout.write(
+                f"{row['name']:<40} {row['status']:<10} "
+                f"{row['job_count']:>6} {row['retried_count']:>8} "
+                f"{format_seconds(row['mean_wait_time']):>10} "
+                f"{format_seconds(row['max_wait_time']):>10} "
+                f"{format_seconds(row['mean_run_time']):>10} "
+                f"{format_seconds(row['max_run_time']):>10}"
+            )
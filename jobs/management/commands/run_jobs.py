@@ -0,0 +1,59 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.registry import get_job_names
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued background jobs with a pool of threads or processes. "
+        "Stops after the running jobs on SIGINT/SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Number of jobs run at the same time (JOBS['WORKERS'])",
+        )
+        parser.add_argument(
+            '--pool', choices=['thread', 'process'], default=None,
+            help="Run the jobs in threads or processes (JOBS['POOL'])",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=None,
+            help="Seconds between two reads of an empty queue",
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help="Exit once the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            workers=options['workers'],
+            pool=options['pool'],
+            poll_interval=options['poll_interval'],
+        )
+        signal.signal(signal.SIGINT, worker.stop)
+        signal.signal(signal.SIGTERM, worker.stop)
+        self.stdout.write(
+            f"Worker {worker.worker_id} running {worker.workers} jobs at once "
+            f"in a {worker.pool} pool for: {', '.join(get_job_names())}"
+        )
+        worker.run(burst=options['burst'])
+
+        counts = ', '.join(
+            f"{count} {status.lower()}"
+            for status, count in sorted(worker.status_counts.items())
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker stopped, jobs: {counts or 'none'}"
+        ))
+        for name, metrics in worker.get_metrics().items():
+            self.stdout.write(
+                f"  {name}: {metrics['count']} runs, "
+                f"mean {metrics['mean'] * 1000:.1f} ms, "
+                f"max {metrics['max'] * 1000:.1f} ms"
+            )
@@ -0,0 +1,82 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+from core.behaviours import UUIDMixin
+
+
+class Job(UUIDMixin):
+    """
+    This model represents a unit of background work.
+    Jobs are added with jobs.queue.enqueue() and run by
+    `manage.py run_jobs`.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', "Queued"
+        RUNNING = 'RUNNING', "Running"
+        SUCCEEDED = 'SUCCEEDED', "Succeeded"
+        FAILED = 'FAILED', "Failed"
+
+    # The name the job function was registered with (see jobs/registry.py)
+    name = models.CharField(max_length=200)
+    # Keyword arguments of the job function
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.QUEUED
+    )
+    # Enqueueing a job with the key of an existing job returns that job
+    # instead of adding a new one
+    idempotency_key = models.CharField(
+        max_length=200,
+        null=True,
+        blank=True,
+        unique=True
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # The job isn't run before this datetime (delays and retry backoff)
+    run_after = models.DateTimeField(default=timezone.now)
+    # The worker running the job and since when
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    # The return value of the job function
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # The traceback of the last failed attempt
+    last_error = models.TextField(blank=True, default='')
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    # |------------------------------ Metrics ------------------------------| #
+    # Seconds between run_after and the start of the last attempt
+    wait_time = models.FloatField(null=True, blank=True)
+    # Seconds taken by the last attempt
+    run_time = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        db_table = "jobs"
+        verbose_name = "job"
+        verbose_name_plural = "jobs"
+        indexes = [
+            # The queue, read by the workers to claim the next jobs
+            models.Index(
+                fields=["run_after", "id"],
+                condition=models.Q(status="QUEUED"),
+                name="job_queued_idx",
+            ),
+            # The running jobs, read to find the jobs of dead workers
+            models.Index(
+                fields=["locked_at"],
+                condition=models.Q(status="RUNNING"),
+                name="job_running_idx",
+            ),
+        ]
+
+    def __repr__(self) -> str:
+        return f"{self.name} ({self.status})"
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.status})"
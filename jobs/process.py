@@ -0,0 +1,17 @@
+"""
+Entry points of the worker processes of the "process" pool.
+
+The processes are started with "spawn", they import this module before
+Django is set up, so it must not import any model at module level.
+"""
+import django
+
+
+def init_process():
+    django.setup()
+
+
+def run_job(job_id):
+    from jobs.queue import run_job
+
+    return run_job(job_id)
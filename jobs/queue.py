@@ -0,0 +1,266 @@
+"""
+A job queue stored in the `jobs` table of the default database.
+
+The web processes add jobs with enqueue() or enqueue_on_commit(), the
+workers of `manage.py run_jobs` claim and run them. No broker is needed:
+SQLite has no `SELECT ... FOR UPDATE SKIP LOCKED`, so a worker claims a job
+with a conditional UPDATE (`... WHERE id = <id> AND status = 'QUEUED'`)
+which only one worker can win.
+
+A failed job is retried after an exponential backoff with jitter until
+it has been attempted max_attempts times. A job whose worker died is queued
+again once it has been running for longer than JOBS["LOCK_TIMEOUT"].
+
+Settings (JOBS):
+    WORKERS: number of jobs run at the same time by a worker
+    POOL: "thread" or "process"
+    POLL_INTERVAL: seconds between two reads of an empty queue
+    MAX_ATTEMPTS: default number of attempts of a job
+    RETRY_BACKOFF: seconds before the first retry, doubled for each retry
+    RETRY_BACKOFF_MAX: maximum seconds between two attempts
+    LOCK_TIMEOUT: seconds after which a running job is considered lost,
+        it must be longer than the longest job
+    FINISHED_RETENTION: seconds the finished jobs are kept, and so for how
+        long their idempotency keys are remembered
+"""
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import get_job_definition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "WORKERS": 4,
+    "POOL": "thread",
+    "POLL_INTERVAL": 1.0,
+    "MAX_ATTEMPTS": 3,
+    "RETRY_BACKOFF": 2.0,
+    "RETRY_BACKOFF_MAX": 300.0,
+    "LOCK_TIMEOUT": 600.0,
+    "FINISHED_RETENTION": 7 * 24 * 3600,
+}
+
+
+def get_jobs_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "JOBS", {}))
+    return config
+
+
+# |=============================== Enqueueing =============================| #
+def enqueue(
+    name, kwargs=None, idempotency_key=None, delay=0, max_attempts=None
+):
+    """
+    Add a job to the queue and return it.
+    When idempotency_key is the key of an existing job, that job is returned
+    and nothing is added.
+    """
+    definition = get_job_definition(name)
+    max_attempts = (
+        max_attempts
+        or definition.max_attempts
+        or get_jobs_settings()["MAX_ATTEMPTS"]
+    )
+    fields = {
+        "name": name,
+        "kwargs": kwargs or {},
+        "max_attempts": max_attempts,
+        "run_after": timezone.now() + timedelta(seconds=delay),
+    }
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    job, _ = Job.objects.get_or_create(
+        idempotency_key=idempotency_key, defaults=fields
+    )
+    return job
+
+
+def enqueue_on_commit(name, **options):
+    """
+    Enqueue the job once the current transaction is committed, so that the
+    job sees the data written by the transaction and isn't added when the
+    transaction is rolled back.
+    The job is enqueued immediately when no transaction is open.
+    """
+    get_job_definition(name)
+    transaction.on_commit(lambda: enqueue(name, **options))
+
+
+# |================================ Claiming ==============================| #
+def claim_jobs(worker_id, limit):
+    """
+    Mark up to `limit` queued jobs as run by the worker and return their ids.
+    """
+    now = timezone.now()
+    candidate_ids = list(
+        Job.objects
+        .filter(status=Job.Status.QUEUED, run_after__lte=now)
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    claimed_ids = []
+    for job_id in candidate_ids:
+        # Another worker may have claimed the job since it was read
+        claimed = Job.objects.filter(
+            id=job_id, status=Job.Status.QUEUED
+        ).update(
+            status=Job.Status.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+        )
+        if claimed:
+            claimed_ids.append(job_id)
+    return claimed_ids
+
+
+def requeue_lost_jobs():
+    """
+    Queue again the jobs which have been running for longer than
+    JOBS["LOCK_TIMEOUT"], their worker most probably died.
+    Returns the number of jobs queued again.
+    """
+    config = get_jobs_settings()
+    now = timezone.now()
+    lost_jobs = Job.objects.filter(
+        status=Job.Status.RUNNING,
+        locked_at__lt=now - timedelta(seconds=config["LOCK_TIMEOUT"]),
+    )
+    error = "The worker running the job didn't finish it in time"
+    for job in lost_jobs.only('id', 'attempts', 'max_attempts', 'locked_by'):
+        lost_job = Job.objects.filter(
+            id=job.id, status=Job.Status.RUNNING, locked_by=job.locked_by
+        )
+        if job.attempts >= job.max_attempts:
+            lost_job.update(
+                status=Job.Status.FAILED, locked_by='', locked_at=None,
+                finished_date=now, last_error=error,
+            )
+        else:
+            lost_job.update(
+                status=Job.Status.QUEUED, locked_by='', locked_at=None,
+                run_after=now + get_retry_delay(job.attempts),
+                last_error=error,
+            )
+    return len(lost_jobs)
+
+
+def delete_finished_jobs():
+    config = get_jobs_settings()
+    deleted, _ = Job.objects.filter(
+        status__in=[Job.Status.SUCCEEDED, Job.Status.FAILED],
+        finished_date__lt=(
+            timezone.now() - timedelta(seconds=config["FINISHED_RETENTION"])
+        ),
+    ).delete()
+    return deleted
+
+
+def get_job_metrics(since=None):
+    """
+    Return the number of jobs per name and status, with the mean and maximum
+    wait and run times of the last attempts, for the jobs created since the
+    given datetime.
+    """
+    jobs = Job.objects.all()
+    if since is not None:
+        jobs = jobs.filter(created_date__gte=since)
+    return list(
+        jobs
+        .values('name', 'status')
+        .annotate(
+            job_count=Count('id'),
+            retried_count=Count('id', filter=Q(attempts__gt=1)),
+            mean_wait_time=Avg('wait_time'),
+            max_wait_time=Max('wait_time'),
+            mean_run_time=Avg('run_time'),
+            max_run_time=Max('run_time'),
+        )
+        .order_by('name', 'status')
+    )
+
+
+# |================================ Running ===============================| #
+def get_retry_delay(attempts):
+    """
+    Exponential backoff with jitter: between half and all of
+    RETRY_BACKOFF * 2 ** (attempts - 1) seconds.
+    """
+    config = get_jobs_settings()
+    delay = min(
+        config["RETRY_BACKOFF"] * 2 ** max(attempts - 1, 0),
+        config["RETRY_BACKOFF_MAX"],
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def run_job(job_id):
+    """
+    Run a claimed job and record its outcome.
+    Returns (job name, status, run time in seconds).
+    """
+    try:
+        job = Job.objects.get(id=job_id)
+        started_date = timezone.now()
+        attempts = job.attempts + 1
+        claimed_job = Job.objects.filter(
+            id=job.id, status=Job.Status.RUNNING, locked_by=job.locked_by
+        )
+        claimed_job.update(
+            attempts=attempts,
+            started_date=started_date,
+            wait_time=(started_date - job.run_after).total_seconds(),
+        )
+
+        start = time.perf_counter()
+        try:
+            result = get_job_definition(job.name).func(**job.kwargs)
+        except Exception:
+            run_time = time.perf_counter() - start
+            error = traceback.format_exc()
+            if attempts < job.max_attempts:
+                status = Job.Status.QUEUED
+                claimed_job.update(
+                    status=status, locked_by='', locked_at=None,
+                    run_after=timezone.now() + get_retry_delay(attempts),
+                    run_time=run_time, last_error=error,
+                )
+                logger.warning(
+                    "Job %s %s failed (attempt %d of %d), retrying",
+                    job.name, job.uuid, attempts, job.max_attempts,
+                )
+            else:
+                status = Job.Status.FAILED
+                claimed_job.update(
+                    status=status, locked_by='', locked_at=None,
+                    finished_date=timezone.now(),
+                    run_time=run_time, last_error=error,
+                )
+                logger.error(
+                    "Job %s %s failed after %d attempts\n%s",
+                    job.name, job.uuid, attempts, error,
+                )
+            return job.name, status, run_time
+
+        run_time = time.perf_counter() - start
+        status = Job.Status.SUCCEEDED
+        claimed_job.update(
+            status=status, locked_by='', locked_at=None,
+            finished_date=timezone.now(), run_time=run_time, result=result,
+        )
+        logger.info(
+            "Job %s %s succeeded in %.3fs", job.name, job.uuid, run_time
+        )
+        return job.name, status, run_time
+    finally:
+        close_old_connections()
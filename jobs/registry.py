@@ -0,0 +1,58 @@
+"""
+Registry of the functions which can be run as jobs.
+
+    from jobs.registry import job
+
+    @job(max_attempts=5)
+    def send_report(user_id):
+        ...
+
+    send_report.enqueue_on_commit(kwargs={"user_id": user.id})
+
+The jobs are defined in a `jobs` module of the apps, these modules are
+imported when the apps are ready (see jobs/apps.py) so that every process
+knows all the jobs. The arguments and the return value of a job must be
+JSON serializable.
+"""
+import functools
+from collections import namedtuple
+
+JobDefinition = namedtuple(
+    "JobDefinition", ["name", "func", "max_attempts"]
+)
+
+_registry = {}
+
+
+def job(name=None, max_attempts=None):
+    """
+    Register the decorated function as a job.
+    name: defaults to <module>.<function name>
+    max_attempts: defaults to JOBS["MAX_ATTEMPTS"]
+    """
+    def decorator(func):
+        from jobs.queue import enqueue, enqueue_on_commit
+
+        job_name = name or f"{func.__module__}.{func.__name__}"
+        if job_name in _registry:
+            raise ValueError(f"A job named '{job_name}' is already registered")
+        _registry[job_name] = JobDefinition(job_name, func, max_attempts)
+        func.job_name = job_name
+        func.enqueue = functools.partial(enqueue, job_name)
+        func.enqueue_on_commit = functools.partial(
+            enqueue_on_commit, job_name
+        )
+        return func
+
+    return decorator
+
+
+def get_job_definition(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"No job named '{name}' is registered") from None
+
+
+def get_job_names():
+    return sorted(_registry)
@@ -0,0 +1,129 @@
+"""
+The worker loop of `manage.py run_jobs`.
+
+The main thread claims jobs and hands them to a pool of threads or processes,
+it never claims more jobs than the pool can run at once so that the claimed
+jobs don't wait in the worker while other workers are idle.
+Threads suit the jobs waiting on the database or the network, processes the
+CPU bound jobs (they are started with "spawn" so that no database
+connection is shared with the main process).
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+
+from jobs import process
+from jobs.queue import (
+    claim_jobs, delete_finished_jobs, get_jobs_settings, requeue_lost_jobs,
+    run_job
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks for lost jobs and finished jobs to delete
+MAINTENANCE_INTERVAL = 60
+
+
+class Worker:
+
+    def __init__(self, workers=None, pool=None, poll_interval=None):
+        config = get_jobs_settings()
+        self.workers = workers or config["WORKERS"]
+        self.pool = pool or config["POOL"]
+        self.poll_interval = (
+            config["POLL_INTERVAL"] if poll_interval is None
+            else poll_interval
+        )
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        # Metrics of the jobs run by this worker
+        self.status_counts = Counter()
+        self.run_times = defaultdict(list)
+
+    def get_executor(self):
+        if self.pool == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=process.init_process,
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="job"
+        )
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def record(self, future):
+        try:
+            name, status, run_time = future.result()
+        except Exception:
+            # Only an error of the queue itself (e.g. the database being
+            # unreachable) gets here, the errors of the jobs are recorded
+            # on the jobs
+            logger.exception("Running a job failed")
+            self.status_counts["ERROR"] += 1
+            return
+        self.status_counts[status] += 1
+        self.run_times[name].append(run_time)
+
+    def run(self, burst=False):
+        """
+        Run jobs until stop() is called, or until the queue is empty when
+        `burst` is set.
+        """
+        pending = set()
+        last_maintenance = 0
+        # The processes import run_job through jobs.process
+        run = process.run_job if self.pool == "process" else run_job
+        with self.get_executor() as executor:
+            while not self.stopping:
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    requeue_lost_jobs()
+                    delete_finished_jobs()
+                    last_maintenance = time.monotonic()
+
+                free_slots = self.workers - len(pending)
+                job_ids = (
+                    claim_jobs(self.worker_id, free_slots) if free_slots
+                    else []
+                )
+                for job_id in job_ids:
+                    pending.add(executor.submit(run, job_id))
+
+                if not pending:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                done, pending = wait(
+                    pending, timeout=self.poll_interval,
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    self.record(future)
+
+            # Let the claimed jobs finish
+            for future in wait(pending).done:
+                self.record(future)
+
+    def get_metrics(self):
+        """
+        Return {job name: {"count", "total", "mean", "max"}} of the run times
+        of the jobs run by this worker.
+        """
+        return {
+            name: {
+                "count": len(run_times),
+                "total": sum(run_times),
+                "mean": sum(run_times) / len(run_times),
+                "max": max(run_times),
+            }
+            for name, run_times in sorted(self.run_times.items())
+        }
@@ -8,8 +8,14 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
+from rest_framework.fields import IntegerField
 
+from core.behaviours import VersionConflict
+from core.fields import get_choice_label
 from todos.models import Tag, Task
+from todos.ordering import TASK_ORDERING
+from todos.sharding import refuse_when_sharded
+from todos.tagging import diff_task_tags, get_tag_ids, save_task
 
 
 # ===================================Tag APIs ============================== #
@@ -234,6 +240,8 @@ def task_list_create(request):
     """
     This view lists all tags and a create a new tag
     """
+    # The tasks are read from the default database, see todos/sharding.py
+    refuse_when_sharded("The v1 task APIs")
 
     if request.method == "GET":
         # returns a list of all the tags present in the database
@@ -271,17 +279,15 @@ def task_list_create(request):
         print("end_index:", end_index)
 
         # Ordering
+        # Only the keys declared in TASK_ORDERING are allowed, the default
+        # ordering is by id
         ordering_list = request.query_params.getlist('ordering')
-        if not ordering_list:
-            ordering_list = ['id']
 
         # Fetch the task records from the database
-        tasks = (
-            Task.objects
-            .order_by(*ordering_list)
-            .filter(query)
-            [start_index:end_index]
-        )
+        tasks = TASK_ORDERING.apply(
+            Task.objects.filter(query),
+            ordering_list
+        )[start_index:end_index]
 
         # preparing a list of dicts that need to be sent in the response
         response_data = []
@@ -354,8 +360,9 @@ def task_list_create(request):
             text=text,
             created_by=created_by
         )
-        # set the tags associated with the task
-        task.tags.set(tags)
+        # set the tags associated with the task, a new task has no tags to
+        # compare them with
+        task.tags.add(*tags)
 
         # prepare dict for response
         response_data = {
@@ -368,7 +375,10 @@ def task_list_create(request):
                         "email": task.created_by.email,
                         "id": task.created_by.id
             },
-            "completion_status": task.get_completion_status_display(),
+            "completion_status": get_choice_label(
+                Task, "completion_status", task.completion_status
+            ),
+            "version": task.version,
             "tags": [
                 {
                     "name": tag.name,
@@ -394,6 +404,8 @@ def task_retrieve_update_delete(request, uuid):
     """
     This view lists all tags and a create a new tag
     """
+    # The tasks are read from the default database, see todos/sharding.py
+    refuse_when_sharded("The v1 task APIs")
 
     if request.method == "GET":
         # fetch the requested tag from the database
@@ -417,7 +429,10 @@ def task_retrieve_update_delete(request, uuid):
                         "email": task.created_by.email,
                         "id": task.created_by.id
             },
-            "completion_status": task.get_completion_status_display(),
+            "completion_status": get_choice_label(
+                Task, "completion_status", task.completion_status
+            ),
+            "version": task.version,
             "tags": [
                 {
                     "name": tag.name,
@@ -447,6 +462,28 @@ def task_retrieve_update_delete(request, uuid):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        # The version the client has seen, the update is refused if the task
+        # was changed since then. Form data sends it as a string, it is
+        # validated like TaskCreateUpdateSerializer does.
+        version = task.version
+        if 'version' in request.data:
+            try:
+                version = IntegerField(min_value=1).run_validation(
+                    request.data['version']
+                )
+            except ValidationError as error:
+                raise ValidationError(detail={"version": error.detail})
+        if version != task.version:
+            return Response(
+                data={
+                    "message": (
+                        f"The task was changed by another request since "
+                        f"version {version} was read"
+                    )
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+
         # Extract and validate data in the request
         title = request.data.get('title', task.title)
         if len(title) > 200:
@@ -461,18 +498,44 @@ def task_retrieve_update_delete(request, uuid):
             raise ValidationError(
                 detail="completion_status can be either COMPLETE or INCOMPLETE"
             )
-        tag_uuids = request.data.get('tags', task.tags.all())
-        tags = (
-            Tag.objects.filter(uuid__in=tag_uuids) if tag_uuids
-            else task.tags.all()
-        )
+        # The tags are only changed when they are in the request, and only
+        # the changed links are written
+        added_tag_ids = removed_tag_ids = set()
+        if 'tags' in request.data:
+            added_tag_ids, removed_tag_ids = diff_task_tags(
+                task, get_tag_ids(request.data['tags']).values()
+            )
 
-        # Update the Task record in the database
+        # Update the changed columns of the Task record in the database
+        changed_fields = [
+            field_name for field_name, value in (
+                ('title', title),
+                ('text', text),
+                ('completion_status', completion_status),
+            )
+            if getattr(task, field_name) != value
+        ]
         task.title = title
         task.text = text
         task.completion_status = completion_status
-        task.save()
-        task.tags.set(tags)
+        try:
+            if changed_fields or added_tag_ids or removed_tag_ids:
+                save_task(
+                    task,
+                    update_fields=changed_fields,
+                    added_tag_ids=added_tag_ids,
+                    removed_tag_ids=removed_tag_ids
+                )
+        except VersionConflict:
+            return Response(
+                data={
+                    "message": (
+                        f"The task was changed by another request since "
+                        f"version {version} was read"
+                    )
+                },
+                status=status.HTTP_409_CONFLICT
+            )
 
         # Prepare the dictionary for the response
         response_data = {
@@ -485,12 +548,15 @@ def task_retrieve_update_delete(request, uuid):
                         "email": task.created_by.email,
                         "id": task.created_by.id
             },
-            "completion_status": task.get_completion_status_display(),
+            "completion_status": get_choice_label(
+                Task, "completion_status", task.completion_status
+            ),
+            "version": task.version,
             "tags": [
                 {
                     "name": tag.name,
                     "uuid": tag.uuid,
-                } for tag in tags
+                } for tag in task.tags.all()
             ]
         }
 
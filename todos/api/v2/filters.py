@@ -1,6 +1,38 @@
+import uuid
+
+from django.db.models import Count
 from django_filters.rest_framework import FilterSet, CharFilter
+from rest_framework.exceptions import ValidationError
 
 from todos.models import Task
+from todos.ordering import TASK_ORDERING
+from todos.task_index import get_task_index, get_task_index_settings
+from todos.vocabulary import get_tag_vocabulary
+
+
+def parse_values(value, parse, name, description):
+    """
+    Split a comma separated filter value and parse its items, an invalid
+    item is a 400 instead of an error of the database when the query runs.
+    """
+    values = []
+    for item in value.split(','):
+        try:
+            values.append(parse(item))
+        except ValueError:
+            raise ValidationError(
+                detail={
+                    "message": (
+                        f"Invalid {name} '{item}', expected comma separated "
+                        f"{description}"
+                    )
+                }
+            )
+    return values
+
+
+def parse_tag_uuids(value, name):
+    return parse_values(value, uuid.UUID, name, "tag uuids")
 
 
 class TaskFilter(FilterSet):
@@ -10,34 +42,156 @@ class TaskFilter(FilterSet):
 
     created_by = CharFilter(method='filter_with_created_by')
     tags = CharFilter(method='filter_with_tags')
+    tags_any = CharFilter(method='filter_with_any_tags')
+    tags_all = CharFilter(method='filter_with_all_tags')
+    completion_status = CharFilter(method='filter_with_completion_status')
     ordering = CharFilter(method='ordering_by_params')
 
+    # Filters that can be answered by the in-process task index
+    # (see todos/task_index.py)
+    task_index_filters = {
+        'created_by', 'tags', 'tags_any', 'tags_all', 'completion_status'
+    }
+
+    def filter_queryset(self, queryset):
+        task_ids = self.get_task_ids_from_index()
+        ordering = self.form.cleaned_data.get('ordering')
+        if task_ids is None:
+            queryset = super().filter_queryset(queryset)
+        else:
+            queryset = queryset.filter(id__in=task_ids)
+            queryset = self.filters['ordering'].filter(queryset, ordering)
+        if not ordering:
+            # The method of a filter only runs for a value, the pages
+            # without an ordering get the default one and its tiebreaker
+            queryset = TASK_ORDERING.apply(queryset, None)
+        return queryset
+
+    def get_task_ids_from_index(self):
+        """
+        Return the ids of the tasks matching the filters using the task
+        index, or None when the query has to run on the database: the index
+        is disabled, a filter isn't supported, a tag isn't known or the
+        result is too large to be sent as a list of ids.
+        """
+        task_index = get_task_index()
+        if task_index is None:
+            return None
+        values = {
+            name: value for name, value in self.form.cleaned_data.items()
+            if value and name != 'ordering'
+        }
+        if not values or not set(values) <= self.task_index_filters:
+            return None
+        if 'tags' in values and 'tags_any' in values:
+            return None
+        try:
+            created_by_ids = (
+                [int(id) for id in values['created_by'].split(',')]
+                if 'created_by' in values else None
+            )
+            any_tag_ids = self.get_tag_ids(
+                values.get('tags_any') or values.get('tags')
+            )
+            all_tag_ids = self.get_tag_ids(values.get('tags_all'))
+        except (ValueError, KeyError):
+            return None
+        completion_statuses = (
+            values['completion_status'].split(',')
+            if 'completion_status' in values else None
+        )
+        bitset = task_index.query(
+            created_by_ids=created_by_ids,
+            completion_statuses=completion_statuses,
+            any_tag_ids=any_tag_ids,
+            all_tag_ids=all_tag_ids,
+        )
+        if len(bitset) > get_task_index_settings()["MAX_IDS"]:
+            return None
+        return list(bitset)
+
+    def get_tag_ids(self, value):
+        """
+        Map comma separated tag uuids to tag ids with the tag vocabulary.
+        Raises KeyError for unknown uuids, as the vocabulary may be older
+        than the tag.
+        """
+        if not value:
+            return None
+        tags_by_uuid = get_tag_vocabulary().by_uuid
+        return [
+            tags_by_uuid[uuid.UUID(tag_uuid)].id
+            for tag_uuid in value.split(',')
+        ]
+
+    def filter_with_completion_status(self, queryset, name, value):
+        completion_statuses = value.split(',')
+        return queryset.filter(
+            completion_status__in=completion_statuses
+        )
+
     def filter_with_created_by(self, queryset, name, value):
         print("this method is called", name, value)
-        created_by_ids = value.split(',')
+        created_by_ids = parse_values(value, int, name, "user ids")
         return queryset.filter(
             created_by__id__in=created_by_ids
         )
 
     def filter_with_tags(self, queryset, name, value):
         print("this method is called", name, value)
-        tag_uuids = value.split(',')
-        return queryset.filter(
-            tags__uuid__in=tag_uuids
+        # Same as tags_any
+        return self.filter_with_any_tags(queryset, name, value)
+
+    def filter_with_any_tags(self, queryset, name, value):
+        """
+        Tasks having at least one of the given tags.
+        The tags are matched with a semi-join (`id IN (SELECT task_id ...)`)
+        on the through table instead of joining it, so a task having several
+        of the tags is returned once without needing a DISTINCT.
+        """
+        tag_uuids = parse_tag_uuids(value, name)
+        task_ids = (
+            Task.tags.through.objects
+            .filter(
+                tag__uuid__in=tag_uuids, tag__deleted_at__isnull=True
+            )
+            .values('task_id')
         )
+        return queryset.filter(id__in=task_ids)
+
+    def filter_with_all_tags(self, queryset, name, value):
+        """
+        Tasks having all the given tags.
+        The through table rows of the given tags are grouped by task and
+        only the tasks with one row per tag are kept
+        (`GROUP BY task_id HAVING COUNT(*) = <number of tags>`).
+        """
+        tag_uuids = set(parse_tag_uuids(value, name))
+        task_ids = (
+            Task.tags.through.objects
+            .filter(
+                tag__uuid__in=tag_uuids, tag__deleted_at__isnull=True
+            )
+            .values('task_id')
+            .annotate(tag_count=Count('tag_id'))
+            .filter(tag_count=len(tag_uuids))
+            .values('task_id')
+        )
+        return queryset.filter(id__in=task_ids)
 
     def ordering_by_params(self, queryset, name, value):
         print("this method is called", name, value)
-        if value:
-            ordering_list = value.split(',')
-        else:
-            ordering_list = ['id']
-        return queryset.order_by(*ordering_list)
+        # Only the keys declared in TASK_ORDERING are allowed, with an id
+        # tiebreaker added
+        return TASK_ORDERING.apply(queryset, value)
 
     class Meta:
         model = Task
         fields = [
             'created_by',
             'tags',
+            'tags_any',
+            'tags_all',
+            'completion_status',
             "ordering"
         ]
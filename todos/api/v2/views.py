@@ -17,6 +17,7 @@ from todos.serializers import (
 )
 from todos.models import Tag, Task
 from todos.pagination import TaskPagination
+from todos.sharding import refuse_when_sharded
 
 
 # ===================================Tag APIs ============================== #
@@ -218,6 +219,8 @@ def task_list_create(request):
     """
     This view lists all tags and a create a new tag
     """
+    # The tasks are read from the default database, see todos/sharding.py
+    refuse_when_sharded("The v2 task APIs")
 
     # |------------------------- Task List API ----------------------------| #
     if request.method == "GET":
@@ -295,6 +298,8 @@ def task_retrieve_update_delete(request, uuid):
     """
     This view lists all tags and a create a new tag
     """
+    # The tasks are read from the default database, see todos/sharding.py
+    refuse_when_sharded("The v2 task APIs")
     # |----------------------- Task Retrieve API --------------------------| #
     if request.method == "GET":
         # fetch the requested tag from the database
@@ -13,6 +13,7 @@ from todos.serializers import (
 )
 from todos.pagination import TaskPagination
 from todos.api.v2.filters import TaskFilter
+from todos.sharding import refuse_when_sharded
 
 
 # |================================= Tag APIs =============================| #
@@ -181,6 +182,12 @@ class TaskViewset(GenericViewSet):
     retrieve_message = "Details of task record"
     delete_message = "Task record deleted"
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The tasks are read from the default database, see
+        # todos/sharding.py
+        refuse_when_sharded("The v3 task APIs")
+
     def get_object(self, *args, **kwargs):
         task = get_object_or_404(
             klass=Task,
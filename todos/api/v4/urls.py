@@ -2,6 +2,10 @@ from django.urls import path
 
 from todos.api.v4.views import (
     TagViewset,
+    TaskExportViewset,
+    TaskImportViewset,
+    TaskQueryViewset,
+    TaskStatViewset,
     TaskViewset
 )
 
@@ -46,5 +50,79 @@ urlpatterns = [
         }),
         name="task_retrieve_update_delete_v4"
     ),
+    path(
+        route="tasks/<slug:uuid>/tags/",
+        view=TaskViewset.as_view({
+            "post": "add_tags",
+            "delete": "remove_tags"
+        }),
+        name="task_tags_add_remove_v4"
+    ),
+    path(
+        route="tasks/<slug:uuid>/toggle",
+        view=TaskViewset.as_view({
+            "post": "toggle",
+        }),
+        name="task_toggle_v4"
+    ),
+
+    # |=========================== Task export APIs =======================| #
+    path(
+        route="tasks/exports/",
+        view=TaskExportViewset.as_view({
+            "get": "list",
+            "post": "create"
+        }),
+        name="task_export_create_list_v4"
+    ),
+    path(
+        route="tasks/exports/<slug:uuid>",
+        view=TaskExportViewset.as_view({
+            "get": "retrieve",
+        }),
+        name="task_export_retrieve_v4"
+    ),
+    path(
+        route="tasks/exports/<slug:uuid>/download",
+        view=TaskExportViewset.as_view({
+            "get": "download",
+        }),
+        name="task_export_download_v4"
+    ),
+
+    # |=========================== Task import APIs =======================| #
+    path(
+        route="tasks/imports/",
+        view=TaskImportViewset.as_view({
+            "get": "list",
+            "post": "create"
+        }),
+        name="task_import_create_list_v4"
+    ),
+    path(
+        route="tasks/imports/<slug:uuid>",
+        view=TaskImportViewset.as_view({
+            "get": "retrieve",
+        }),
+        name="task_import_retrieve_v4"
+    ),
+
+    # |============================== Query APIs ==========================| #
+    path(
+        route="query/",
+        view=TaskQueryViewset.as_view({
+            "post": "query",
+        }),
+        name="task_query_v4"
+    ),
+
+    # |============================== Stats APIs ==========================| #
+    path(
+        route="stats/",
+        view=TaskStatViewset.as_view({
+            "get": "list",
+        }),
+        name="task_stats_v4"
+    ),
 
 ]
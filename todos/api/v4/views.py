@@ -1,33 +1,106 @@
+import os
 
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncWeek
 from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
 from rest_framework.mixins import (
     CreateModelMixin, DestroyModelMixin, ListModelMixin,
     RetrieveModelMixin, UpdateModelMixin
 )
+from rest_framework.parsers import MultiPartParser
 from rest_framework.viewsets import GenericViewSet
-from django_filters.rest_framework import DjangoFilterBackend
 
+from core.batch import get_batch_cached
+from core.behaviours import VersionConflict
 from core.db_utils import get_object_or_404
-from core.renderers import CustomRenderer
+from core.exceptions import Gone
+from core.parsers import get_api_parser_classes
+from core.ranges import ranged_file_response
+from core.renderers import JSONFragments, get_api_renderer_classes
 from todos.api.v2.filters import TaskFilter
-from todos.models import Tag, Task
+from todos.exports import get_export_file_name
+from todos.fragments import (
+    can_use_fragments, get_task_fragments, is_fragment_cache_enabled
+)
+from todos.graph import Query, QueryError
+from todos.idempotency import IdempotentCreateMixin, run_idempotent
+from todos.imports import (
+    CONTENT_TYPE_FORMATS, EXTENSION_FORMATS, UploadTooLarge, spool_upload
+)
+from todos.jobs import export_tasks_job, import_tasks_job
+from todos.models import (
+    Tag, Task, TaskExport, TaskImport, TaskListEntry, TaskStat, TaskTagStat
+)
 from todos.pagination import TaskPagination
+from todos.read_models import as_task_rows
 from todos.serializers import (
     TagRetrieveSerializer, TagSerializer,
-    TaskCreateUpdateSerializer, TaskSerializer
+    TaskCreateUpdateSerializer, TaskExportSerializer, TaskImportSerializer,
+    TaskSerializer, TaskStatFilterSerializer, TaskTagsSerializer,
+    get_task_version_conflict
+)
+from todos.sharding import (
+    ShardedTaskFilterBackend, get_shard_count, get_sharded_task_or_404,
+    get_user_database, is_sharded, refuse_when_sharded
 )
-from rest_framework.permissions import IsAuthenticated
+from todos.tagging import add_task_tags, remove_task_tags
+from todos.task_list import (
+    TaskListFilter, as_task_list_rows, can_serve_task_list,
+    is_task_list_enabled
+)
+from todos.toggles import (
+    ToggleFlushError, apply_pending_toggles, get_toggle_settings,
+    toggle_task
+)
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+
+# Queries allowed over the counts measured with `manage.py report_queries`
+# in the query budgets, see core/query_budget.py
+QUERY_BUDGET_MARGIN = 2
+
+
+def add_query_budget(budget, queries, times=1):
+    for action, count in queries.items():
+        budget[action] += count * times
 
 
 # |================================= Tag APIs ============================| #
 class TagViewset(
-    ListModelMixin, CreateModelMixin, RetrieveModelMixin,
-    UpdateModelMixin, DestroyModelMixin, GenericViewSet
+    IdempotentCreateMixin, ListModelMixin, CreateModelMixin,
+    RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, GenericViewSet
 ):
     # Authentication
     permission_classes = [IsAuthenticated]
+    throttle_scope = "tags"
+    # Queries per action, see core/query_budget.py and get_query_budget()
+    query_budget = {
+        "list": 2,
+        "retrieve": 3,
+        "create": 3,
+        "partial_update": 4,
+        "destroy": 13,
+    }
+    # The writes are copied to every shard when the tasks are sharded:
+    # (queries, queries per shard)
+    sharded_query_budget = {
+        "create": (2, 3),
+        "partial_update": (2, 3),
+        "destroy": (9, 6),
+    }
+    # Queries per database holding tasks of the tag, refreshing their task
+    # list rows and their fragments
+    task_list_query_budget = {"partial_update": 5, "destroy": 5}
+    fragment_query_budget = {"partial_update": 1, "destroy": 1}
     serializer_class = TagSerializer
-    renderer_classes = [CustomRenderer]
+    # JSON by default, MessagePack & CBOR are selected with the Accept and
+    # Content-Type headers
+    renderer_classes = get_api_renderer_classes()
+    parser_classes = get_api_parser_classes()
 
     # The message that will be added in the response for each action in the
     # Viewset
@@ -55,12 +128,53 @@ class TagViewset(
     }
 
     def get_object(self):
-        tag = get_object_or_404(
-            klass=Tag,
-            uuid=self.kwargs.get("uuid")
+        uuid = self.kwargs.get("uuid")
+        if self.request.method not in SAFE_METHODS:
+            return get_object_or_404(klass=Tag, uuid=uuid)
+        # The tags read by the requests of a batch are shared
+        tag = get_batch_cached(
+            "tags", str(uuid),
+            lambda: get_object_or_404(klass=Tag, uuid=uuid)
         )
         return tag
 
+    @classmethod
+    def prefetch_batch(cls, cache, sub_requests):
+        """
+        Read the tags retrieved by the GET requests of a batch with a single
+        query.
+        """
+        uuids = [
+            sub_request.kwargs["uuid"] for sub_request in sub_requests
+            if sub_request.action == "retrieve"
+        ]
+        if len(uuids) < 2:
+            return
+        try:
+            tags = Tag.objects.filter(uuid__in=uuids)
+            cache.set_many("tags", {str(tag.uuid): tag for tag in tags})
+        except DjangoValidationError:
+            # A malformed uuid, the requests return their own errors
+            pass
+
+    def get_query_budget(self):
+        budget = dict(self.query_budget)
+        databases = 1
+        if is_sharded():
+            databases = get_shard_count()
+            for action, (queries, shard_queries) in (
+                self.sharded_query_budget.items()
+            ):
+                budget[action] = queries + shard_queries * databases
+        if is_task_list_enabled():
+            add_query_budget(budget, self.task_list_query_budget, databases)
+        if is_fragment_cache_enabled():
+            add_query_budget(budget, self.fragment_query_budget, databases)
+        return {
+            action: count + QUERY_BUDGET_MARGIN
+            for action, count in budget.items()
+        }
+
     def get_queryset(self, *args, **kwargs):
         queryset = Tag.objects.all()
         return queryset
@@ -90,15 +204,57 @@ class TagViewset(
 
 # |================================= Task APIs ============================| #
 class TaskViewset(
-    ListModelMixin, CreateModelMixin, RetrieveModelMixin,
-    UpdateModelMixin, DestroyModelMixin, GenericViewSet
+    IdempotentCreateMixin, ListModelMixin, CreateModelMixin,
+    RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, GenericViewSet
 ):
     permission_classes = [IsAuthenticated]
+    # Prefix of the rate limit scopes, see core/throttling.py
+    throttle_scope = "tasks"
+    # Queries per action, see core/query_budget.py and get_query_budget(),
+    # a PATCH replacing the tags of a task runs the most
+    query_budget = {
+        "list": 5,
+        "retrieve": 4,
+        "create": 18,
+        "partial_update": 22,
+        "destroy": 15,
+        "add_tags": 15,
+        "remove_tags": 12,
+        "toggle": 2,
+    }
+    # Queries added when the tasks are sharded, by the shard directory and
+    # the stats kept on the default database. A list runs up to 4 queries
+    # per shard instead
+    sharded_query_budget = {
+        "retrieve": 1,
+        "create": 3,
+        "partial_update": 3,
+        "destroy": 3,
+        "add_tags": 2,
+        "remove_tags": 2,
+        "toggle": 1,
+    }
+    shard_list_query_budget = 4
+    # Queries added by the task list table
+    task_list_query_budget = {
+        "create": 8,
+        "partial_update": 12,
+        "destroy": 2,
+        "add_tags": 8,
+        "remove_tags": 8,
+    }
+    # Queries of a toggle written by the request (DURABILITY SYNC), and
+    # added to them when sharded and by the task list table
+    sync_toggle_query_budget = (13, 2, 4)
     serializer_class = TaskSerializer
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = TaskFilter
+    # The tasks of every shard are listed when the tasks are sharded, see
+    # todos/sharding.py
+    filter_backends = [ShardedTaskFilterBackend]
     pagination_class = TaskPagination
-    renderer_classes = [CustomRenderer]
+    # JSON by default, MessagePack & CBOR are selected with the Accept and
+    # Content-Type headers
+    renderer_classes = get_api_renderer_classes()
+    parser_classes = get_api_parser_classes()
 
     # The message that will be added in the response for each action in the
     # Viewset
@@ -122,23 +278,118 @@ class TaskViewset(
         "create": {
             "message": "New Task record created",
             "status_code": status.HTTP_201_CREATED
+        },
+        "add_tags": {
+            "message": "Tags added to the requested task record",
+            "status_code": status.HTTP_200_OK
+        },
+        "remove_tags": {
+            "message": "Tags removed from the requested task record",
+            "status_code": status.HTTP_200_OK
+        },
+        "toggle": {
+            "message": "Completion status of the requested task toggled",
+            "status_code": status.HTTP_200_OK
         }
     }
 
     def get_object(self):
-        task = get_object_or_404(
-            klass=Task,
-            uuid=self.kwargs.get("uuid")
-        )
+        if is_sharded():
+            task = get_sharded_task_or_404(self.kwargs.get("uuid"))
+        else:
+            task = get_object_or_404(
+                klass=Task,
+                uuid=self.kwargs.get("uuid")
+            )
+        # The statuses toggled but not flushed yet, see todos/toggles.py
+        apply_pending_toggles([task])
         return task
 
+    def use_task_list_table(self):
+        """
+        True when the list page is read from the task list table, see
+        todos/task_list.py.
+        """
+        return self.action == "list" and can_serve_task_list(self.request)
+
+    @property
+    def filterset_class(self):
+        if self.use_task_list_table():
+            return TaskListFilter
+        return TaskFilter
+
+    def use_task_fragments(self):
+        """
+        True when the list page is assembled from the cached JSON of its
+        tasks, see todos/fragments.py.
+        """
+        return self.action == "list" and can_use_fragments(self.request)
+
+    def paginate_queryset(self, queryset):
+        # The pages are rendered from read models instead of Task instances,
+        # see todos/read_models.py, or from the task list entries
+        if self.use_task_list_table():
+            queryset = as_task_list_rows(queryset)
+        else:
+            # The tags and creators of the tasks whose fragment is cached
+            # are not needed
+            queryset = as_task_rows(
+                queryset, load_related=not self.use_task_fragments()
+            )
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            apply_pending_toggles(page)
+        return page
+
+    def get_query_budget(self):
+        budget = dict(self.query_budget)
+        sharded, task_list = is_sharded(), is_task_list_enabled()
+        if get_toggle_settings()["DURABILITY"] == "SYNC":
+            queries, sharded_queries, task_list_queries = (
+                self.sync_toggle_query_budget
+            )
+            budget["toggle"] = (
+                queries + sharded_queries * sharded
+                + task_list_queries * task_list
+            )
+        if sharded:
+            add_query_budget(budget, self.sharded_query_budget)
+            budget["list"] = self.shard_list_query_budget * get_shard_count()
+        if task_list:
+            add_query_budget(budget, self.task_list_query_budget)
+        return {
+            action: count + QUERY_BUDGET_MARGIN
+            for action, count in budget.items()
+        }
+
     def get_queryset(self, *args, **kwargs):
+        if self.use_task_list_table():
+            return TaskListEntry.objects.all()
         queryset = Task.objects.all()
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        if self.use_task_list_table():
+            # The entries are rendered already, without a serializer
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(
+                [row.render() for row in page]
+            )
+        if self.use_task_fragments():
+            # Only the tasks missing from the cache are serialized
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(JSONFragments(
+                get_task_fragments(page, self.get_serializer_context())
+            ))
+        return super().list(request, *args, **kwargs)
+
     def get_serializer_class(self):
-        if self.action in ['create', 'update']:
+        if self.action in ['create', 'update', 'partial_update']:
             return TaskCreateUpdateSerializer
+        if self.action in ['add_tags', 'remove_tags']:
+            return TaskTagsSerializer
         else:
             return TaskSerializer
 
@@ -147,6 +398,550 @@ class TaskViewset(
         context.update({"request": self.request})
         return context
 
+    def change_tags(self, change_task_tags):
+        """
+        Add or remove the tags of the body, only the changed links of the
+        task are written.
+        """
+        task = self.get_object()
+        data = self.request.data
+        if not data and self.request.query_params.get("tags"):
+            # DELETE bodies are dropped by some clients and proxies, the
+            # tags can be sent as a comma separated list instead
+            data = {
+                "tags": self.request.query_params["tags"].split(','),
+                "version": self.request.query_params.get("version"),
+            }
+            if data["version"] is None:
+                del data["version"]
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        version = serializer.validated_data.get("version", task.version)
+        if version != task.version:
+            raise get_task_version_conflict(version)
+        try:
+            change_task_tags(task, serializer.validated_data["tags"])
+        except VersionConflict:
+            raise get_task_version_conflict(version)
+        return Response(
+            TaskCreateUpdateSerializer(
+                task, context=self.get_serializer_context()
+            ).data
+        )
+
+    def add_tags(self, request, *args, **kwargs):
+        return self.change_tags(add_task_tags)
+
+    def remove_tags(self, request, *args, **kwargs):
+        return self.change_tags(remove_task_tags)
+
+    def toggle(self, request, *args, **kwargs):
+        """
+        Toggle the completion status of the task, or set the
+        completion_status of the body, without the validation and the
+        serialization of a PATCH. The write is buffered and batched with the
+        other toggles (see todos/toggles.py), the response is 202 when the
+        status isn't committed yet.
+        """
+        uuid = self.kwargs.get("uuid")
+        if is_sharded():
+            task = get_sharded_task_or_404(uuid)
+            # Refuses the writes of a user whose tasks are being moved
+            get_user_database(task.created_by_id, for_write=True)
+        else:
+            task = get_object_or_404(
+                klass=Task.objects.only(
+                    'id', 'uuid', 'completion_status', 'created_by_id'
+                ),
+                uuid=uuid
+            )
+
+        completion_status = None
+        if isinstance(request.data, dict):
+            completion_status = request.data.get("completion_status")
+        if (
+            completion_status is not None
+            and completion_status not in Task.CompletionStatus.values
+        ):
+            raise ValidationError(
+                detail={
+                    "message": (
+                        f"Unknown completion_status '{completion_status}'. "
+                        f"Allowed values are "
+                        f"{', '.join(Task.CompletionStatus.values)}"
+                    )
+                }
+            )
+
+        try:
+            completion_status, committed = toggle_task(
+                task, completion_status
+            )
+        except ToggleFlushError as error:
+            raise APIException(
+                detail={
+                    "message": f"The toggle wasn't confirmed: {error}"
+                }
+            )
+        return Response(
+            {
+                "uuid": task.uuid,
+                "completion_status": completion_status,
+                "committed": committed,
+            },
+            status=(
+                status.HTTP_200_OK if committed
+                else status.HTTP_202_ACCEPTED
+            )
+        )
+
+    def get_renderer_context(self):
+        context = super().get_renderer_context()
+        if self.action in self.response_data:
+            context["message"] = (
+                self.response_data.get(self.action).get("message")
+            )
+            context["status_code"] = (
+                self.response_data.get(self.action).get("status_code")
+            )
+        return context
+
+
+# |============================== Task import APIs ========================| #
+class TaskImportViewset(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+    """
+    Bulk import of tasks from a CSV or NDJSON file, see todos/imports.py for
+    the columns.
+
+    The file is either the whole request body (Content-Type: text/csv or
+    application/x-ndjson) or the `file` field of a multipart form. It is
+    streamed to disk and imported by a background job, the response
+    (202) is the import record whose status and progress are polled with
+    GET /tasks/imports/<uuid>.
+
+    Query params:
+        file_format: CSV or NDJSON, when neither the Content-Type nor the
+            file name tell it
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = "task_imports"
+    serializer_class = TaskImportSerializer
+    pagination_class = TaskPagination
+    renderer_classes = get_api_renderer_classes()
+    # Raw bodies are streamed by create() without being parsed
+    parser_classes = [MultiPartParser]
+    # Size of the chunks a raw body is read with
+    upload_chunk_size = 64 * 1024
+
+    # The message that will be added in the response for each action in the
+    # Viewset
+    response_data = {
+        "list": {
+            "message": "List of task import records",
+            "status_code": status.HTTP_200_OK
+        },
+        "retrieve": {
+            "message": "Requested task import record retrieved",
+            "status_code": status.HTTP_200_OK
+        },
+        "create": {
+            "message": "Task import queued",
+            "status_code": status.HTTP_202_ACCEPTED
+        }
+    }
+
+    def get_object(self):
+        task_import = get_object_or_404(
+            klass=self.get_queryset(),
+            uuid=self.kwargs.get("uuid")
+        )
+        return task_import
+
+    def get_queryset(self, *args, **kwargs):
+        queryset = (
+            TaskImport.objects
+            .filter(created_by=self.request.user)
+            .select_related('job')
+            .order_by('-id')
+        )
+        return queryset
+
+    def get_file_format(self, content_type_format, file_name=None):
+        file_format = self.request.query_params.get("file_format")
+        if file_format:
+            file_format = file_format.upper()
+            if file_format not in TaskImport.FileFormat.values:
+                raise ValidationError(
+                    detail={
+                        "message": (
+                            f"Unknown file_format '{file_format}'. Allowed "
+                            f"formats are "
+                            f"{', '.join(TaskImport.FileFormat.values)}"
+                        )
+                    }
+                )
+            return file_format
+        if content_type_format:
+            return content_type_format
+        extension = os.path.splitext(file_name or '')[1].lower()
+        if extension in EXTENSION_FORMATS:
+            return EXTENSION_FORMATS[extension]
+        raise ValidationError(
+            detail={
+                "message": (
+                    "The format of the file is unknown, send it as text/csv "
+                    "or application/x-ndjson or set the file_format param"
+                )
+            }
+        )
+
+    def get_upload(self):
+        """
+        Return (file format, iterable of the chunks of the uploaded file).
+        """
+        request = self.request
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type == 'multipart/form-data':
+            # Large files are written to a temporary file instead of memory
+            request.upload_handlers = [TemporaryFileUploadHandler()]
+            uploaded_file = request.FILES.get('file')
+            if uploaded_file is None:
+                raise ValidationError(
+                    detail={"message": "The file field is required"}
+                )
+            return (
+                self.get_file_format(None, uploaded_file.name),
+                uploaded_file.chunks(),
+            )
+
+        file_format = self.get_file_format(
+            CONTENT_TYPE_FORMATS.get(content_type)
+        )
+        stream = request.stream
+        if stream is None:
+            raise ValidationError(
+                detail={"message": "The request body is empty"}
+            )
+        return file_format, iter(
+            lambda: stream.read(self.upload_chunk_size), b''
+        )
+
+    def create(self, request, *args, **kwargs):
+        # A retried upload with the same Idempotency-Key isn't imported
+        # twice, see todos/idempotency.py
+        return run_idempotent(request, self.start_import)
+
+    def start_import(self):
+        request = self.request
+        file_format, chunks = self.get_upload()
+        try:
+            file_path, total_bytes = spool_upload(chunks)
+        except UploadTooLarge as error:
+            raise ValidationError(detail={"message": str(error)})
+
+        with transaction.atomic():
+            task_import = TaskImport.objects.create(
+                created_by=request.user,
+                file_format=file_format,
+                file_path=file_path,
+                total_bytes=total_bytes,
+            )
+            # The job is written in the same transaction, so the workers
+            # only see it once the import record is committed
+            task_import.job = import_tasks_job.enqueue(
+                kwargs={"task_import_id": task_import.id},
+                idempotency_key=f"todos.import_tasks:{task_import.uuid}",
+            )
+            task_import.save(update_fields=['job'])
+
+        serializer = self.get_serializer(task_import)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    def get_renderer_context(self):
+        context = super().get_renderer_context()
+        if self.action in self.response_data:
+            context["message"] = (
+                self.response_data.get(self.action).get("message")
+            )
+            context["status_code"] = (
+                self.response_data.get(self.action).get("status_code")
+            )
+        return context
+
+
+# |============================== Task export APIs ========================| #
+class TaskExportViewset(
+    ListModelMixin, CreateModelMixin, RetrieveModelMixin, GenericViewSet
+):
+    """
+    Exports of all the tasks, with their tags and creators, to a gzipped
+    NDJSON or columnar file, see todos/exports.py.
+
+    POST /tasks/exports/ {"file_format": "NDJSON_GZ" | "COLUMNAR"} queues
+    the export (202), its status and progress are polled with
+    GET /tasks/exports/<uuid> and the finished file is downloaded from
+    GET /tasks/exports/<uuid>/download, which supports Range requests to
+    resume interrupted downloads.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = "task_exports"
+    serializer_class = TaskExportSerializer
+    pagination_class = TaskPagination
+    renderer_classes = get_api_renderer_classes()
+    parser_classes = get_api_parser_classes()
+
+    # The message that will be added in the response for each action in the
+    # Viewset
+    response_data = {
+        "list": {
+            "message": "List of task export records",
+            "status_code": status.HTTP_200_OK
+        },
+        "retrieve": {
+            "message": "Requested task export record retrieved",
+            "status_code": status.HTTP_200_OK
+        },
+        "create": {
+            "message": "Task export queued",
+            "status_code": status.HTTP_202_ACCEPTED
+        }
+    }
+
+    def get_object(self):
+        task_export = get_object_or_404(
+            klass=self.get_queryset(),
+            uuid=self.kwargs.get("uuid")
+        )
+        return task_export
+
+    def get_queryset(self, *args, **kwargs):
+        queryset = (
+            TaskExport.objects
+            .filter(created_by=self.request.user)
+            .select_related('job')
+            .order_by('-id')
+        )
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        # The exports read the default database, see todos/exports.py
+        refuse_when_sharded("The task exports")
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            task_export = serializer.save(created_by=request.user)
+            # The job is written in the same transaction, so the workers
+            # only see it once the export record is committed
+            task_export.job = export_tasks_job.enqueue(
+                kwargs={"task_export_id": task_export.id},
+                idempotency_key=f"todos.export_tasks:{task_export.uuid}",
+            )
+            task_export.save(update_fields=['job'])
+        return Response(
+            self.get_serializer(task_export).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    def perform_content_negotiation(self, request, force=False):
+        # The file is served whatever the Accept header of a download
+        return super().perform_content_negotiation(
+            request, force=force or self.action == "download"
+        )
+
+    def download(self, request, *args, **kwargs):
+        task_export = self.get_object()
+        if task_export.status != TaskExport.Status.SUCCEEDED:
+            raise ValidationError(
+                detail={
+                    "message": (
+                        f"The export is {task_export.status.lower()}, it can "
+                        f"only be downloaded once it has succeeded"
+                    )
+                }
+            )
+        try:
+            return ranged_file_response(
+                request,
+                task_export.file_path,
+                content_type="application/gzip",
+                filename=get_export_file_name(task_export),
+                # The file never changes once the export has succeeded
+                etag=f"{task_export.uuid}-{task_export.file_size}",
+            )
+        except FileNotFoundError:
+            raise Gone(
+                detail={"message": "The file of the export was deleted"}
+            )
+
+    def get_renderer_context(self):
+        context = super().get_renderer_context()
+        if self.action in self.response_data:
+            context["message"] = (
+                self.response_data.get(self.action).get("message")
+            )
+            context["status_code"] = (
+                self.response_data.get(self.action).get("status_code")
+            )
+        return context
+
+
+# |================================= Query APIs ===========================| #
+class TaskQueryViewset(GenericViewSet):
+    """
+    Read only nested queries over the tasks, their tags and their creators,
+    see todos/graph.py for the syntax.
+
+    POST /query/ {"query": {"tasks": {"args": {...}, "fields": [...]}}}
+    returns {"tasks": [...]}. All the records of a level are loaded by
+    batched loaders, so a query costs the same number of SQL queries
+    whatever the number of records it returns.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = "query"
+    renderer_classes = get_api_renderer_classes()
+    parser_classes = get_api_parser_classes()
+
+    response_data = {
+        "query": {
+            "message": "Query result",
+            "status_code": status.HTTP_200_OK
+        },
+    }
+
+    def query(self, request, *args, **kwargs):
+        try:
+            query = Query(
+                request.data.get("query")
+                if isinstance(request.data, dict) else None
+            )
+            # The filters of the roots are only parsed when they run
+            data = query.run()
+        except QueryError as error:
+            raise ValidationError(detail={"message": str(error)})
+        return Response(data)
+
+    def get_renderer_context(self):
+        context = super().get_renderer_context()
+        if self.action in self.response_data:
+            context["message"] = (
+                self.response_data.get(self.action).get("message")
+            )
+            context["status_code"] = (
+                self.response_data.get(self.action).get("status_code")
+            )
+        return context
+
+
+# |================================= Stats APIs ===========================| #
+class TaskStatViewset(GenericViewSet):
+    """
+    Task counts grouped by user, completion status, tag and creation
+    day/week.
+    The counts are read from the materialized TaskStat & TaskTagStat tables,
+    so the cost of a request depends on the number of groups and not on the
+    number of tasks. The counts filtered by tags are the sums of the counts
+    of each tag, a task having several of the tags is counted once per tag.
+
+    Query params:
+        group_by: comma separated list of created_by, completion_status, tag,
+            day and week. Defaults to created_by,completion_status
+        created_by: comma separated user ids
+        completion_status: comma separated completion statuses
+        tags: comma separated tag uuids, a task is counted once per tag it
+            has among them
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = "stats"
+    # Queries per action, see core/query_budget.py
+    query_budget = {"list": 4}
+    renderer_classes = get_api_renderer_classes()
+
+    response_data = {
+        "list": {
+            "message": "Task counts",
+            "status_code": status.HTTP_200_OK
+        },
+    }
+
+    # group_by key -> (lookup in the stats tables, key in the response)
+    group_by_fields = {
+        "created_by": "created_by_id",
+        "completion_status": "completion_status",
+        "tag": "tag__uuid",
+        "day": "created_day",
+        "week": "created_week",
+    }
+    default_group_by = "created_by,completion_status"
+
+    def get_group_by(self):
+        group_by = (
+            self.request.query_params.get("group_by") or self.default_group_by
+        ).split(',')
+        invalid_keys = set(group_by) - set(self.group_by_fields)
+        if invalid_keys:
+            raise ValidationError(
+                detail={
+                    "message": (
+                        f"Invalid group_by keys: "
+                        f"{', '.join(sorted(invalid_keys))}. Allowed keys "
+                        f"are {', '.join(self.group_by_fields)}"
+                    )
+                }
+            )
+        if "day" in group_by and "week" in group_by:
+            raise ValidationError(
+                detail={"message": "Group by either day or week, not both"}
+            )
+        return group_by
+
+    def get_filters(self):
+        serializer = TaskStatFilterSerializer.from_query_params(
+            self.request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def get_queryset(self, group_by, filters):
+        # A task with several tags has one row per tag in TaskTagStat, so it
+        # can only be used when the counts are split or filtered by tag
+        if "tag" in group_by or filters.get("tags"):
+            queryset = TaskTagStat.objects.all()
+        else:
+            queryset = TaskStat.objects.all()
+
+        if filters.get("created_by"):
+            queryset = queryset.filter(created_by_id__in=filters["created_by"])
+        if filters.get("completion_status"):
+            queryset = queryset.filter(
+                completion_status__in=filters["completion_status"]
+            )
+        if filters.get("tags"):
+            queryset = queryset.filter(tag__uuid__in=filters["tags"])
+        if "week" in group_by:
+            queryset = queryset.annotate(
+                created_week=TruncWeek("created_day")
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        group_by = self.get_group_by()
+        filters = self.get_filters()
+        lookups = [self.group_by_fields[key] for key in group_by]
+        rows = (
+            self.get_queryset(group_by, filters)
+            .values(*lookups)
+            .annotate(task_count=Sum("task_count"))
+            .order_by(*lookups)
+        )
+        data = [
+            {
+                **{key: row[lookup] for key, lookup in zip(group_by, lookups)},
+                "task_count": row["task_count"],
+            }
+            for row in rows
+        ]
+        return Response(data)
+
     def get_renderer_context(self):
         context = super().get_renderer_context()
         if self.action in self.response_data:
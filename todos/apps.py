@@ -1,6 +1,33 @@
+import os
+
 from django.apps import AppConfig
 
 
 class TodosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'todos'
+
+    def ready(self):
+        # Connect the signal handlers and register the system checks
+        from todos import checks, signals  # noqa: F401
+        from todos.sharding import get_shard_settings, is_sharded
+
+        if is_sharded():
+            # SQLite creates the shard files but not their directory
+            os.makedirs(get_shard_settings()["DIR"], exist_ok=True)
+
+    def warm_up(self):
+        """
+        Build the state that is otherwise built on the first requests of a
+        worker, see core/warmup.py.
+        """
+        from todos.task_index import get_task_index
+        from todos.vocabulary import get_tag_vocabulary
+
+        # The field caches of the models' _meta, shared by the serializers
+        # and the filtersets (which rebuild their own fields every request)
+        for model in self.get_models():
+            model._meta.get_fields()
+        # Read from the database, last
+        get_tag_vocabulary()
+        get_task_index(wait=True)
@@ -0,0 +1,40 @@
+"""
+System checks of the todos app.
+"""
+from django.conf import settings
+from django.core import checks
+
+from todos.sharding import get_shard_count, is_sharded
+
+# The API versions whose task views read the default database only
+DEFAULT_DATABASE_API_VERSIONS = ('v1', 'v2', 'v3')
+
+
+@checks.register()
+def check_sharded_api_versions(app_configs, **kwargs):
+    """
+    The v1 to v3 task APIs would list the tasks of the default database,
+    which is emptied by `rebalance_shards --from-default`.
+    """
+    if not is_sharded():
+        return []
+    api_versions = [
+        version for version in getattr(
+            settings, 'API_VERSIONS', ['v1', 'v2', 'v3', 'v4']
+        )
+        if version in DEFAULT_DATABASE_API_VERSIONS
+    ]
+    if not api_versions:
+        return []
+    return [
+        checks.Error(
+            f"The {', '.join(api_versions)} task APIs read the tasks of the "
+            f"default database, but TASK_SHARDS['COUNT'] is "
+            f"{get_shard_count()} and the tasks live in the shards",
+            hint=(
+                "Remove them from API_VERSIONS, meanwhile their task "
+                "endpoints return 400"
+            ),
+            id='todos.E001',
+        )
+    ]
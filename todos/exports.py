@@ -0,0 +1,262 @@
+"""
+Exports of the tasks, with their tags and creators, to compressed files.
+
+An export is run by the `todos.export_tasks` background job. The tasks are
+read in chunks of TASK_EXPORTS["CHUNK_SIZE"] with keyset pagination
+(`WHERE id > <last exported id> ORDER BY id LIMIT n`), so every chunk costs
+the same whatever its position, and only the tasks existing when the export
+started (id <= max_task_id) are exported.
+
+Every chunk is appended to the file as its own gzip member, a gzip file
+made of several members decompresses to the concatenation of their data.
+The file is fsynced before the position of the export (last_task_id,
+file_size) is committed, so a job run again after a crash truncates the
+file to the last committed chunk and resumes from there.
+
+Formats:
+    NDJSON_GZ: one JSON object per task
+    COLUMNAR: one JSON object per chunk, holding one list of values per
+        column ({"row_count": n, "columns": {"uuid": [...], ...}}), like
+        the row groups of Parquet. Analysts load a column without parsing
+        the other ones.
+
+The tasks are read from the default database: the exports are refused when
+the tasks are sharded (see todos/sharding.py).
+"""
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from todos.models import Task, TaskExport
+from todos.sharding import is_sharded
+
+DEFAULT_SETTINGS = {
+    "DIR": os.path.join(settings.BASE_DIR, "spool", "task_exports"),
+    "CHUNK_SIZE": 5000,
+    "COMPRESS_LEVEL": 6,
+}
+
+TASK_FIELDS = (
+    'id', 'uuid', 'title', 'text', 'completion_status', 'created_date',
+    'modified_date', 'created_by_id',
+)
+
+# The columns of the COLUMNAR format, in order
+COLUMNS = (
+    'uuid', 'title', 'text', 'completion_status', 'created_date',
+    'modified_date', 'created_by_id', 'created_by_username', 'tag_uuids',
+    'tag_names',
+)
+
+FILE_EXTENSIONS = {
+    TaskExport.FileFormat.NDJSON_GZ: "ndjson.gz",
+    TaskExport.FileFormat.COLUMNAR: "columnar.jsonl.gz",
+}
+
+
+def get_export_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_EXPORTS", {}))
+    return config
+
+
+def get_export_file_name(task_export):
+    return (
+        f"tasks-{task_export.uuid}."
+        f"{FILE_EXTENSIONS[task_export.file_format]}"
+    )
+
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+class TaskExporter:
+
+    def __init__(self, task_export):
+        self.task_export = task_export
+        self.config = get_export_settings()
+        self.usernames = {}
+
+    # |----------------------------- Reading ------------------------------| #
+    def get_chunk(self):
+        """
+        Return the next chunk of tasks as dicts, with their tags and the
+        username of their creator.
+        """
+        task_export = self.task_export
+        tasks = list(
+            Task.objects
+            .filter(
+                id__gt=task_export.last_task_id,
+                id__lte=task_export.max_task_id,
+            )
+            .order_by('id')
+            .values(*TASK_FIELDS)[:self.config["CHUNK_SIZE"]]
+        )
+        if not tasks:
+            return tasks
+
+        tags_by_task = {task['id']: [] for task in tasks}
+        through_rows = (
+            Task.tags.through.objects
+            .filter(
+                task_id__in=tags_by_task, tag__deleted_at__isnull=True
+            )
+            .order_by('task_id', 'tag_id')
+            .values_list('task_id', 'tag__uuid', 'tag__name')
+        )
+        for task_id, tag_uuid, tag_name in through_rows:
+            tags_by_task[task_id].append((tag_uuid, tag_name))
+
+        # The creators are few compared to the tasks, they are cached
+        missing_user_ids = {
+            task['created_by_id'] for task in tasks
+        } - self.usernames.keys()
+        if missing_user_ids:
+            self.usernames.update(
+                User.objects
+                .filter(id__in=missing_user_ids)
+                .values_list('id', 'username')
+            )
+
+        for task in tasks:
+            tags = tags_by_task[task['id']]
+            task['created_by_username'] = self.usernames.get(
+                task['created_by_id']
+            )
+            task['tag_uuids'] = [tag_uuid for tag_uuid, _ in tags]
+            task['tag_names'] = [tag_name for _, tag_name in tags]
+        return tasks
+
+    # |----------------------------- Encoding -----------------------------| #
+    def encode_ndjson(self, tasks):
+        return ''.join(
+            dumps({
+                "uuid": task['uuid'],
+                "title": task['title'],
+                "text": task['text'],
+                "completion_status": task['completion_status'],
+                "created_date": task['created_date'],
+                "modified_date": task['modified_date'],
+                "created_by": {
+                    "id": task['created_by_id'],
+                    "username": task['created_by_username'],
+                },
+                "tags": [
+                    {"uuid": tag_uuid, "name": tag_name}
+                    for tag_uuid, tag_name in zip(
+                        task['tag_uuids'], task['tag_names']
+                    )
+                ],
+            }) + '\n'
+            for task in tasks
+        )
+
+    def encode_columnar(self, tasks):
+        return dumps({
+            "row_count": len(tasks),
+            "columns": {
+                column: [task[column] for task in tasks]
+                for column in COLUMNS
+            },
+        }) + '\n'
+
+    def encode_chunk(self, tasks):
+        if self.task_export.file_format == TaskExport.FileFormat.COLUMNAR:
+            data = self.encode_columnar(tasks)
+        else:
+            data = self.encode_ndjson(tasks)
+        return gzip.compress(
+            data.encode(), compresslevel=self.config["COMPRESS_LEVEL"]
+        )
+
+    # |----------------------------- Writing ------------------------------| #
+    def write_chunk(self, tasks):
+        task_export = self.task_export
+        data = self.encode_chunk(tasks)
+        with open(task_export.file_path, 'r+b') as export_file:
+            # Drop what a crashed run wrote after the last committed chunk
+            export_file.truncate(task_export.file_size)
+            export_file.seek(task_export.file_size)
+            export_file.write(data)
+            export_file.flush()
+            os.fsync(export_file.fileno())
+
+        with transaction.atomic():
+            task_export.last_task_id = tasks[-1]['id']
+            task_export.row_count += len(tasks)
+            task_export.chunk_count += 1
+            task_export.file_size += len(data)
+            task_export.save(update_fields=[
+                'last_task_id', 'row_count', 'chunk_count', 'file_size',
+            ])
+
+    def start(self):
+        task_export = self.task_export
+        update_fields = ['status']
+        task_export.status = TaskExport.Status.RUNNING
+        if task_export.started_date is None:
+            # The first run fixes the tasks which are exported
+            config = self.config
+            os.makedirs(config["DIR"], exist_ok=True)
+            task_export.file_path = os.path.join(
+                config["DIR"], get_export_file_name(task_export)
+            )
+            open(task_export.file_path, 'wb').close()
+            task_export.started_date = timezone.now()
+            task_export.max_task_id = (
+                Task.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+            )
+            task_export.total_rows = Task.objects.filter(
+                id__lte=task_export.max_task_id
+            ).count()
+            update_fields += [
+                'file_path', 'started_date', 'max_task_id', 'total_rows'
+            ]
+        task_export.save(update_fields=update_fields)
+
+    def run(self):
+        self.start()
+        while tasks := self.get_chunk():
+            self.write_chunk(tasks)
+
+        task_export = self.task_export
+        task_export.status = TaskExport.Status.SUCCEEDED
+        task_export.finished_date = timezone.now()
+        task_export.save(update_fields=['status', 'finished_date'])
+
+
+def export_tasks(task_export_id):
+    task_export = TaskExport.objects.get(id=task_export_id)
+    if task_export.status in (
+        TaskExport.Status.SUCCEEDED, TaskExport.Status.FAILED
+    ):
+        return
+    if is_sharded():
+        # The default database holds no tasks once they are sharded, an
+        # empty file would be reported as a successful export
+        task_export.status = TaskExport.Status.FAILED
+        task_export.failure = (
+            "The task exports aren't available when the tasks are sharded"
+        )
+        task_export.finished_date = timezone.now()
+        task_export.save(
+            update_fields=['status', 'failure', 'finished_date']
+        )
+        return
+    try:
+        TaskExporter(task_export).run()
+    except Exception as error:
+        # The job is retried and resumes after the last written chunk
+        TaskExport.objects.filter(id=task_export.id).update(
+            failure=f"{type(error).__name__}: {error}"
+        )
+        raise
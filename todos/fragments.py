@@ -0,0 +1,169 @@
+"""
+Cache of the JSON encoded tasks of the list pages.
+
+A list page is serialized and encoded as a whole, although most of its
+tasks didn't change since the last time they were listed. Each task of a
+page is kept encoded in the cache, as the JSON bytes of its TaskSerializer
+data, under the key (uuid, modified_date, SERIALIZER_VERSION). The page is
+assembled from the cached fragments, spliced into the response envelope by
+CustomRenderer (see core.renderers.JSONFragments), and only the tasks whose
+fragment is missing or stale are loaded (tags and creator), serialized and
+encoded again.
+
+Every write of a task changes its modified_date, and so its key. The
+fragments also hold what belongs to other records, they are deleted when:
+    - a tag is renamed or deleted, for the tasks of the tag (`tag.tasks`)
+    - a user is renamed, for the tasks it created
+    - the tags of a task change without a save of the task
+A fragment is rendered in a language, with a completion status (a toggle
+may be buffered, see todos/toggles.py): a fragment of another language or
+status is stale.
+
+Bump SERIALIZER_VERSION when TaskSerializer changes, the fragments of the
+previous version are left to expire.
+
+The fragments are deleted from the CACHE of the process which made the
+change: with several processes, the cache must be shared by them (e.g.
+memcached or redis), the default local memory cache is not.
+
+Settings (TASK_FRAGMENTS):
+    ENABLED: serve the JSON list pages from the fragments
+    CACHE: alias of the cache (see CACHES) holding the fragments
+    TIMEOUT: seconds a fragment is kept
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import translation
+
+from core.renderers import CustomRenderer
+from todos.models import Task
+from todos.read_models import load_task_related
+from todos.serializers import TaskSerializer
+from todos.sharding import get_task_databases
+
+DEFAULT_SETTINGS = {
+    "ENABLED": False,
+    "CACHE": "default",
+    "TIMEOUT": 24 * 3600,
+}
+
+# Version of the TaskSerializer output held by the fragments
+SERIALIZER_VERSION = 1
+
+
+def get_fragment_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_FRAGMENTS", {}))
+    return config
+
+
+def is_fragment_cache_enabled():
+    return get_fragment_settings()["ENABLED"]
+
+
+def get_fragment_cache():
+    return caches[get_fragment_settings()["CACHE"]]
+
+
+def get_fragment_key(uuid, modified_date):
+    return (
+        f"task_fragment:{SERIALIZER_VERSION}:{uuid}:"
+        f"{modified_date.timestamp():.6f}"
+    )
+
+
+def can_use_fragments(request):
+    """
+    True when the list page is encoded by CustomRenderer: the binary
+    renderers encode the UUIDs and dates natively.
+    """
+    return is_fragment_cache_enabled() and isinstance(
+        getattr(request, "accepted_renderer", None), CustomRenderer
+    )
+
+
+# |================================ Reading ===============================| #
+def get_task_fragments(task_rows, context):
+    """
+    Return the JSON fragments of the TaskRow read models, loaded without
+    their tags and creators (see as_task_rows), in their order.
+    """
+    config = get_fragment_settings()
+    cache = caches[config["CACHE"]]
+    language = translation.get_language()
+    keys = [
+        get_fragment_key(task_row.uuid, task_row.modified_date)
+        for task_row in task_rows
+    ]
+    cached = cache.get_many(keys)
+
+    fragments = []
+    missing = []
+    for index, (task_row, key) in enumerate(zip(task_rows, keys)):
+        stamp, fragment = cached.get(key, (None, None))
+        if stamp != (language, task_row.completion_status):
+            missing.append(index)
+        fragments.append(fragment)
+    if not missing:
+        return fragments
+
+    missing_rows = [task_rows[index] for index in missing]
+    load_task_related(missing_rows)
+    renderer = CustomRenderer()
+    rendered = {}
+    for index, item in zip(
+        missing, TaskSerializer(missing_rows, many=True, context=context).data
+    ):
+        task_row = task_rows[index]
+        fragments[index] = renderer.encode_fragment(item)
+        rendered[keys[index]] = (
+            (language, task_row.completion_status), fragments[index]
+        )
+    cache.set_many(rendered, timeout=config["TIMEOUT"])
+    return fragments
+
+
+# |============================= Invalidation =============================| #
+def delete_task_fragments(stamps, using=None):
+    """
+    Delete the fragments of the tasks given as (uuid, modified_date) once
+    the transaction is committed.
+    """
+    keys = [get_fragment_key(*stamp) for stamp in stamps]
+    if keys and is_fragment_cache_enabled():
+        transaction.on_commit(
+            lambda: get_fragment_cache().delete_many(keys), using=using
+        )
+
+
+def get_task_stamps(queryset):
+    return list(queryset.values_list("uuid", "modified_date"))
+
+
+def delete_tag_fragments(tag, using=None):
+    """
+    Delete the fragments of the tasks of the tag, on every task database,
+    once the change of the tag written to `using` is committed.
+    """
+    if not is_fragment_cache_enabled():
+        return
+    stamps = []
+    for task_database in get_task_databases():
+        stamps += get_task_stamps(tag.tasks.using(task_database))
+    delete_task_fragments(stamps, using=using)
+
+
+def delete_user_fragments(user, using=None):
+    """
+    Delete the fragments of the tasks created by the user, once the change
+    of the user written to `using` is committed.
+    """
+    if not is_fragment_cache_enabled():
+        return
+    stamps = []
+    for task_database in get_task_databases():
+        stamps += get_task_stamps(
+            Task.objects.using(task_database).filter(created_by_id=user.pk)
+        )
+    delete_task_fragments(stamps, using=using)
@@ -0,0 +1,626 @@
+"""
+Nested read queries over the tasks, their tags and their creators.
+
+A query selects the fields to return, nested like the selections of a
+GraphQL query but written as JSON:
+
+    {
+        "tasks": {
+            "args": {"completion_status": "INCOMPLETE", "page_size": 20},
+            "fields": [
+                "uuid", "title",
+                {"created_by": ["id", "username"]},
+                {"tags": ["uuid", "name", "task_counts"]}
+            ]
+        }
+    }
+
+A selected field is either its name, {name: [fields]} or
+{name: {"args": {...}, "fields": [...]}} for the object fields and the
+fields taking arguments.
+
+Each level of the result is loaded by batched loaders: the creators of all
+the tasks of a level are read with one query, their tags with two, the task
+counts of all the tags with one, and so on. The number of queries depends on
+the query and not on the number of records returned.
+
+Queries are checked before they run: they can't be nested deeper than
+GRAPH_QUERY["MAX_DEPTH"] levels, and their cost, an estimate of the number
+of records they load, can't exceed GRAPH_QUERY["MAX_COST"]. The lists are
+estimated with their page_size/first argument, the tags of a task with
+GRAPH_QUERY["TAGS_PER_TASK"].
+"""
+import abc
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+
+from todos.api.v2.filters import TaskFilter
+from todos.models import Tag, Task, TaskTagStat
+from todos.sharding import is_sharded
+
+DEFAULT_SETTINGS = {
+    "MAX_DEPTH": 5,
+    "MAX_COST": 5000,
+    "DEFAULT_PAGE_SIZE": 20,
+    "MAX_PAGE_SIZE": 100,
+    "TAGS_PER_TASK": 10,
+}
+
+
+def get_graph_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "GRAPH_QUERY", {}))
+    return config
+
+
+class QueryError(Exception):
+    """
+    The query is invalid or too expensive.
+    """
+
+
+def get_first_per_partition(queryset, partition_by, order_by, first, columns):
+    """
+    Return the given columns of the first `first` rows of the queryset for
+    each value of partition_by, with a single query.
+    The rows are numbered with ROW_NUMBER() OVER (PARTITION BY ...) in a
+    subquery and filtered outside of it, Django can't filter on a window
+    function.
+    """
+    ranked = queryset.annotate(
+        row_number=Window(
+            RowNumber(), partition_by=F(partition_by), order_by=order_by
+        )
+    ).values_list(*columns, 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    with connections[ranked.db].cursor() as cursor:
+        cursor.execute(
+            f'SELECT * FROM ({sql}) ranked WHERE ranked.row_number <= %s',
+            (*params, first)
+        )
+        return [row[:-1] for row in cursor.fetchall()]
+
+
+# |================================ Loaders ===============================| #
+# A loader loads a relation for all the rows of a level.
+# loader(rows, columns, args) -> {row id: related row or list of rows}
+def load_task_creators(rows, columns, args):
+    users = {
+        user['id']: user
+        for user in User.objects.filter(
+            id__in={row['created_by_id'] for row in rows}
+        ).values(*columns)
+    }
+    return {row['id']: users.get(row['created_by_id']) for row in rows}
+
+
+def load_task_tags(rows, columns, args):
+    through_rows = list(
+        Task.tags.through.objects
+        .filter(
+            task_id__in=[row['id'] for row in rows],
+            tag__deleted_at__isnull=True,
+        )
+        .order_by('task_id', 'tag_id')
+        .values_list('task_id', 'tag_id')
+    )
+    tags = {
+        tag['id']: tag
+        for tag in Tag.objects.filter(
+            id__in={tag_id for _, tag_id in through_rows}
+        ).values(*columns)
+    }
+    tags_by_task = defaultdict(list)
+    for task_id, tag_id in through_rows:
+        tags_by_task[task_id].append(tags[tag_id])
+    return {row['id']: tags_by_task[row['id']] for row in rows}
+
+
+def load_tasks_by(rows, task_ids_by_row, columns):
+    tasks = {
+        task['id']: task
+        for task in Task.objects.filter(
+            id__in={
+                task_id
+                for task_ids in task_ids_by_row.values()
+                for task_id in task_ids
+            }
+        ).values(*columns)
+    }
+    return {
+        row['id']: [tasks[task_id] for task_id in task_ids_by_row[row['id']]]
+        for row in rows
+    }
+
+
+def load_tag_tasks(rows, columns, args):
+    """
+    The last `first` tasks of every tag.
+    """
+    task_ids_by_tag = defaultdict(list)
+    for tag_id, task_id in get_first_per_partition(
+        Task.tags.through.objects.filter(
+            tag_id__in=[row['id'] for row in rows],
+            task__deleted_at__isnull=True,
+        ),
+        partition_by='tag_id',
+        order_by=F('task_id').desc(),
+        first=args['first'],
+        columns=('tag_id', 'task_id'),
+    ):
+        task_ids_by_tag[tag_id].append(task_id)
+    return load_tasks_by(rows, task_ids_by_tag, columns)
+
+
+def load_user_tasks(rows, columns, args):
+    """
+    The last `first` tasks created by every user.
+    """
+    task_ids_by_user = defaultdict(list)
+    for user_id, task_id in get_first_per_partition(
+        Task.objects.filter(created_by_id__in=[row['id'] for row in rows]),
+        partition_by='created_by_id',
+        order_by=F('id').desc(),
+        first=args['first'],
+        columns=('created_by_id', 'id'),
+    ):
+        task_ids_by_user[user_id].append(task_id)
+    return load_tasks_by(rows, task_ids_by_user, columns)
+
+
+def load_tag_task_counts(rows):
+    """
+    {tag id: {completion status: task count}}, read from the materialized
+    TaskTagStat table.
+    """
+    task_counts = {
+        row['id']: dict.fromkeys(Task.CompletionStatus.values, 0)
+        for row in rows
+    }
+    stats = (
+        TaskTagStat.objects
+        .filter(tag_id__in=task_counts)
+        .values_list('tag_id', 'completion_status')
+        .annotate(task_count=Sum('task_count'))
+        .order_by()
+    )
+    for tag_id, completion_status, task_count in stats:
+        task_counts[tag_id][completion_status] = task_count
+    return task_counts
+
+
+# |================================ Schema ================================| #
+class ScalarField:
+
+    def __init__(self, column):
+        self.column = column
+
+
+class ComputedField:
+    """
+    A value computed for all the rows of a level, load(rows) -> {id: value}.
+    """
+
+    def __init__(self, load):
+        self.load = load
+
+
+class RelationField:
+    """
+    key: the column of the rows the relation is loaded from
+    many: whether the relation is a list, of at most `first` records when
+        paginated, or of GRAPH_QUERY[estimate_setting] records on average
+    """
+
+    def __init__(
+        self, type_name, load, key='id', many=False, paginated=False,
+        estimate_setting=None
+    ):
+        self.type_name = type_name
+        self.load = load
+        self.key = key
+        self.many = many
+        self.paginated = paginated
+        self.estimate_setting = estimate_setting
+
+    def get_args(self, args, config):
+        unknown_args = set(args) - ({'first'} if self.paginated else set())
+        if unknown_args:
+            raise QueryError(
+                f"Unknown arguments: {', '.join(sorted(unknown_args))}"
+            )
+        if not self.paginated:
+            return {}
+        return {'first': get_page_size(args.get('first'), 'first', config)}
+
+    def get_estimate(self, args, config):
+        if not self.many:
+            return 1
+        if self.paginated:
+            return args['first']
+        return config[self.estimate_setting]
+
+
+SCHEMA = {
+    "Task": {
+        "uuid": ScalarField('uuid'),
+        "title": ScalarField('title'),
+        "text": ScalarField('text'),
+        "completion_status": ScalarField('completion_status'),
+        "created_date": ScalarField('created_date'),
+        "modified_date": ScalarField('modified_date'),
+        "version": ScalarField('version'),
+        "created_by": RelationField(
+            "User", load_task_creators, key='created_by_id'
+        ),
+        "tags": RelationField(
+            "Tag", load_task_tags, many=True, estimate_setting="TAGS_PER_TASK"
+        ),
+    },
+    "Tag": {
+        "uuid": ScalarField('uuid'),
+        "name": ScalarField('name'),
+        "task_counts": ComputedField(load_tag_task_counts),
+        "tasks": RelationField(
+            "Task", load_tag_tasks, many=True, paginated=True
+        ),
+    },
+    "User": {
+        "id": ScalarField('id'),
+        "username": ScalarField('username'),
+        "first_name": ScalarField('first_name'),
+        "last_name": ScalarField('last_name'),
+        "tasks": RelationField(
+            "Task", load_user_tasks, many=True, paginated=True
+        ),
+    },
+}
+
+
+# |================================ Parsing ===============================| #
+class Selection:
+    """
+    A selected field with its arguments and, for the relations, the
+    selected fields of the related records.
+    """
+    __slots__ = ("name", "field", "args", "children")
+
+    def __init__(self, name, field, args=None, children=()):
+        self.name = name
+        self.field = field
+        self.args = args or {}
+        self.children = children
+
+
+def get_page_size(value, name, config):
+    if value is None:
+        return config["DEFAULT_PAGE_SIZE"]
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} must be an integer")
+    if not 1 <= value <= config["MAX_PAGE_SIZE"]:
+        raise QueryError(
+            f"{name} must be between 1 and {config['MAX_PAGE_SIZE']}"
+        )
+    return value
+
+
+def split_field(item):
+    """
+    Return (name, args, fields) of a selected field.
+    """
+    if isinstance(item, str):
+        return item, {}, None
+    if not isinstance(item, dict) or len(item) != 1:
+        raise QueryError(
+            "A selected field is a name or an object with a single key"
+        )
+    (name, value), = item.items()
+    if isinstance(value, list):
+        return name, {}, value
+    if isinstance(value, dict):
+        args = value.get("args") or {}
+        if not isinstance(args, dict):
+            raise QueryError(f"The args of {name} must be an object")
+        return name, args, value.get("fields")
+    raise QueryError(
+        f"The value of {name} must be a list of fields or an object"
+    )
+
+
+def parse_fields(type_name, fields, depth, config):
+    """
+    Return the Selections of the given type, checking the fields and the
+    depth of the query.
+    """
+    if depth > config["MAX_DEPTH"]:
+        raise QueryError(
+            f"The query is nested deeper than {config['MAX_DEPTH']} levels"
+        )
+    if not isinstance(fields, list) or not fields:
+        raise QueryError(f"Select at least one field of {type_name}")
+    type_fields = SCHEMA[type_name]
+    selections = {}
+    for item in fields:
+        name, args, children = split_field(item)
+        field = type_fields.get(name)
+        if field is None:
+            raise QueryError(
+                f"{type_name} has no field '{name}'. Its fields are "
+                f"{', '.join(type_fields)}"
+            )
+        if isinstance(field, RelationField):
+            if children is None:
+                raise QueryError(
+                    f"Select the fields of {name} ({field.type_name})"
+                )
+            selections[name] = Selection(
+                name, field,
+                args=field.get_args(args, config),
+                children=parse_fields(
+                    field.type_name, children, depth + 1, config
+                )
+            )
+        else:
+            if args or children is not None:
+                raise QueryError(f"{type_name}.{name} has no fields or args")
+            selections[name] = Selection(name, field)
+    return list(selections.values())
+
+
+def get_cost(selections, count, config):
+    """
+    Estimate the number of records loaded for the selections of `count`
+    records.
+    """
+    cost = 0
+    for selection in selections:
+        field = selection.field
+        if isinstance(field, RelationField):
+            related_count = count * field.get_estimate(selection.args, config)
+            cost += related_count + get_cost(
+                selection.children, related_count, config
+            )
+        elif isinstance(field, ComputedField):
+            cost += count
+    return cost
+
+
+# |=============================== Resolving ==============================| #
+def get_columns(selections):
+    columns = {'id'}
+    for selection in selections:
+        field = selection.field
+        if isinstance(field, ScalarField):
+            columns.add(field.column)
+        elif isinstance(field, RelationField):
+            columns.add(field.key)
+    return list(columns)
+
+
+def resolve(rows, selections):
+    """
+    Load the relations and computed fields of the selections for all the
+    rows of a level, one loader call per selected field.
+    The loaded values are stored on the rows under the name of the field.
+    """
+    if not rows:
+        return
+    for selection in selections:
+        field = selection.field
+        if isinstance(field, ComputedField):
+            values = field.load(rows)
+            for row in rows:
+                row[selection.name] = values[row['id']]
+        elif isinstance(field, RelationField):
+            related = field.load(
+                rows, get_columns(selection.children), selection.args
+            )
+            # The records related to several rows are resolved once
+            related_rows = {}
+            for value in related.values():
+                for related_row in (value if field.many else [value]):
+                    if related_row is not None:
+                        related_rows[id(related_row)] = related_row
+            resolve(list(related_rows.values()), selection.children)
+            for row in rows:
+                row[selection.name] = related[row['id']]
+
+
+def render(row, selections):
+    if row is None:
+        return None
+    data = {}
+    for selection in selections:
+        field = selection.field
+        if isinstance(field, ScalarField):
+            data[selection.name] = row[field.column]
+        elif isinstance(field, ComputedField):
+            data[selection.name] = row[selection.name]
+        elif field.many:
+            data[selection.name] = [
+                render(related_row, selection.children)
+                for related_row in row[selection.name]
+            ]
+        else:
+            data[selection.name] = render(
+                row[selection.name], selection.children
+            )
+    return data
+
+
+# |================================= Roots ================================| #
+class RootField(abc.ABC):
+    """
+    A field of the query root, listing the records of a type.
+    """
+    type_name = None
+    many = True
+
+    def get_args(self, args, config):
+        args = dict(args)
+        page_size = get_page_size(
+            args.pop("page_size", None), "page_size", config
+        )
+        page = args.pop("page", 1)
+        if not isinstance(page, int) or page < 1:
+            raise QueryError("page must be a positive integer")
+        args.update(page=page, page_size=page_size)
+        return args
+
+    def get_estimate(self, args):
+        return args["page_size"]
+
+    @abc.abstractmethod
+    def get_queryset(self, args):
+        """
+        Return the queryset of the records listed with the checked args,
+        ordered.
+        """
+
+    def load(self, args, columns):
+        offset = (args["page"] - 1) * args["page_size"]
+        return list(
+            self.get_queryset(args)
+            .values(*columns)[offset:offset + args["page_size"]]
+        )
+
+
+class TasksRoot(RootField):
+    """
+    args: the filters of the task list APIs (created_by, tags, tags_any,
+    tags_all, completion_status, ordering), page and page_size
+    """
+    type_name = "Task"
+
+    def get_args(self, args, config):
+        args = super().get_args(args, config)
+        unknown_args = (
+            set(args) - set(TaskFilter.base_filters) - {"page", "page_size"}
+        )
+        if unknown_args:
+            raise QueryError(
+                f"Unknown arguments: {', '.join(sorted(unknown_args))}"
+            )
+        return args
+
+    def get_queryset(self, args):
+        filters = {
+            name: ','.join(map(str, value)) if isinstance(value, list)
+            else str(value)
+            for name, value in args.items()
+            if name in TaskFilter.base_filters
+        }
+        filterset = TaskFilter(data=filters, queryset=Task.objects.all())
+        if not filterset.is_valid():
+            raise QueryError(f"Invalid filters: {dict(filterset.errors)}")
+        try:
+            # The filters and the ordering parse their values, see
+            # todos/api/v2/filters.py
+            return filterset.qs
+        except ValidationError as error:
+            raise QueryError(error.detail["message"])
+
+
+class TagsRoot(RootField):
+    """
+    args: uuids (a list of tag uuids), name, page and page_size
+    """
+    type_name = "Tag"
+
+    def get_args(self, args, config):
+        args = super().get_args(args, config)
+        unknown_args = set(args) - {"uuids", "name", "page", "page_size"}
+        if unknown_args:
+            raise QueryError(
+                f"Unknown arguments: {', '.join(sorted(unknown_args))}"
+            )
+        if "uuids" in args:
+            if not isinstance(args["uuids"], list):
+                raise QueryError("uuids must be a list of tag uuids")
+            try:
+                args["uuids"] = [
+                    uuid.UUID(str(value)) for value in args["uuids"]
+                ]
+            except ValueError:
+                raise QueryError("uuids must be a list of tag uuids")
+        return args
+
+    def get_queryset(self, args):
+        queryset = Tag.objects.order_by('id')
+        if "uuids" in args:
+            queryset = queryset.filter(uuid__in=args["uuids"])
+        if "name" in args:
+            queryset = queryset.filter(name=args["name"])
+        return queryset
+
+
+ROOTS = {
+    "tasks": TasksRoot(),
+    "tags": TagsRoot(),
+}
+
+
+class Query:
+    """
+    A parsed and checked query, run() returns its result.
+    """
+
+    def __init__(self, query, config=None):
+        self.config = config or get_graph_settings()
+        if is_sharded():
+            # The loaders read the default database only
+            raise QueryError(
+                "Nested queries aren't available when the tasks are sharded"
+            )
+        if not isinstance(query, dict) or not query:
+            raise QueryError("The query must be an object of root fields")
+        self.roots = []
+        for name, value in query.items():
+            root = ROOTS.get(name)
+            if root is None:
+                raise QueryError(
+                    f"Unknown root field '{name}'. The root fields are "
+                    f"{', '.join(ROOTS)}"
+                )
+            if not isinstance(value, dict):
+                raise QueryError(
+                    f"{name} must be an object with args and fields"
+                )
+            args = value.get("args") or {}
+            if not isinstance(args, dict):
+                raise QueryError(f"The args of {name} must be an object")
+            args = root.get_args(args, self.config)
+            selections = parse_fields(
+                root.type_name, value.get("fields"), 1, self.config
+            )
+            self.roots.append((name, root, args, selections))
+
+        self.cost = sum(
+            root.get_estimate(args) + get_cost(
+                selections, root.get_estimate(args), self.config
+            )
+            for _, root, args, selections in self.roots
+        )
+        if self.cost > self.config["MAX_COST"]:
+            raise QueryError(
+                f"The estimated cost of the query ({self.cost} records) "
+                f"exceeds the limit of {self.config['MAX_COST']}. Select "
+                f"fewer nested lists or use smaller page sizes"
+            )
+
+    def run(self):
+        data = {}
+        for name, root, args, selections in self.roots:
+            rows = root.load(args, get_columns(selections))
+            resolve(rows, selections)
+            data[name] = [render(row, selections) for row in rows]
+        return data
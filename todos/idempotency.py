@@ -0,0 +1,250 @@
+"""
+Idempotency-Key support of the create endpoints.
+
+Clients retry their POST requests on timeouts, and a retried create adds a
+duplicate record and costs a full validation and save again. A request sent
+with an `Idempotency-Key: <unique key>` header is run once per user and key:
+    - the first request claims the key (an IdempotentRequest row, unique per
+      user and key) and its response is stored once it is done
+    - a request repeating the key gets the stored response, without being
+      run again, with an `Idempotent-Replayed: true` header
+    - a request repeating the key of a request still running gets a 409
+      with a Retry-After header right away, so a burst of retries only runs
+      the request once and doesn't hold a worker each
+    - reusing a key for another request (method, path or body) is a 422
+
+Only the successful (2xx) responses are stored. When the request fails,
+its key is released and the request can be retried with it.
+
+A key is remembered for TTL seconds. A key held for more than LOCK_TIMEOUT
+seconds by a request that never finished (its process died) can be claimed
+again. The key is not written in the transaction of the record it creates,
+so a process dying between the two commits leaves the record without its
+response, and the retry after LOCK_TIMEOUT creates it again.
+
+Settings (IDEMPOTENCY):
+    TTL: seconds a key and its response are kept
+    LOCK_TIMEOUT: seconds after which a request holding a key is
+        considered lost, it must be longer than the slowest create
+    RETRY_AFTER: seconds a repeated request is told to wait for the first
+        one, in its Retry-After header
+    MAX_FINGERPRINT_BODY: bodies larger than this (e.g. task imports) are
+        fingerprinted by their size instead of being read to be hashed, it
+        is capped by DATA_UPLOAD_MAX_MEMORY_SIZE
+"""
+import hashlib
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from core.exceptions import Conflict
+from todos.models import IdempotentRequest
+
+DEFAULT_SETTINGS = {
+    "TTL": 24 * 3600,
+    "LOCK_TIMEOUT": 60.0,
+    "RETRY_AFTER": 1,
+    "MAX_FINGERPRINT_BODY": 1024 * 1024,
+}
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+MAX_KEY_LENGTH = 200
+
+# One claim out of PRUNE_EVERY deletes the expired keys
+PRUNE_EVERY = 1000
+
+
+def get_idempotency_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "IDEMPOTENCY", {}))
+    return config
+
+
+class IdempotencyKeyReused(APIException):
+    """
+    The key was already used for another request.
+    """
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = {
+        "message": (
+            f"The {HEADER} was already used for another request"
+        )
+    }
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotentRequestInProgress(Conflict):
+    """
+    The request holding the key is still running.
+    """
+    default_detail = {
+        "message": (
+            f"A request with the same {HEADER} is still being processed"
+        )
+    }
+    default_code = 'idempotent_request_in_progress'
+
+    def __init__(self, wait, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sent as Retry-After by the exception handler
+        self.wait = wait
+
+
+def get_max_fingerprint_body(config):
+    max_body = config["MAX_FINGERPRINT_BODY"]
+    if settings.DATA_UPLOAD_MAX_MEMORY_SIZE is not None:
+        max_body = min(max_body, settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+    return max_body
+
+
+def get_fingerprint(request, config):
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.get_full_path()}\n".encode())
+    # Without a Content-Length the WSGI stream and the parsers read an empty
+    # body, it isn't read here either
+    content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    if content_length == 0:
+        return digest.hexdigest()
+    if content_length <= get_max_fingerprint_body(config):
+        # Read once, the parsers read the cached body afterwards
+        digest.update(request._request.body)
+    else:
+        digest.update(
+            f"{request.content_type} {content_length}".encode()
+        )
+    return digest.hexdigest()
+
+
+# |================================= Keys =================================| #
+def claim_key(user, key, fingerprint, config):
+    """
+    Return (record, True) when the request claimed the key, (record of the
+    request holding it, False) otherwise.
+    """
+    now = timezone.now()
+    if random.randrange(PRUNE_EVERY) == 0:
+        delete_expired_keys(config)
+    try:
+        with transaction.atomic():
+            record = IdempotentRequest.objects.create(
+                user=user, key=key, fingerprint=fingerprint, started_date=now
+            )
+        return record, True
+    except IntegrityError:
+        pass
+
+    # Taken over when it expired or its request was lost, with a
+    # conditional update that only one request can win
+    expired = Q(
+        status=IdempotentRequest.Status.COMPLETED,
+        started_date__lt=now - timedelta(seconds=config["TTL"]),
+    )
+    lost = Q(
+        status=IdempotentRequest.Status.PROCESSING,
+        started_date__lt=now - timedelta(seconds=config["LOCK_TIMEOUT"]),
+    )
+    taken_over = IdempotentRequest.objects.filter(
+        expired | lost, user=user, key=key
+    ).update(
+        fingerprint=fingerprint,
+        status=IdempotentRequest.Status.PROCESSING,
+        status_code=None,
+        response=None,
+        started_date=now,
+        finished_date=None,
+    )
+    record = IdempotentRequest.objects.filter(user=user, key=key).first()
+    if record is None:
+        # Released meanwhile by its failed request
+        return claim_key(user, key, fingerprint, config)
+    return record, bool(taken_over)
+
+
+def complete_key(record, response):
+    IdempotentRequest.objects.filter(
+        pk=record.pk, started_date=record.started_date
+    ).update(
+        status=IdempotentRequest.Status.COMPLETED,
+        status_code=response.status_code,
+        response=response.data,
+        finished_date=timezone.now(),
+    )
+
+
+def release_key(record):
+    # Unless a request took it over meanwhile
+    IdempotentRequest.objects.filter(
+        pk=record.pk, started_date=record.started_date,
+        status=IdempotentRequest.Status.PROCESSING,
+    ).delete()
+
+
+def delete_expired_keys(config):
+    return IdempotentRequest.objects.filter(
+        started_date__lt=timezone.now() - timedelta(seconds=config["TTL"])
+    ).delete()[0]
+
+
+# |================================== API =================================| #
+def run_idempotent(request, handler):
+    """
+    Return handler(), or the stored response of the request which used the
+    Idempotency-Key of the request.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValidationError(
+            detail={
+                "message": (
+                    f"The {HEADER} header is at most {MAX_KEY_LENGTH} "
+                    f"characters long"
+                )
+            }
+        )
+
+    config = get_idempotency_settings()
+    fingerprint = get_fingerprint(request, config)
+    record, claimed = claim_key(request.user, key, fingerprint, config)
+    if not claimed:
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        if record.status == IdempotentRequest.Status.PROCESSING:
+            raise IdempotentRequestInProgress(wait=config["RETRY_AFTER"])
+        response = Response(record.response, status=record.status_code)
+        response[REPLAYED_HEADER] = "true"
+        return response
+
+    try:
+        response = handler()
+    except BaseException:
+        release_key(record)
+        raise
+    if status.is_success(response.status_code):
+        complete_key(record, response)
+    else:
+        release_key(record)
+    return response
+
+
+class IdempotentCreateMixin:
+    """
+    Run the create action of a viewset once per Idempotency-Key, see
+    todos/idempotency.py.
+    """
+
+    def create(self, request, *args, **kwargs):
+        create = super().create
+        return run_idempotent(
+            request, lambda: create(request, *args, **kwargs)
+        )
@@ -0,0 +1,450 @@
+"""
+Bulk import of tasks from CSV or NDJSON files.
+
+The uploaded file is spooled to TASK_IMPORTS["SPOOL_DIR"] by the import API
+and imported by the `todos.import_tasks` background job:
+- the rows are parsed incrementally, the file is never loaded in memory
+- every chunk of TASK_IMPORTS["CHUNK_SIZE"] rows is validated against the
+  tag vocabulary and a cache of the users, so the lookups don't cost a query
+  per row
+- the valid rows of a chunk are written with one bulk_create of the tasks
+  and one of the task_tags rows, in a transaction which also records the
+  progress of the import. A job run again after its worker died resumes
+  after the last committed chunk. When the tasks are sharded, the rows of
+  each shard are written in a transaction of their own, committed before
+  the progress: a chunk interrupted in between is imported again.
+
+Columns (CSV header / NDJSON keys):
+    title, text: required
+    completion_status: optional, a value or a label of Task.CompletionStatus
+    tags: optional, uuids or names of tags. A list in NDJSON, separated
+        with ";" in CSV
+    created_by: optional username, only staff users can import tasks for
+        other users
+"""
+import csv
+import io
+import json
+import os
+import uuid
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.utils import timezone
+
+from todos.models import Task, TaskImport
+from todos.stats import (
+    apply_task_stat_deltas,
+    apply_task_tag_stat_deltas,
+    get_created_day,
+    get_deltas,
+    get_task_stat_keys,
+    get_task_tag_stat_keys,
+)
+from todos.task_index import apply_task_index_change, is_task_index_enabled
+from todos.task_list import refresh_task_list
+from todos.vocabulary import get_tag_vocabulary, invalidate_tag_vocabulary
+
+DEFAULT_SETTINGS = {
+    "SPOOL_DIR": os.path.join(settings.BASE_DIR, "spool", "task_imports"),
+    "CHUNK_SIZE": 1000,
+    "MAX_ERRORS": 1000,
+    "MAX_UPLOAD_SIZE": 1024 ** 3,
+}
+
+# Content types of the uploads and the import formats they select
+CONTENT_TYPE_FORMATS = {
+    "text/csv": TaskImport.FileFormat.CSV,
+    "application/x-ndjson": TaskImport.FileFormat.NDJSON,
+    "application/jsonl": TaskImport.FileFormat.NDJSON,
+}
+
+EXTENSION_FORMATS = {
+    ".csv": TaskImport.FileFormat.CSV,
+    ".ndjson": TaskImport.FileFormat.NDJSON,
+    ".jsonl": TaskImport.FileFormat.NDJSON,
+}
+
+CSV_TAG_SEPARATOR = ";"
+
+
+def get_import_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_IMPORTS", {}))
+    return config
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def spool_upload(chunks):
+    """
+    Write the chunks of an upload to a new file of the spool directory.
+    Returns (path, size).
+    """
+    config = get_import_settings()
+    os.makedirs(config["SPOOL_DIR"], exist_ok=True)
+    path = os.path.join(config["SPOOL_DIR"], f"{uuid.uuid4().hex}.upload")
+    size = 0
+    try:
+        with open(path, 'wb') as spool_file:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > config["MAX_UPLOAD_SIZE"]:
+                    raise UploadTooLarge(
+                        f"The file is larger than {config['MAX_UPLOAD_SIZE']}"
+                        " bytes"
+                    )
+                spool_file.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size
+
+
+# |================================ Parsing ===============================| #
+class InvalidRow:
+    """
+    Stands for a row which couldn't be parsed.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+def iter_csv_rows(binary_file):
+    text_file = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.DictReader(text_file):
+            if None in row:
+                yield InvalidRow("The row has more values than the header")
+                continue
+            tags = row.get("tags")
+            if tags is not None:
+                row["tags"] = [
+                    tag.strip() for tag in tags.split(CSV_TAG_SEPARATOR)
+                    if tag.strip()
+                ]
+            yield row
+    finally:
+        # Otherwise the wrapper closes binary_file when it is collected
+        text_file.detach()
+
+
+def iter_ndjson_rows(binary_file):
+    for line in binary_file:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield InvalidRow(f"Invalid JSON: {error}")
+            continue
+        if not isinstance(row, dict):
+            yield InvalidRow("A row must be a JSON object")
+            continue
+        yield row
+
+
+ROW_READERS = {
+    TaskImport.FileFormat.CSV: iter_csv_rows,
+    TaskImport.FileFormat.NDJSON: iter_ndjson_rows,
+}
+
+
+# |=============================== Validation =============================| #
+class TaskRowValidator:
+    """
+    Validates the rows of an import and turns them into unsaved tasks.
+    """
+
+    def __init__(self, task_import):
+        owner = task_import.created_by
+        self.owner = owner
+        self.user_ids = {owner.username: owner.id}
+        self.set_vocabulary(get_tag_vocabulary())
+        self.statuses = {}
+        for value, label in Task.CompletionStatus.choices:
+            self.statuses[value.lower()] = value
+            self.statuses[str(label).lower()] = value
+
+    def load_chunk_lookups(self, rows):
+        """
+        Load the users and tags referenced by a chunk of rows which aren't
+        cached yet, with one query.
+        """
+        usernames = {
+            row.get("created_by") for row in rows
+            if isinstance(row, dict) and isinstance(row.get("created_by"), str)
+        } - self.user_ids.keys()
+        if usernames and self.owner.is_staff:
+            self.user_ids.update(
+                User.objects
+                .filter(username__in=usernames)
+                .values_list('username', 'id')
+            )
+
+        # A tag created after the vocabulary was loaded isn't known yet
+        tag_refs = {
+            tag for row in rows if isinstance(row, dict)
+            for tag in (row.get("tags") or []) if isinstance(tag, str)
+        }
+        if any(self.get_tag_ids(tag) is None for tag in tag_refs):
+            invalidate_tag_vocabulary()
+            self.set_vocabulary(get_tag_vocabulary())
+
+    def set_vocabulary(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.tag_ids_by_name = {}
+        for entry in vocabulary.by_id.values():
+            self.tag_ids_by_name.setdefault(entry.name, []).append(entry.id)
+
+    def get_tag_ids(self, tag):
+        """
+        Return the ids of the tags with this uuid or name, None when there
+        is none.
+        """
+        try:
+            entry = self.vocabulary.by_uuid.get(uuid.UUID(tag))
+        except ValueError:
+            entry = None
+        if entry is not None:
+            return [entry.id]
+        return self.tag_ids_by_name.get(tag)
+
+    def validate(self, row):
+        """
+        Return (task, tag_ids, None) for a valid row and
+        (None, None, errors) otherwise.
+        """
+        if isinstance(row, InvalidRow):
+            return None, None, {"row": [row.message]}
+        errors = {}
+
+        title = row.get("title")
+        if not isinstance(title, str) or not title.strip():
+            errors["title"] = ["This field is required."]
+        elif len(title) > Task._meta.get_field("title").max_length:
+            errors["title"] = [
+                "Ensure this field has no more than 200 characters."
+            ]
+        text = row.get("text")
+        if not isinstance(text, str) or not text.strip():
+            errors["text"] = ["This field is required."]
+
+        completion_status = Task.CompletionStatus.INCOMPLETE
+        if row.get("completion_status"):
+            completion_status = self.statuses.get(
+                str(row["completion_status"]).lower()
+            )
+            if completion_status is None:
+                errors["completion_status"] = [
+                    f"\"{row['completion_status']}\" is not a valid choice."
+                ]
+
+        created_by_id = self.owner.id
+        if row.get("created_by"):
+            created_by_id = self.user_ids.get(row["created_by"])
+            if created_by_id is None:
+                errors["created_by"] = [
+                    f"Unknown user \"{row['created_by']}\"."
+                    if self.owner.is_staff else
+                    "Only staff users can import tasks for other users."
+                ]
+
+        tags = row.get("tags") or []
+        tag_ids = set()
+        if not isinstance(tags, list):
+            errors["tags"] = ["Expected a list of tags."]
+        else:
+            for tag in tags:
+                ids = self.get_tag_ids(tag) if isinstance(tag, str) else None
+                if ids is None:
+                    errors.setdefault("tags", []).append(
+                        f"Unknown tag \"{tag}\"."
+                    )
+                elif len(ids) > 1:
+                    errors.setdefault("tags", []).append(
+                        f"Several tags are named \"{tag}\", use its uuid."
+                    )
+                else:
+                    tag_ids.update(ids)
+
+        if errors:
+            return None, None, errors
+        task = Task(
+            title=title,
+            text=text,
+            completion_status=completion_status,
+            created_by_id=created_by_id,
+        )
+        return task, tag_ids, None
+
+
+# |================================ Import ================================| #
+class TaskImporter:
+
+    def __init__(self, task_import):
+        self.task_import = task_import
+        self.config = get_import_settings()
+        self.validator = TaskRowValidator(task_import)
+
+    def insert_tasks(self, using, tasks_with_tags):
+        tasks = [task for task, _ in tasks_with_tags]
+        Task.objects.using(using).bulk_create(tasks, batch_size=500)
+        if any(task.pk is None for task in tasks):
+            # Databases which can't return the ids of inserted rows
+            ids_by_uuid = dict(
+                Task.objects
+                .using(using)
+                .filter(uuid__in=[task.uuid for task in tasks])
+                .values_list('uuid', 'id')
+            )
+            for task in tasks:
+                task.pk = ids_by_uuid[task.uuid]
+
+        through = Task.tags.through
+        through.objects.using(using).bulk_create(
+            [
+                through(task_id=task.pk, tag_id=tag_id)
+                for task, tag_ids in tasks_with_tags
+                for tag_id in tag_ids
+            ],
+            batch_size=1000,
+        )
+
+    def write_chunk(self, tasks_with_tags):
+        """
+        Insert the tasks and their task_tags rows, and update the stats
+        tables and the task list entries which are otherwise maintained by
+        the signals.
+        """
+        # The shard of each task when the tasks are sharded (see
+        # todos/sharding.py), the default database otherwise
+        tasks_with_tags_by_database = defaultdict(list)
+        for task, tag_ids in tasks_with_tags:
+            using = router.db_for_write(Task, instance=task)
+            tasks_with_tags_by_database[using].append((task, tag_ids))
+        for using, database_tasks_with_tags in (
+            tasks_with_tags_by_database.items()
+        ):
+            with transaction.atomic(using=using):
+                self.insert_tasks(using, database_tasks_with_tags)
+                refresh_task_list(
+                    using, [task.pk for task, _ in database_tasks_with_tags]
+                )
+
+        task_stat_keys = []
+        task_tag_stat_keys = []
+        for task, tag_ids in tasks_with_tags:
+            values = (
+                task.created_by_id, task.completion_status,
+                get_created_day(task.created_date)
+            )
+            task_stat_keys += get_task_stat_keys(*values)
+            task_tag_stat_keys += get_task_tag_stat_keys(*values, tag_ids)
+        apply_task_stat_deltas(get_deltas([], task_stat_keys))
+        apply_task_tag_stat_deltas(get_deltas([], task_tag_stat_keys))
+
+        if is_task_index_enabled():
+            def update_task_index():
+                for task, tag_ids in tasks_with_tags:
+                    apply_task_index_change(
+                        'add_task', task.pk, task.created_by_id,
+                        task.completion_status, tag_ids
+                    )
+            transaction.on_commit(update_task_index)
+
+    def import_chunk(self, rows, first_row_number, processed_bytes):
+        self.validator.load_chunk_lookups(rows)
+        tasks_with_tags = []
+        errors = []
+        for row_number, row in enumerate(rows, start=first_row_number):
+            task, tag_ids, row_errors = self.validator.validate(row)
+            if row_errors:
+                errors.append({"row": row_number, "errors": row_errors})
+            else:
+                tasks_with_tags.append((task, tag_ids))
+
+        task_import = self.task_import
+        with transaction.atomic():
+            if tasks_with_tags:
+                self.write_chunk(tasks_with_tags)
+            task_import.row_count += len(rows)
+            task_import.imported_count += len(tasks_with_tags)
+            task_import.error_count += len(errors)
+            free_error_slots = self.config["MAX_ERRORS"] - len(
+                task_import.errors
+            )
+            task_import.errors += errors[:max(free_error_slots, 0)]
+            task_import.processed_bytes = processed_bytes
+            task_import.save(update_fields=[
+                'row_count', 'imported_count', 'error_count', 'errors',
+                'processed_bytes',
+            ])
+
+    def run(self):
+        task_import = self.task_import
+        task_import.status = TaskImport.Status.RUNNING
+        if task_import.started_date is None:
+            task_import.started_date = timezone.now()
+        task_import.save(update_fields=['status', 'started_date'])
+
+        read_rows = ROW_READERS[task_import.file_format]
+        chunk_size = self.config["CHUNK_SIZE"]
+        with open(task_import.file_path, 'rb') as binary_file:
+            rows = read_rows(binary_file)
+            # Rows of the chunks committed by a previous run of the job
+            for _ in islice(rows, task_import.row_count):
+                pass
+            while chunk := list(islice(rows, chunk_size)):
+                self.import_chunk(
+                    chunk,
+                    first_row_number=task_import.row_count + 1,
+                    # Read ahead by the buffers, so slightly over-estimated
+                    processed_bytes=min(
+                        binary_file.tell(), task_import.total_bytes
+                    ),
+                )
+
+        task_import.status = TaskImport.Status.SUCCEEDED
+        task_import.processed_bytes = task_import.total_bytes
+        task_import.finished_date = timezone.now()
+        task_import.save(
+            update_fields=['status', 'processed_bytes', 'finished_date']
+        )
+
+
+def import_tasks(task_import_id):
+    """
+    Run an import, the spooled file is deleted once the import is finished.
+    """
+    task_import = TaskImport.objects.select_related('created_by').get(
+        id=task_import_id
+    )
+    if task_import.status in (
+        TaskImport.Status.SUCCEEDED, TaskImport.Status.FAILED
+    ):
+        return
+    try:
+        TaskImporter(task_import).run()
+    except (OSError, UnicodeDecodeError, csv.Error) as error:
+        # Errors of the file itself, running the import again won't help
+        task_import.status = TaskImport.Status.FAILED
+        task_import.failure = str(error)
+        task_import.finished_date = timezone.now()
+        task_import.save(
+            update_fields=['status', 'failure', 'finished_date']
+        )
+    except Exception as error:
+        # The job is retried and resumes after the last imported chunk
+        TaskImport.objects.filter(id=task_import.id).update(
+            failure=f"{type(error).__name__}: {error}"
+        )
+        raise
+    if os.path.exists(task_import.file_path):
+        os.remove(task_import.file_path)
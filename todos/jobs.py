@@ -0,0 +1,45 @@
+"""
+Background jobs of the todos app, run by `manage.py run_jobs`.
+"""
+import time
+
+from jobs.registry import job
+from todos.exports import export_tasks
+from todos.imports import import_tasks
+from todos.purge import Purger, get_purge_settings
+from todos.stats import rebuild_task_stats
+
+
+@job(name="todos.purge_deleted")
+def purge_deleted():
+    return Purger().purge()
+
+
+@job(name="todos.export_tasks")
+def export_tasks_job(task_export_id):
+    export_tasks(task_export_id)
+
+
+@job(name="todos.import_tasks")
+def import_tasks_job(task_import_id):
+    import_tasks(task_import_id)
+
+
+@job(name="todos.rebuild_task_stats")
+def rebuild_task_stats_job():
+    rebuild_task_stats()
+
+
+def schedule_purge():
+    """
+    Enqueue a purge for the records being soft deleted.
+    A single purge job is enqueued per RETENTION period (its idempotency key
+    is the period), it runs once all the records deleted during the period
+    are older than RETENTION.
+    """
+    retention = get_purge_settings()["RETENTION"]
+    period = int(time.time() // retention)
+    purge_deleted.enqueue_on_commit(
+        idempotency_key=f"todos.purge_deleted:{period}",
+        delay=(period + 2) * retention - time.time(),
+    )
@@ -0,0 +1,66 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import random
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from todos.models import Tag, Task
+from todos.task_index import reset_task_index
+from todos.vocabulary import invalidate_tag_vocabulary
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the benchmark against a throwaway test database, so that the seeded
+    rows never touch the configured database.
+    """
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield connection
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def seed_tasks(tasks, users=10, tags=50, tags_per_task=3, seed=0):
+    """
+    Create users, tags and tasks with random tags using bulk inserts.
+    Bulk inserts don't send signals, run `rebuild_task_stats()` afterwards
+    when the stats are needed. The in-process caches are reset here.
+    """
+    rand = random.Random(seed)
+    user_objs = User.objects.bulk_create(
+        [User(username=f"bench-user-{index}") for index in range(users)]
+    )
+    tag_objs = Tag.objects.bulk_create(
+        [Tag(name=f"tag-{index}") for index in range(tags)]
+    )
+    statuses = Task.CompletionStatus.values
+    task_objs = Task.objects.bulk_create(
+        [
+            Task(
+                title=f"Task {index}",
+                text="Some text describing the task",
+                created_by=rand.choice(user_objs),
+                completion_status=rand.choice(statuses),
+            )
+            for index in range(tasks)
+        ],
+        batch_size=1000,
+    )
+    through_model = Task.tags.through
+    through_model.objects.bulk_create(
+        [
+            through_model(task_id=task.id, tag_id=tag.id)
+            for task in task_objs
+            for tag in rand.sample(tag_objs, tags_per_task)
+        ],
+        batch_size=1000,
+    )
+    invalidate_tag_vocabulary()
+    reset_task_index()
+    return user_objs, tag_objs, task_objs
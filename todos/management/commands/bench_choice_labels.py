@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ModelSerializer, SerializerMethodField
+
+from core.fields import ChoiceLabelField
+from todos.models import Task
+
+
+class EnumLookupSerializer(ModelSerializer):
+    """
+    The previous implementation: one enum lookup and one lazy translation
+    per row.
+    """
+    completion_status = SerializerMethodField()
+
+    def get_completion_status(self, object):
+        return Task.CompletionStatus[object.completion_status].label
+
+    class Meta:
+        model = Task
+        fields = ("title", "completion_status")
+
+
+class ChoiceLabelSerializer(ModelSerializer):
+    completion_status = ChoiceLabelField()
+
+    class Meta:
+        model = Task
+        fields = ("title", "completion_status")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the per-row cost of serializing completion_status labels "
+        "with the enum lookup versus the cached ChoiceLabelField"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=10000,
+            help="Number of in-memory tasks serialized"
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Number of timed runs, the best one is reported"
+        )
+
+    def time_serializer(self, serializer_class, tasks, repeat):
+        # The rows are rendered as well, as that is where the lazy labels of
+        # the enum lookup get resolved
+        renderer = JSONRenderer()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            renderer.render(serializer_class(tasks, many=True).data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        statuses = Task.CompletionStatus.values
+        tasks = [
+            Task(title=f"Task {index}", completion_status=statuses[index % 2])
+            for index in range(options['rows'])
+        ]
+        rows = len(tasks)
+        for serializer_class in (EnumLookupSerializer, ChoiceLabelSerializer):
+            elapsed = self.time_serializer(
+                serializer_class, tasks, options['repeat']
+            )
+            self.stdout.write(
+                f"{serializer_class.__name__:>24}: "
+                f"{elapsed * 1e3:8.2f} ms for {rows} rows, "
+                f"{elapsed / rows * 1e6:6.2f} us/row"
+            )
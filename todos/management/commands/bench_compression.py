@@ -0,0 +1,101 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.response import Response
+
+from core.compression import CODECS, get_compression_settings
+from core.renderers import CustomRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the CPU time versus compressed size trade-off of each "
+        "available codec and profile on CustomRenderer output"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[5, 50, 1000],
+            help="Number of tasks in the rendered page"
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help="Number of compressions timed per codec and level"
+        )
+
+    def render_page(self, rows):
+        """
+        Render a list page the same way TaskViewset.list does, without
+        touching the database.
+        """
+        now = timezone.now()
+        data = {
+            "page_info": {
+                "result_count": rows,
+                "page_size": rows,
+                "page_count": 1,
+                "page": 1,
+                "next": None,
+                "previous": None,
+            },
+            "data": [
+                {
+                    "title": f"Task number {index}",
+                    "text": "Buy milk, eggs and bread on the way back home",
+                    "uuid": str(uuid.uuid4()),
+                    "completion_status": "Incomplete",
+                    "created_by": {"id": index % 7, "name": "John Doe"},
+                    "created_date": now.strftime("%-d %B %Y, %A, %-I:%-M %p"),
+                    "modified_date": now.strftime("%m/%d/%Y-%H:%M:%S"),
+                    "tags": [
+                        {"uuid": str(uuid.uuid4()), "name": "home"},
+                        {"uuid": str(uuid.uuid4()), "name": "errands"},
+                    ],
+                }
+                for index in range(rows)
+            ],
+        }
+        response = Response(status=200)
+        return CustomRenderer().render(
+            data,
+            renderer_context={
+                "response": response,
+                "message": "List of task records",
+            }
+        )
+
+    def handle(self, *args, **options):
+        profiles = get_compression_settings()["PROFILES"]
+        iterations = options['iterations']
+
+        self.stdout.write(
+            f"Available codecs: {', '.join(sorted(CODECS))}\n"
+        )
+        header = (
+            f"{'rows':>6} {'codec':>6} {'profile':>9} {'level':>5} "
+            f"{'bytes':>10} {'ratio':>7} {'us/op':>10} {'MB/s':>8}"
+        )
+        for rows in options['rows']:
+            body = self.render_page(rows)
+            self.stdout.write(header)
+            self.stdout.write(
+                f"{rows:>6} {'none':>6} {'-':>9} {'-':>5} "
+                f"{len(body):>10} {1.0:>7.2f} {0.0:>10.1f} {'-':>8}"
+            )
+            for encoding, codec in CODECS.items():
+                for profile, levels in profiles.items():
+                    level = levels[encoding]
+                    start = time.perf_counter()
+                    for _ in range(iterations):
+                        compressed = codec.compress(body, level)
+                    elapsed = (time.perf_counter() - start) / iterations
+                    self.stdout.write(
+                        f"{rows:>6} {encoding:>6} {profile:>9} {level:>5} "
+                        f"{len(compressed):>10} "
+                        f"{len(body) / len(compressed):>7.2f} "
+                        f"{elapsed * 1e6:>10.1f} "
+                        f"{len(body) / elapsed / 1e6:>8.1f}"
+                    )
+            self.stdout.write("")
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from core.throttling import (
+    ConcurrencyThrottle,
+    TokenBucketThrottle,
+    release_leases,
+    reset_rate_limit_backend,
+)
+
+# Rates no request reaches, the allowed path is the one every request pays
+UNREACHED_RATE = (1e9, 1e9)
+
+
+class BenchView(APIView):
+    throttle_scope = "bench"
+
+    def get(self, request, *args, **kwargs):
+        return Response({"ok": True})
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the CPU time the rate limits and concurrency caps of "
+        "core/throttling.py add to a request, per backend"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=5000,
+            help="Number of requests timed per backend and throttle set"
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Number of timings of each set, the best one is kept"
+        )
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help="Number of users the requests are spread over (buckets)"
+        )
+
+    def time_requests(self, view, requests):
+        """
+        Return the mean time of a request in seconds.
+        """
+        start = time.perf_counter()
+        for request in requests:
+            view(request)
+            # What AdmissionControlMiddleware does
+            release_leases(request)
+        return (time.perf_counter() - start) / len(requests)
+
+    def build_requests(self, iterations, users):
+        factory = APIRequestFactory()
+        # Never saved, the throttles only read their pk
+        users = [
+            User(pk=index + 1, username=f"bench{index}")
+            for index in range(users)
+        ]
+        requests = []
+        for index in range(iterations):
+            request = factory.get("/bench/")
+            force_authenticate(request, user=users[index % len(users)])
+            requests.append(request)
+        return requests
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        requests = self.build_requests(iterations, options['users'])
+        throttle_sets = [
+            ("none", []),
+            ("token bucket", [TokenBucketThrottle]),
+            ("bucket + concurrency", [TokenBucketThrottle,
+                                      ConcurrencyThrottle]),
+        ]
+
+        self.stdout.write(
+            f"{iterations} requests over {options['users']} users\n"
+        )
+        self.stdout.write(
+            f"{'backend':>8} {'throttles':>22} {'us/request':>11} "
+            f"{'overhead us':>12}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for backend in ("memory", "sqlite"):
+                config = {
+                    "ENABLED": True,
+                    "BACKEND": backend,
+                    "PATH": os.path.join(directory, "rate_limits.sqlite3"),
+                    "RATES": {"default": UNREACHED_RATE},
+                    "CONCURRENCY": {"bench.get": len(requests)},
+                }
+                with override_settings(RATE_LIMITS=config):
+                    reset_rate_limit_backend()
+                    baseline = None
+                    for name, throttle_classes in throttle_sets:
+                        view = BenchView.as_view(
+                            throttle_classes=throttle_classes
+                        )
+                        # Warm-up: connections, tables and buckets
+                        self.time_requests(view, requests[:100])
+                        elapsed = min(
+                            self.time_requests(view, requests)
+                            for _ in range(options['repeat'])
+                        )
+                        if baseline is None:
+                            baseline = elapsed
+                        self.stdout.write(
+                            f"{backend:>8} {name:>22} {elapsed * 1e6:>11.1f} "
+                            f"{(elapsed - baseline) * 1e6:>12.1f}"
+                        )
+                reset_rate_limit_backend()
@@ -0,0 +1,96 @@
+import gc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from todos.management.benchmarks import benchmark_database, seed_tasks
+from todos.models import Task
+from todos.read_models import as_task_rows
+from todos.serializers import TaskSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the memory and time of loading and serializing task "
+        "lists as TaskRow read models versus Task model instances"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[50, 10000],
+            help="Number of tasks of the loaded lists"
+        )
+        parser.add_argument('--tags-per-task', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def get_loaders(self):
+        queryset = Task.objects.order_by('id')
+        return {
+            # The best the models can do: 3 queries, like the read models
+            "models": lambda rows: list(
+                queryset.select_related('created_by')
+                .prefetch_related('tags')[:rows]
+            ),
+            "read models": lambda rows: list(
+                as_task_rows(queryset)[:rows]
+            ),
+        }
+
+    def measure_memory(self, load, rows):
+        """
+        Return the bytes held by the loaded list.
+        """
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            tasks = load(rows)
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del tasks
+        return after - before
+
+    def time_best(self, function, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed_tasks(
+                max(options['rows']), tags_per_task=options['tags_per_task']
+            )
+            self.stdout.write(
+                f"{'rows':>6} {'loader':>12} {'KB':>9} {'B/row':>7} "
+                f"{'load ms':>9} {'serialize ms':>13} {'rows/s':>9}"
+            )
+            for rows in options['rows']:
+                outputs = []
+                for name, load in self.get_loaders().items():
+                    memory = self.measure_memory(load, rows)
+                    load_time, tasks = self.time_best(
+                        lambda: load(rows), options['repeat']
+                    )
+                    serialize_time, data = self.time_best(
+                        lambda: TaskSerializer(tasks, many=True).data,
+                        options['repeat']
+                    )
+                    outputs.append(data)
+                    total = load_time + serialize_time
+                    self.stdout.write(
+                        f"{rows:>6} {name:>12} {memory / 1024:>9.1f} "
+                        f"{memory / rows:>7.0f} {load_time * 1000:>9.2f} "
+                        f"{serialize_time * 1000:>13.2f} "
+                        f"{rows / total:>9.0f}"
+                    )
+                if outputs[0] != outputs[1]:
+                    self.stderr.write(
+                        f"The serialized {rows} rows differ between the "
+                        f"loaders"
+                    )
@@ -0,0 +1,105 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from todos.api.v2.filters import TaskFilter
+from todos.management.benchmarks import benchmark_database, seed_tasks
+from todos.models import Task
+from todos.task_index import get_task_index, reset_task_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the tag filters of TaskFilter (the previous join, the join "
+        "with DISTINCT, tags_any and tags_all) for tag sets of 1 to 20 tags"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--tags-per-task', type=int, default=4)
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1, 2, 5, 10, 20]
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def time_query(self, queryset, repeat):
+        """
+        Time what a list page costs: the count and the first page.
+        """
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = queryset.count()
+            list(queryset.order_by('id')[:5])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return count, best
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            _, tags, _ = seed_tasks(
+                options['tasks'], tags=options['tags'],
+                tags_per_task=options['tags_per_task'],
+            )
+            rand = random.Random(1)
+            queryset = Task.objects.all()
+            self.stdout.write(
+                f"{'tags':>4} {'strategy':>16} {'count':>7} {'ms':>8}"
+            )
+            for size in options['sizes']:
+                value = ','.join(
+                    str(tag.uuid) for tag in rand.sample(tags, size)
+                )
+                tag_uuids = value.split(',')
+                strategies = {
+                    "join": queryset.filter(tags__uuid__in=tag_uuids),
+                    "join+distinct": (
+                        queryset.filter(tags__uuid__in=tag_uuids).distinct()
+                    ),
+                    "tags_any": TaskFilter(
+                        data={"tags_any": value}, queryset=queryset
+                    ).qs,
+                    "tags_all": TaskFilter(
+                        data={"tags_all": value}, queryset=queryset
+                    ).qs,
+                }
+                for name, strategy_queryset in strategies.items():
+                    count, elapsed = self.time_query(
+                        strategy_queryset, options['repeat']
+                    )
+                    self.stdout.write(
+                        f"{size:>4} {name:>16} {count:>7} "
+                        f"{elapsed * 1000:>8.2f}"
+                    )
+                self.time_task_index(queryset, value, size, options['repeat'])
+
+    def time_task_index(self, queryset, value, size, repeat):
+        """
+        Time the set algebra of the in-process task index alone, the ids it
+        returns are then fetched with `id IN (...)`.
+        """
+        index_settings = {
+            'ENABLED': True, 'MAX_AGE': 3600, 'MAX_IDS': 10 ** 9,
+            'SNAPSHOT_PATH': None,
+        }
+        with override_settings(TASK_INDEX=index_settings):
+            get_task_index(wait=True)
+            for name in ('tags_any', 'tags_all'):
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    filterset = TaskFilter(
+                        data={name: value}, queryset=queryset
+                    )
+                    filterset.is_valid()
+                    task_ids = filterset.get_task_ids_from_index()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(
+                    f"{size:>4} {name + ' (index)':>16} {len(task_ids):>7} "
+                    f"{best * 1000:>8.2f}"
+                )
+        reset_task_index()
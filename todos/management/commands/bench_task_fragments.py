@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from todos.api.v4.views import TaskViewset
+from todos.fragments import get_fragment_cache, get_fragment_settings
+from todos.management.benchmarks import benchmark_database, seed_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the v4 task list pages assembled from the cached JSON "
+        "fragments of their tasks versus serialized as a whole"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--tags-per-task', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def build_requests(self, user, pages, page_size):
+        factory = APIRequestFactory()
+        requests = []
+        for page in range(1, pages + 1):
+            request = factory.get(
+                f"/api/v4/tasks/?page_size={page_size}&page={page}"
+            )
+            force_authenticate(request, user=user)
+            requests.append(request)
+        return requests
+
+    def time_pages(self, requests, clear_cache):
+        """
+        Return the best time of listing and encoding all the pages, and the
+        encoded pages.
+        """
+        view = TaskViewset.as_view({"get": "list"})
+        best = None
+        for _ in range(self.repeat):
+            if clear_cache:
+                get_fragment_cache().clear()
+            start = time.perf_counter()
+            contents = [view(request).render().content for request in requests]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, contents
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        page_size = options['page_size']
+        pages = max(1, options['tasks'] // page_size)
+        # The next and previous links are built with the host of the
+        # requests
+        with benchmark_database(), override_settings(
+            RATE_LIMITS={"ENABLED": False}, ALLOWED_HOSTS=["testserver"]
+        ):
+            users, _, _ = seed_tasks(
+                options['tasks'], tags_per_task=options['tags_per_task']
+            )
+            requests = self.build_requests(users[0], pages, page_size)
+            modes = [
+                ("serializer", False, False),
+                ("fragments cold", True, True),
+                ("fragments warm", True, False),
+            ]
+            self.stdout.write(
+                f"{pages} pages of {page_size} tasks\n"
+                f"{'mode':>16} {'ms/page':>9} {'tasks/s':>9}"
+            )
+            outputs = []
+            for name, enabled, clear_cache in modes:
+                config = dict(get_fragment_settings(), ENABLED=enabled)
+                with override_settings(TASK_FRAGMENTS=config):
+                    elapsed, contents = self.time_pages(requests, clear_cache)
+                outputs.append(contents)
+                self.stdout.write(
+                    f"{name:>16} {elapsed / pages * 1000:>9.2f} "
+                    f"{pages * page_size / elapsed:>9.0f}"
+                )
+            if any(contents != outputs[0] for contents in outputs):
+                self.stderr.write("The pages differ between the modes")
@@ -0,0 +1,127 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Loads core.wsgi, forks like a pre-fork server would and serves the first
+# requests in the child, then reports their latency and the child's memory.
+WORKER_SCRIPT = """
+import io, json, os, sys, time
+from core.wsgi import application
+from django.contrib.auth.models import User
+from django.db import connections
+
+user = User.objects.order_by('id').first()
+token = None
+if user is not None:
+    from rest_framework_simplejwt.tokens import AccessToken
+    token = str(AccessToken.for_user(user))
+connections.close_all()
+
+def request(path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    if token:
+        environ['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+    start = time.perf_counter()
+    response = application(environ, lambda status, headers: None)
+    b''.join(response)
+    response.close()
+    return (time.perf_counter() - start) * 1000
+
+def private_memory_kb():
+    # Pages of the child that are not shared with the master anymore
+    total = 0
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            if line.startswith(('Private_Clean', 'Private_Dirty')):
+                total += int(line.split()[1])
+    return total
+
+read, write = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.close(read)
+    latencies = [request(sys.argv[1]) for _ in range(int(sys.argv[2]))]
+    result = {"latencies": latencies, "private_kb": private_memory_kb()}
+    os.write(write, json.dumps(result).encode())
+    os._exit(0)
+os.close(write)
+data = b''
+while chunk := os.read(read, 65536):
+    data += chunk
+os.waitpid(pid, 0)
+print(data.decode())
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of the first requests of a forked WSGI worker "
+        "and its private (unshared) memory with and without the warm-up"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default='/api/v4/tasks/',
+            help="Path requested by the worker"
+        )
+        parser.add_argument(
+            '--requests', type=int, default=5,
+            help="Number of requests made by each worker"
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Number of workers started per mode, medians are reported"
+        )
+
+    def run_worker(self, warm_up, path, requests):
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'core.settings'
+            ),
+            BENCH_WSGI_WARM_UP='1' if warm_up else '0',
+        )
+        script = (
+            "from django.conf import settings\n"
+            "import django, os\n"
+            "django.setup()\n"
+            "settings.WSGI_WARM_UP = os.environ['BENCH_WSGI_WARM_UP'] == '1'\n"
+            + WORKER_SCRIPT
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script, path, str(requests)],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return json.loads(result.stdout)
+
+    def handle(self, *args, **options):
+        for warm_up in (False, True):
+            runs = [
+                self.run_worker(warm_up, options['path'], options['requests'])
+                for _ in range(options['repeat'])
+            ]
+            first = statistics.median(run["latencies"][0] for run in runs)
+            rest = statistics.median(
+                latency for run in runs for latency in run["latencies"][1:]
+            )
+            private_kb = statistics.median(run["private_kb"] for run in runs)
+            self.stdout.write(
+                f"warm-up {'on ' if warm_up else 'off'}: "
+                f"first request {first:7.2f} ms, "
+                f"next requests {rest:6.2f} ms, "
+                f"worker private memory {private_kb / 1024:6.1f} MB"
+            )
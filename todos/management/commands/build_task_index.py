@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from todos.task_index import (
+    TaskIndex, get_tables_fingerprint, get_task_index_settings
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the in-process task index from the database and write its "
+        "snapshot file, so that processes start with a ready index"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help="Snapshot file, defaults to TASK_INDEX['SNAPSHOT_PATH']"
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_task_index_settings()["SNAPSHOT_PATH"]
+        if not path:
+            raise CommandError(
+                "No snapshot path, set TASK_INDEX['SNAPSHOT_PATH'] or --path"
+            )
+        start = time.perf_counter()
+        fingerprint = get_tables_fingerprint()
+        index = TaskIndex.build()
+        built = time.perf_counter()
+        index.save_snapshot(path, fingerprint)
+        saved = time.perf_counter()
+        loaded_index = TaskIndex.load_snapshot(path, fingerprint)
+        loaded = time.perf_counter()
+        if loaded_index is None:
+            raise CommandError(f"Failed to read back the snapshot {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index.all)} tasks, {len(index.by_tag)} "
+            f"tags and {len(index.by_user)} users in "
+            f"{(built - start) * 1000:.1f} ms, snapshot written in "
+            f"{(saved - built) * 1000:.1f} ms and loaded in "
+            f"{(loaded - saved) * 1000:.1f} ms"
+        ))
@@ -0,0 +1,105 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Boots a WSGI worker the way core/wsgi.py does, resolves the url patterns
+# like the first request would, then prints the boot time and peak RSS.
+WORKER_BOOT_SCRIPT = """
+import json, resource, time
+start = time.perf_counter()
+from core.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "boot_ms": elapsed * 1000,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def parse_import_times(stderr):
+    """
+    Parse the `-X importtime` output into a list of
+    (cumulative_us, self_us, depth, module) tuples.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        depth = (len(module) - len(module.lstrip())) // 2
+        imports.append(
+            (int(cumulative_us), int(self_us), depth, module.strip())
+        )
+    return imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the boot time, peak memory and slowest imports of a WSGI "
+        "worker for each settings module, using python -X importtime"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'settings_modules', nargs='*',
+            default=['core.settings', 'core.settings_api'],
+            help="Settings modules to compare"
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help="Number of worker boots per settings module, the median is "
+                 "reported"
+        )
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help="Number of slowest top level imports to list"
+        )
+
+    def boot_worker(self, settings_module):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", WORKER_BOOT_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return json.loads(result.stdout), parse_import_times(result.stderr)
+
+    def handle(self, *args, **options):
+        for settings_module in options['settings_modules']:
+            runs = [
+                self.boot_worker(settings_module)
+                for _ in range(options['repeat'])
+            ]
+            boot_ms = statistics.median(run["boot_ms"] for run, _ in runs)
+            max_rss_kb = statistics.median(
+                run["max_rss_kb"] for run, _ in runs
+            )
+            imports = runs[-1][1]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(settings_module))
+            self.stdout.write(
+                f"  boot time: {boot_ms:.1f} ms, "
+                f"peak RSS: {max_rss_kb / 1024:.1f} MB, "
+                f"modules imported: {len(imports)}"
+            )
+            top_level = sorted(
+                (item for item in imports if item[2] == 0), reverse=True
+            )
+            self.stdout.write("  slowest top level imports:")
+            for cumulative_us, self_us, _, module in (
+                top_level[:options['top']]
+            ):
+                self.stdout.write(
+                    f"    {cumulative_us / 1000:8.1f} ms "
+                    f"(self {self_us / 1000:6.1f} ms)  {module}"
+                )
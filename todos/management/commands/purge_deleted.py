@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todos.purge import Purger
+
+
+class Command(BaseCommand):
+    help = (
+        "Physically delete the soft deleted tasks and tags, in chunks of "
+        "rows deleted in separate transactions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention', type=float, default=None,
+            help=(
+                "Only purge the records deleted more than this many seconds "
+                "ago, defaults to SOFT_DELETE_PURGE['RETENTION']"
+            ),
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help="Maximum number of rows deleted per transaction",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=None,
+            help="Seconds to wait between two transactions",
+        )
+
+    def handle(self, *args, **options):
+        deleted_before = None
+        if options['retention'] is not None:
+            deleted_before = timezone.now() - timedelta(
+                seconds=options['retention']
+            )
+        purger = Purger(
+            deleted_before=deleted_before,
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+        )
+        start = time.perf_counter()
+        purged = purger.purge()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {purged['tasks']} tasks and {purged['tags']} tags in "
+            f"{purger.chunk_count} transactions in {elapsed:.2f}s"
+        ))
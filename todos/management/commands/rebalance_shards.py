@@ -0,0 +1,106 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todos.models import Tag
+from todos.sharding import (
+    get_shard_count, get_user_shard, invalidate_shard_directory,
+    move_default_tasks, move_users, plan_rebalance, sync_replicas
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users and their tasks between the task shards, see "
+        "todos/sharding.py"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sync-replicas', action='store_true',
+            help=(
+                "Copy the tags and users of the default database to every "
+                "shard, run it after adding shards"
+            ),
+        )
+        parser.add_argument(
+            '--from-default', action='store_true',
+            help=(
+                "Move the tasks left in the default database to the shards "
+                "of their creators"
+            ),
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', default=[],
+            help="Id of a user to move to the --to shard, can be repeated",
+        )
+        parser.add_argument(
+            '--to', type=int, default=None,
+            help="Index of the shard the --user users are moved to",
+        )
+        parser.add_argument(
+            '--auto', action='store_true',
+            help=(
+                "Move the users needed to even out the task counts of the "
+                "shards"
+            ),
+        )
+        parser.add_argument(
+            '--max-moves', type=int, default=10,
+            help="Maximum number of users moved by --auto",
+        )
+        parser.add_argument(
+            '--wait', type=float, default=None,
+            help=(
+                "Seconds to wait for the processes to reload the shard "
+                "assignments, defaults to TASK_SHARDS['DIRECTORY_MAX_AGE']"
+            ),
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only print the moves",
+        )
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        shard_count = get_shard_count()
+        if not shard_count:
+            raise CommandError(
+                "The tasks aren't sharded, set TASK_SHARDS['COUNT']"
+            )
+
+        if options['sync_replicas']:
+            for model in (User, Tag):
+                sync_replicas(model)
+            self.log("Copied the tags and users to the shards")
+
+        if options['from_default'] and not options['dry_run']:
+            move_default_tasks(log=self.log)
+
+        invalidate_shard_directory()
+        moves = []
+        if options['user']:
+            target = options['to']
+            if target is None or not 0 <= target < shard_count:
+                raise CommandError(
+                    f"--to must be a shard index from 0 to {shard_count - 1}"
+                )
+            moves += [
+                (user_id, get_user_shard(user_id), target)
+                for user_id in options['user']
+                if get_user_shard(user_id) != target
+            ]
+        if options['auto']:
+            moved_user_ids = {user_id for user_id, _, _ in moves}
+            moves += [
+                move for move in plan_rebalance(options['max_moves'])
+                if move[0] not in moved_user_ids
+            ]
+
+        for user_id, source, target in moves:
+            self.log(f"User {user_id}: shard {source} -> shard {target}")
+        if options['dry_run'] or not moves:
+            return
+        move_users(moves, wait=options['wait'], log=self.log)
+        self.stdout.write(self.style.SUCCESS(f"Moved {len(moves)} users"))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from todos.task_list import rebuild_task_list
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the task list table served by the v4 task list from the "
+        "task, tag and user tables"
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        entry_count = rebuild_task_list()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {entry_count} task list entries in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from todos.models import TaskStat, TaskTagStat
+from todos.stats import rebuild_task_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the materialized task count tables used by the stats API "
+        "from the task and task_tags tables"
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuild_task_stats()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {TaskStat.objects.count()} task stat rows and "
+            f"{TaskTagStat.objects.count()} task tag stat rows "
+            f"in {elapsed:.2f}s"
+        ))
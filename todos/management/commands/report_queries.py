@@ -0,0 +1,170 @@
+import json
+import logging
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.query_budget import get_query_budget_settings
+from todos.management.benchmarks import benchmark_database, seed_tasks
+from todos.stats import rebuild_task_stats
+
+# The placeholders of the records created by the write requests
+CREATED_RECORD_KEYS = {
+    "/api/v4/tasks/": "new_task",
+    "/api/v4/tags/": "new_tag",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Request the API endpoints against a seeded database and report "
+        "their queries: the budgets exceeded and the N+1 queries grouped by "
+        "call site. The requests are authenticated with a JWT like the "
+        "clients' ones"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=200)
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help=(
+                "GET endpoint to check, may be repeated, {task} and {tag} "
+                "are replaced by the uuid of a seeded record. Defaults to "
+                "the task and tag endpoints of every API version, followed "
+                "by the writes of the v4 task and tag endpoints"
+            )
+        )
+        parser.add_argument(
+            '--fail', action='store_true',
+            help="Exit with an error when an endpoint has offenders (CI)"
+        )
+
+    def get_default_urls(self):
+        urls = []
+        for version in ("v1", "v2", "v3", "v4"):
+            urls += [
+                f"/api/{version}/tasks/",
+                f"/api/{version}/tasks/{{task}}",
+                f"/api/{version}/tags/",
+                f"/api/{version}/tags/{{tag}}",
+            ]
+        return urls + ["/api/v4/tasks/?page_size=50", "/api/v4/stats/"]
+
+    def get_write_requests(self, user, tags):
+        """
+        Return the (method, url, body) of the v4 writes. {new_task} and
+        {new_tag} are replaced by the uuid of the task and the tag created
+        by the first requests.
+        """
+        tag_uuids = [str(tag.uuid) for tag in tags]
+        return [
+            ("POST", "/api/v4/tasks/", {
+                "title": "Report task",
+                "text": "Some text describing the task",
+                "created_by": user.id,
+                "tags": tag_uuids[1:4],
+            }),
+            ("PATCH", "/api/v4/tasks/{new_task}", {
+                "completion_status": "COMPLETED",
+            }),
+            ("PATCH", "/api/v4/tasks/{new_task}", {"title": "Renamed"}),
+            ("PATCH", "/api/v4/tasks/{new_task}", {"tags": tag_uuids[3:6]}),
+            ("POST", "/api/v4/tasks/{new_task}/tags/", {
+                "tags": tag_uuids[6:8],
+            }),
+            ("DELETE", "/api/v4/tasks/{new_task}/tags/", {
+                "tags": tag_uuids[3:5],
+            }),
+            ("POST", "/api/v4/tasks/{new_task}/toggle", None),
+            ("DELETE", "/api/v4/tasks/{new_task}", None),
+            ("POST", "/api/v4/tags/", {"name": "report-tag"}),
+            ("PATCH", "/api/v4/tags/{new_tag}", {"name": "report-renamed"}),
+            ("DELETE", "/api/v4/tags/{new_tag}", None),
+            # A tag of many tasks
+            ("PATCH", "/api/v4/tags/{tag}", {"name": "report-seeded"}),
+            ("DELETE", "/api/v4/tags/{tag}", None),
+        ]
+
+    def request_all(self, requests, user, task, tag):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        uuids = {"task": task.uuid, "tag": tag.uuid}
+        reports = []
+        # The offenders are reported here instead of logged
+        logger = logging.getLogger("core.query_budget")
+        disabled = logger.disabled
+        logger.disabled = True
+        try:
+            for method, url, body in requests:
+                response = client.generic(
+                    method, url.format(**uuids),
+                    **({} if body is None else {
+                        "data": json.dumps(body),
+                        "content_type": "application/json",
+                    })
+                )
+                report = getattr(response, "query_report", None)
+                if report is None:
+                    raise CommandError(f"{method} {url} wasn't recorded")
+                reports.append((response.status_code, report))
+                if url in CREATED_RECORD_KEYS and response.status_code == 201:
+                    uuids[CREATED_RECORD_KEYS[url]] = response.data["uuid"]
+        finally:
+            logger.disabled = disabled
+        return reports
+
+    def handle(self, *args, **options):
+        config = dict(get_query_budget_settings(), ENABLED=True, RAISE=False)
+        with benchmark_database(), override_settings(
+            QUERY_BUDGETS=config,
+            RATE_LIMITS={"ENABLED": False},
+            ALLOWED_HOSTS=["testserver"],
+        ):
+            users, tags, tasks = seed_tasks(options['tasks'])
+            # The writes update the stats of the seeded tasks
+            rebuild_task_stats()
+            if options['urls']:
+                requests = [("GET", url, None) for url in options['urls']]
+            else:
+                requests = [
+                    ("GET", url, None) for url in self.get_default_urls()
+                ] + self.get_write_requests(users[0], tags)
+            reports = self.request_all(
+                requests, users[0], tasks[0], tags[0]
+            )
+
+        self.stdout.write("Endpoints")
+        for status_code, report in reports:
+            line = f"  {status_code} {report.format().splitlines()[0]}"
+            if report.ok:
+                self.stdout.write(line)
+            else:
+                self.stdout.write(self.style.WARNING(line))
+
+        # {call site: [(endpoint, fingerprint, database, count)]}
+        offenders = defaultdict(list)
+        for _, report in reports:
+            for call_site, queries in report.n_plus_one.items():
+                for fingerprint, alias, count, _ in queries:
+                    offenders[call_site].append(
+                        (report.name, fingerprint, alias, count)
+                    )
+        if offenders:
+            self.stdout.write("\nN+1 queries by call site")
+        for call_site, queries in sorted(offenders.items()):
+            self.stdout.write(self.style.WARNING(f"  {call_site}"))
+            for name, fingerprint, alias, count in queries:
+                self.stdout.write(f"    {count}x on {alias} by {name}")
+                self.stdout.write(f"      {fingerprint}")
+
+        failed = [report for _, report in reports if not report.ok]
+        if failed and options['fail']:
+            raise CommandError(
+                f"{len(failed)} endpoints exceed their query budget or run "
+                f"N+1 queries"
+            )
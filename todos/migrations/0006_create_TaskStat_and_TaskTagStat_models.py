@@ -0,0 +1,55 @@
+# Generated by Django 4.1.4 on 2026-10-19 17:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todos', '0005_Task_model__added_created_by_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTagStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completion_status', models.CharField(choices=[('COMPLETED', 'Completed'), ('INCOMPLETE', 'Incomplete')], max_length=50)),
+                ('created_day', models.DateField()),
+                ('task_count', models.PositiveIntegerField(default=0)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('tag', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='todos.tag')),
+            ],
+            options={
+                'verbose_name': 'task tag stat',
+                'verbose_name_plural': 'task tag stats',
+                'db_table': 'task_tag_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completion_status', models.CharField(choices=[('COMPLETED', 'Completed'), ('INCOMPLETE', 'Incomplete')], max_length=50)),
+                ('created_day', models.DateField()),
+                ('task_count', models.PositiveIntegerField(default=0)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'task stat',
+                'verbose_name_plural': 'task stats',
+                'db_table': 'task_stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tasktagstat',
+            constraint=models.UniqueConstraint(fields=('created_by', 'completion_status', 'tag', 'created_day'), name='unique_task_tag_stat'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskstat',
+            constraint=models.UniqueConstraint(fields=('created_by', 'completion_status', 'created_day'), name='unique_task_stat'),
+        ),
+    ]
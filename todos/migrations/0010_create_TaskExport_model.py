@@ -0,0 +1,45 @@
+# Generated by Django 4.1.4 on 2026-10-19 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_create_Job_model'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todos', '0009_create_TaskImport_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False)),
+                ('file_format', models.CharField(choices=[('NDJSON_GZ', 'Gzipped NDJSON'), ('COLUMNAR', 'Gzipped columnar JSON')], default='NDJSON_GZ', max_length=20)),
+                ('file_path', models.CharField(blank=True, default='', max_length=500)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed')], default='QUEUED', max_length=20)),
+                ('max_task_id', models.PositiveBigIntegerField(default=0)),
+                ('last_task_id', models.PositiveBigIntegerField(default=0)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('file_size', models.PositiveBigIntegerField(default=0)),
+                ('failure', models.TextField(blank=True, default='')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('started_date', models.DateTimeField(blank=True, null=True)),
+                ('finished_date', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_exports', to=settings.AUTH_USER_MODEL)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='jobs.job')),
+            ],
+            options={
+                'verbose_name': 'task export',
+                'verbose_name_plural': 'task exports',
+                'db_table': 'task_exports',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.4 on 2026-10-19 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todos', '0011_Task_model__added_version_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskShardAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('moving', models.BooleanField(default=False)),
+                ('modified_date', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='task_shard_assignment', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'task shard assignment',
+                'verbose_name_plural': 'task shard assignments',
+                'db_table': 'task_shard_assignments',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.1.4 on 2026-10-19 18:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('todos', '0013_create_IdempotentRequest_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskListEntry',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('uuid', models.UUIDField()),
+                ('title', models.CharField(max_length=200)),
+                ('text', models.TextField()),
+                ('completion_status', models.CharField(max_length=50)),
+                ('completion_label', models.CharField(max_length=50)),
+                ('created_by_name', models.CharField(max_length=301)),
+                ('created_date', models.DateTimeField()),
+                ('created_date_display', models.CharField(max_length=50)),
+                ('modified_date', models.DateTimeField()),
+                ('modified_date_display', models.CharField(max_length=50)),
+                ('version', models.PositiveIntegerField()),
+                ('tags', models.JSONField(default=list)),
+                ('created_by', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'task list entry',
+                'verbose_name_plural': 'task list entries',
+                'db_table': 'task_list_entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tasklistentry',
+            index=models.Index(fields=['title', 'id'], name='task_list_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasklistentry',
+            index=models.Index(fields=['created_date', 'id'], name='task_list_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasklistentry',
+            index=models.Index(fields=['modified_date', 'id'], name='task_list_modified_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasklistentry',
+            index=models.Index(fields=['completion_status', 'id'], name='task_list_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.4 on 2026-10-19 18:43
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0014_create_TaskListEntry_model'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='tasklistentry',
+            name='completion_label',
+        ),
+    ]
@@ -1,10 +1,12 @@
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
-from core.behaviours import UUIDMixin
+from core.behaviours import SoftDeleteMixin, UUIDMixin, VersionMixin
 
 
-class Tag(UUIDMixin):
+class Tag(UUIDMixin, SoftDeleteMixin):
     """
     This model represents a tag.
     Multiple tags can be associated with a task.
@@ -16,6 +18,14 @@ class Tag(UUIDMixin):
         db_table = "tags"
         verbose_name = "tag"
         verbose_name_plural = "tags"
+        # The deleted tags waiting to be purged, only these rows are indexed
+        indexes = [
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="tag_deleted_at_idx",
+            ),
+        ]
 
     def __repr__(self) -> str:
         return self.name
@@ -24,9 +34,11 @@ class Tag(UUIDMixin):
         return self.name
 
 
-class Task(UUIDMixin):
+class Task(UUIDMixin, SoftDeleteMixin, VersionMixin):
     """
     This model represents a task.
+    Concurrent updates are detected with the version column, see
+    core.behaviours.VersionMixin.
     """
     # The title of the task
     title = models.CharField(max_length=200)
@@ -70,6 +82,396 @@ class Task(UUIDMixin):
         db_table = "task"
         verbose_name = "task"
         verbose_name_plural = "tasks"
+        # Indexes serving the orderings allowed in todos/ordering.py
+        indexes = [
+            models.Index(
+                fields=["title", "id"], name="task_title_id_idx"
+            ),
+            models.Index(
+                fields=["created_date", "id"], name="task_created_date_id_idx"
+            ),
+            models.Index(
+                fields=["modified_date", "id"],
+                name="task_modified_date_id_idx"
+            ),
+            models.Index(
+                fields=["completion_status", "id"],
+                name="task_status_id_idx"
+            ),
+            # The deleted tasks waiting to be purged, only these rows are
+            # indexed
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="task_deleted_at_idx",
+            ),
+        ]
+
+    def __repr__(self) -> str:
+        return self.title
+
+    def __str__(self) -> str:
+        return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the values loaded from the database so that the signal
+        # handlers can tell which fields were changed on save
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class BaseTaskStat(models.Model):
+    """
+    Common fields of the materialized task count tables.
+    These tables are maintained by the signal handlers in todos/signals.py
+    and can be rebuilt with `manage.py rebuild_task_stats`.
+    """
+    created_by = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    completion_status = models.CharField(
+        max_length=50,
+        choices=Task.CompletionStatus.choices,
+    )
+    # The day the tasks were created on, weekly counts are summed from it
+    created_day = models.DateField()
+    task_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class TaskStat(BaseTaskStat):
+    """
+    Number of tasks per user, completion status and creation day.
+    """
+
+    class Meta:
+        db_table = "task_stats"
+        verbose_name = "task stat"
+        verbose_name_plural = "task stats"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["created_by", "completion_status", "created_day"],
+                name="unique_task_stat",
+            ),
+        ]
+
+
+class TaskTagStat(BaseTaskStat):
+    """
+    Number of tasks per user, completion status, tag and creation day.
+    A task with multiple tags is counted once for each of its tags, tasks
+    without any tag are counted with an empty tag.
+    """
+    tag = models.ForeignKey(
+        to=Tag,
+        on_delete=models.CASCADE,
+        related_name="+",
+        null=True,
+    )
+
+    class Meta:
+        db_table = "task_tag_stats"
+        verbose_name = "task tag stat"
+        verbose_name_plural = "task tag stats"
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "created_by", "completion_status", "tag", "created_day"
+                ],
+                name="unique_task_tag_stat",
+            ),
+        ]
+
+
+class TaskImport(UUIDMixin):
+    """
+    This model represents a bulk import of tasks from an uploaded file.
+    The import is run by a background job, see todos/imports.py.
+    """
+
+    class FileFormat(models.TextChoices):
+        CSV = 'CSV', "CSV"
+        NDJSON = 'NDJSON', "NDJSON"
+
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', "Queued"
+        RUNNING = 'RUNNING', "Running"
+        SUCCEEDED = 'SUCCEEDED', "Succeeded"
+        FAILED = 'FAILED', "Failed"
+
+    # The user who uploaded the file, the tasks are created by this user
+    created_by = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="task_imports",
+    )
+    file_format = models.CharField(max_length=10, choices=FileFormat.choices)
+    # The spooled upload, deleted once the import is finished
+    file_path = models.CharField(max_length=500)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.QUEUED
+    )
+    # The background job running the import
+    job = models.ForeignKey(
+        to="jobs.Job",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+
+    # |------------------------------ Progress -----------------------------| #
+    total_bytes = models.PositiveBigIntegerField(default=0)
+    processed_bytes = models.PositiveBigIntegerField(default=0)
+    # Rows read, imported and rejected so far
+    row_count = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # [{"row": <row number>, "errors": {<field>: [<message>, ...]}}, ...]
+    # for the first TASK_IMPORTS["MAX_ERRORS"] rejected rows
+    errors = models.JSONField(default=list, blank=True)
+    # Why the import failed or was retried
+    failure = models.TextField(blank=True, default='')
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "task_imports"
+        verbose_name = "task import"
+        verbose_name_plural = "task imports"
+
+    def __repr__(self) -> str:
+        return f"{self.uuid} ({self.status})"
+
+    def __str__(self) -> str:
+        return f"{self.uuid} ({self.status})"
+
+
+class TaskExport(UUIDMixin):
+    """
+    This model represents an export of the tasks to a compressed file.
+    The export is run by a background job, see todos/exports.py.
+    """
+
+    class FileFormat(models.TextChoices):
+        NDJSON_GZ = 'NDJSON_GZ', "Gzipped NDJSON"
+        COLUMNAR = 'COLUMNAR', "Gzipped columnar JSON"
+
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', "Queued"
+        RUNNING = 'RUNNING', "Running"
+        SUCCEEDED = 'SUCCEEDED', "Succeeded"
+        FAILED = 'FAILED', "Failed"
+
+    # The user who requested the export
+    created_by = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="task_exports",
+    )
+    file_format = models.CharField(
+        max_length=20,
+        choices=FileFormat.choices,
+        default=FileFormat.NDJSON_GZ
+    )
+    file_path = models.CharField(max_length=500, blank=True, default='')
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.QUEUED
+    )
+    # The background job running the export
+    job = models.ForeignKey(
+        to="jobs.Job",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+
+    # |------------------------------ Progress -----------------------------| #
+    # The tasks with an id up to max_task_id when the export started are
+    # exported, last_task_id is the id of the last exported task
+    max_task_id = models.PositiveBigIntegerField(default=0)
+    last_task_id = models.PositiveBigIntegerField(default=0)
+    total_rows = models.PositiveIntegerField(default=0)
+    row_count = models.PositiveIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    # Size of the file up to the last committed chunk
+    file_size = models.PositiveBigIntegerField(default=0)
+    # Why the export failed or was retried
+    failure = models.TextField(blank=True, default='')
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "task_exports"
+        verbose_name = "task export"
+        verbose_name_plural = "task exports"
+
+    def __repr__(self) -> str:
+        return f"{self.uuid} ({self.status})"
+
+    def __str__(self) -> str:
+        return f"{self.uuid} ({self.status})"
+
+
+class TaskShardAssignment(models.Model):
+    """
+    This model represents the shard of a user moved by
+    `manage.py rebalance_shards`, the other users' tasks are on the shard
+    given by their id (see todos/sharding.py). Kept on the default database.
+    """
+    user = models.OneToOneField(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="task_shard_assignment",
+    )
+    # Index of the shard holding the tasks of the user
+    shard = models.PositiveSmallIntegerField()
+    # The tasks of the user are being copied to another shard, their writes
+    # are refused meanwhile
+    moving = models.BooleanField(default=False)
+    modified_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "task_shard_assignments"
+        verbose_name = "task shard assignment"
+        verbose_name_plural = "task shard assignments"
+
+    def __repr__(self) -> str:
+        return f"{self.user_id} -> {self.shard}"
+
+    def __str__(self) -> str:
+        return f"{self.user_id} -> {self.shard}"
+
+
+class IdempotentRequest(models.Model):
+    """
+    This model represents a POST request sent with an Idempotency-Key
+    header, and its response once it is done. A request repeating the key
+    gets the stored response instead of being run again, see
+    todos/idempotency.py. Kept on the default database.
+    """
+
+    class Status(models.TextChoices):
+        PROCESSING = 'PROCESSING', "Processing"
+        COMPLETED = 'COMPLETED', "Completed"
+
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    # The Idempotency-Key header, unique per user
+    key = models.CharField(max_length=200)
+    # Hash of the method, path and body, a key can't be reused for another
+    # request
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PROCESSING
+    )
+    # The response replayed to the requests repeating the key
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(
+        null=True, blank=True, encoder=DjangoJSONEncoder
+    )
+    # When the request holding the key started, reset when a stale or
+    # expired key is taken over
+    started_date = models.DateTimeField(default=timezone.now)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "idempotent_requests"
+        verbose_name = "idempotent request"
+        verbose_name_plural = "idempotent requests"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"],
+                name="idempotent_request_user_key_unique",
+            ),
+        ]
+        indexes = [
+            # Read to delete the expired keys
+            models.Index(
+                fields=["started_date"],
+                name="idempotent_request_started_idx",
+            ),
+        ]
+
+    def __repr__(self) -> str:
+        return f"{self.key} ({self.status})"
+
+    def __str__(self) -> str:
+        return f"{self.key} ({self.status})"
+
+
+class TaskListEntry(models.Model):
+    """
+    This model represents a task as rendered by the v4 task list, one row
+    per (not deleted) task with its fields already formatted, so that a list
+    page is read from this table alone. The rows are written with the
+    changes of the tasks, tags and users, see todos/task_list.py. Kept on
+    the database of the task (its shard when the tasks are sharded).
+    """
+    # The id of the task
+    id = models.BigIntegerField(primary_key=True)
+    uuid = models.UUIDField()
+    title = models.CharField(max_length=200)
+    text = models.TextField()
+    # Its label is resolved in the language of the request when rendered
+    completion_status = models.CharField(max_length=50)
+    created_by = models.ForeignKey(
+        to=User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    # "<first name> <last name>" of the creator
+    created_by_name = models.CharField(max_length=301)
+    # The dates to filter and sort on, and as they are rendered
+    created_date = models.DateTimeField()
+    created_date_display = models.CharField(max_length=50)
+    modified_date = models.DateTimeField()
+    modified_date_display = models.CharField(max_length=50)
+    version = models.PositiveIntegerField()
+    # [{"uuid": ..., "name": ...}, ...] of the tags of the task
+    tags = models.JSONField(default=list)
+
+    class Meta:
+        db_table = "task_list_entries"
+        verbose_name = "task list entry"
+        verbose_name_plural = "task list entries"
+        # The same orderings as the task table, see todos/ordering.py
+        indexes = [
+            models.Index(
+                fields=["title", "id"], name="task_list_title_id_idx"
+            ),
+            models.Index(
+                fields=["created_date", "id"],
+                name="task_list_created_id_idx"
+            ),
+            models.Index(
+                fields=["modified_date", "id"],
+                name="task_list_modified_id_idx"
+            ),
+            models.Index(
+                fields=["completion_status", "id"],
+                name="task_list_status_id_idx"
+            ),
+        ]
 
     def __repr__(self) -> str:
         return self.title
@@ -0,0 +1,23 @@
+from core.ordering import OrderingSpec
+
+# Orderings accepted by the task list APIs.
+# Every key except created_by is backed by a (<field>, id) index declared on
+# Task.Meta.indexes; created_by uses the index of the foreign key.
+TASK_ORDERING = OrderingSpec(
+    fields={
+        "id": "id",
+        "title": "title",
+        "created_date": "created_date",
+        "modified_date": "modified_date",
+        "completion_status": "completion_status",
+        "created_by": "created_by_id",
+    },
+    indexed=[
+        ("title",),
+        ("created_date",),
+        ("modified_date",),
+        ("completion_status",),
+        ("created_by",),
+    ],
+    default=("id",),
+)
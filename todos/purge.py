@@ -0,0 +1,136 @@
+"""
+Physical deletion of the soft deleted tasks and tags.
+
+Deleting a record only marks it as deleted (see core.behaviours), the rows
+are deleted later by `manage.py purge_deleted`. The rows are deleted in
+chunks of SOFT_DELETE_PURGE["CHUNK_SIZE"], one transaction per chunk, so that
+SQLite's write lock is only held for short periods and the requests writing
+at the same time don't wait for the whole purge.
+
+The stats, the task index and the tag vocabulary were already updated when
+the records were marked as deleted, the delete signal handlers skip the
+purged records.
+
+When the tasks are sharded (see todos/sharding.py) the tasks and task_tags
+rows are purged on every shard, and a purged tag is deleted from the
+shards by the replication once it's deleted from the default database.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from todos.models import Tag, Task
+from todos.sharding import get_task_databases
+
+DEFAULT_SETTINGS = {
+    "RETENTION": 3600,
+    "CHUNK_SIZE": 500,
+    "PAUSE": 0.05,
+}
+
+
+def get_purge_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "SOFT_DELETE_PURGE", {}))
+    return config
+
+
+class Purger:
+    """
+    Delete the records soft deleted before `deleted_before` in chunks.
+    """
+
+    def __init__(self, deleted_before=None, chunk_size=None, pause=None):
+        config = get_purge_settings()
+        if deleted_before is None:
+            deleted_before = timezone.now() - timedelta(
+                seconds=config["RETENTION"]
+            )
+        self.deleted_before = deleted_before
+        self.chunk_size = chunk_size or config["CHUNK_SIZE"]
+        self.pause = config["PAUSE"] if pause is None else pause
+        self.chunk_count = 0
+
+    def _delete_chunk(self, delete, using=None):
+        """
+        Run `delete()` in its own transaction and return its row count.
+        """
+        with transaction.atomic(using=using):
+            row_count = delete()
+        if row_count:
+            self.chunk_count += 1
+            if self.pause:
+                time.sleep(self.pause)
+        return row_count
+
+    def get_deleted(self, model, using=None):
+        return model.all_objects.using(using).filter(
+            deleted_at__isnull=False, deleted_at__lte=self.deleted_before
+        )
+
+    def purge_through_rows(self, using=None, **lookup):
+        """
+        Delete the task_tags rows matching the lookup, by chunks.
+        """
+        through = Task.tags.through
+
+        def delete():
+            row_ids = list(
+                through.objects
+                .using(using)
+                .filter(**lookup)
+                .values_list('id', flat=True)[:self.chunk_size]
+            )
+            through.objects.using(using).filter(id__in=row_ids).delete()
+            return len(row_ids)
+
+        row_count = 0
+        while chunk_row_count := self._delete_chunk(delete, using):
+            row_count += chunk_row_count
+        return row_count
+
+    def purge_tasks(self, using=None):
+        def delete():
+            task_ids = list(
+                self.get_deleted(Task, using)
+                .values_list('id', flat=True)[:self.chunk_size]
+            )
+            if task_ids:
+                Task.tags.through.objects.using(using).filter(
+                    task_id__in=task_ids
+                ).delete()
+                Task.all_objects.using(using).filter(
+                    id__in=task_ids
+                ).delete()
+            return len(task_ids)
+
+        task_count = 0
+        while chunk_task_count := self._delete_chunk(delete, using):
+            task_count += chunk_task_count
+        return task_count
+
+    def purge_tags(self):
+        tag_ids = list(self.get_deleted(Tag).values_list('id', flat=True))
+        for tag_id in tag_ids:
+            # A popular tag has many task_tags rows, they are deleted first
+            # so that deleting the tag itself has nothing left to cascade
+            for using in get_task_databases():
+                self.purge_through_rows(using, tag_id=tag_id)
+            self._delete_chunk(
+                lambda: Tag.all_objects.filter(id=tag_id).delete()[0]
+            )
+        return len(tag_ids)
+
+    def purge(self):
+        """
+        Return {"tasks": <purged tasks>, "tags": <purged tags>}.
+        """
+        return {
+            "tasks": sum(
+                self.purge_tasks(using) for using in get_task_databases()
+            ),
+            "tags": self.purge_tags(),
+        }
@@ -0,0 +1,196 @@
+"""
+Read models of the task lists.
+
+A list page only reads its rows, but a Task model instance comes with its
+_state, its loaded values (see Task.from_db), field descriptors and related
+managers, and the tags and creator of each task cost a query of their own.
+The classes below are plain `__slots__` objects holding the columns the list
+serializers read. They are built straight from the cursor rows of a
+values_list() query, and the tags and creators of a page are loaded with one
+query each and shared by the tasks of the page.
+
+The serializers read them like model instances (attributes, `tags` is a
+list instead of a manager), so TaskSerializer works on both. They are read
+only: writes keep going through the models.
+
+    queryset = as_task_rows(Task.objects.filter(...).order_by(...))
+    page = queryset[:50]  # [TaskRow, ...], 3 queries
+
+Run `manage.py bench_read_models` to compare them with model instances.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db.models.query import ValuesListIterable
+
+from todos.models import Task
+from todos.sharding import ShardedTaskQuery
+
+
+class UserSummary:
+    """
+    The creator of a task as shown by the list serializers.
+    """
+    __slots__ = ("id", "first_name", "last_name")
+
+    fields = ("id", "first_name", "last_name")
+
+    def __init__(self, id, first_name, last_name):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class TagRow:
+    """
+    A tag of a task.
+    """
+    __slots__ = ("id", "uuid", "name")
+
+    def __init__(self, id, uuid, name):
+        self.id = id
+        self.uuid = uuid
+        self.name = name
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+
+class TaskRow:
+    """
+    A task of a list, with its tags and creator. `using` is the database
+    the row was read from (a shard when the tasks are sharded).
+    """
+    # The columns read from the task table, in the order of the rows
+    fields = (
+        "id", "uuid", "title", "text", "completion_status", "created_by_id",
+        "created_date", "modified_date", "version",
+    )
+    __slots__ = fields + ("using", "tags", "created_by")
+
+    def __init__(
+        self, id, uuid, title, text, completion_status, created_by_id,
+        created_date, modified_date, version, using=None
+    ):
+        self.id = id
+        self.uuid = uuid
+        self.title = title
+        self.text = text
+        self.completion_status = completion_status
+        self.created_by_id = created_by_id
+        self.created_date = created_date
+        self.modified_date = modified_date
+        self.version = version
+        self.using = using
+        self.tags = []
+        self.created_by = None
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.title
+
+
+def load_task_tags(task_rows, using):
+    """
+    Set the tags of the tasks, with a single query. A tag is shared by the
+    tasks it is linked to.
+    """
+    rows_by_id = {task_row.id: task_row for task_row in task_rows}
+    links = (
+        Task.tags.through.objects
+        .using(using)
+        .filter(task_id__in=rows_by_id, tag__deleted_at__isnull=True)
+        # The order of task.tags.all(), read through the unique index
+        .order_by("task_id", "tag_id")
+        .values_list("task_id", "tag_id", "tag__uuid", "tag__name")
+    )
+    tags = {}
+    for task_id, tag_id, tag_uuid, tag_name in links:
+        tag = tags.get(tag_id)
+        if tag is None:
+            tag = tags[tag_id] = TagRow(tag_id, tag_uuid, tag_name)
+        rows_by_id[task_id].tags.append(tag)
+
+
+def load_task_creators(task_rows):
+    """
+    Set the creators of the tasks, with a single query.
+    """
+    rows_by_user = defaultdict(list)
+    for task_row in task_rows:
+        rows_by_user[task_row.created_by_id].append(task_row)
+    users = User.objects.filter(id__in=rows_by_user).values_list(
+        *UserSummary.fields
+    )
+    for values in users:
+        user = UserSummary(*values)
+        for task_row in rows_by_user[user.id]:
+            task_row.created_by = user
+
+
+def load_task_related(task_rows):
+    """
+    Set the tags and creators of task rows read from any database.
+    """
+    rows_by_database = defaultdict(list)
+    for task_row in task_rows:
+        rows_by_database[task_row.using].append(task_row)
+    for using, database_rows in rows_by_database.items():
+        load_task_tags(database_rows, using)
+    if task_rows:
+        load_task_creators(task_rows)
+
+
+class BareTaskRowIterable(ValuesListIterable):
+    """
+    Yield the rows of a values_list() queryset of the TaskRow fields as
+    TaskRow objects, without their tags and creators.
+    """
+
+    def __iter__(self):
+        using = self.queryset.db
+        for values in super().__iter__():
+            yield TaskRow(*values, using=using)
+
+
+class TaskRowIterable(BareTaskRowIterable):
+    """
+    BareTaskRowIterable loading the tags and creators of the rows.
+    """
+
+    def __iter__(self):
+        task_rows = list(super().__iter__())
+        if task_rows:
+            load_task_tags(task_rows, self.queryset.db)
+            load_task_creators(task_rows)
+        return iter(task_rows)
+
+
+def as_task_rows(queryset, load_related=True):
+    """
+    Return the queryset (or ShardedTaskQuery) of Task yielding TaskRow
+    objects instead of Task instances. The filters, ordering, counting and
+    slicing are left as they are. Without load_related, the tags and
+    creators are left to load_task_related().
+    """
+    if isinstance(queryset, ShardedTaskQuery):
+        return ShardedTaskQuery({
+            shard: as_task_rows(shard_queryset, load_related)
+            for shard, shard_queryset in queryset.querysets.items()
+        })
+    queryset = queryset.values_list(*TaskRow.fields)
+    queryset._iterable_class = (
+        TaskRowIterable if load_related else BareTaskRowIterable
+    )
+    return queryset
@@ -1,17 +1,54 @@
 from django.contrib.auth.models import User
+from django.db import router, transaction
 from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework.serializers import (
     ValidationError,
     ModelSerializer,
     SerializerMethodField,
+    ChoiceField,
     DateTimeField,
+    IntegerField,
+    ListField,
     PrimaryKeyRelatedField,
-    SlugRelatedField,
+    Serializer,
+    UUIDField,
 )
-from todos.models import Tag, Task
 
+from core.batch import get_batch_cached
+from core.behaviours import VersionConflict
+from core.exceptions import Conflict
+from core.fields import BulkSlugRelatedField, ChoiceLabelField
+from todos.models import Tag, Task, TaskExport, TaskImport
+from todos.sharding import is_sharded
+from todos.tagging import diff_task_tags, get_tag_ids, save_task
 
-class TagSerializer(ModelSerializer):
+
+class NativeTypesMixin:
+    """
+    When the accepted renderer encodes UUIDs and datetimes natively
+    (MessagePack, CBOR), these fields are returned as python objects instead
+    of being converted to strings.
+    """
+    native_field_classes = (UUIDField, DateTimeField)
+
+    def use_native_types(self):
+        request = self.context.get("request")
+        renderer = getattr(request, "accepted_renderer", None)
+        return getattr(renderer, "native_types", False)
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        if not self.use_native_types():
+            return ret
+        for field in self._readable_fields:
+            if isinstance(field, self.native_field_classes):
+                ret[field.field_name] = field.get_attribute(instance)
+        return ret
+
+
+class TagSerializer(NativeTypesMixin, ModelSerializer):
     """
     This serializer is responsible for the serialization &
     de-serialization for Tag model recrods.
@@ -29,10 +66,10 @@ class TagSerializer(ModelSerializer):
 
     class Meta:
         model = Tag
-        exclude = ['id']
+        exclude = ['id', 'deleted_at']
 
 
-class TagRetrieveSerializer(ModelSerializer):
+class TagRetrieveSerializer(NativeTypesMixin, ModelSerializer):
     """
     This serializer is responsible for the serialization &
     de-serialization for Tag model recrods.
@@ -61,48 +98,171 @@ class TagRetrieveSerializer(ModelSerializer):
 
     class Meta:
         model = Tag
-        exclude = ['id']
+        exclude = ['id', 'deleted_at']
 
 
-class TaskCreateUpdateSerializer(ModelSerializer):
+def get_task_version_conflict(version):
+    return Conflict(
+        detail={
+            "message": (
+                f"The task was changed by another request since version "
+                f"{version} was read, fetch it again before updating it"
+            )
+        }
+    )
+
+
+class TaskCreateUpdateSerializer(NativeTypesMixin, ModelSerializer):
     """
     This serializer is responsible for the de-serialization
     for the Task model records.
+
+    An update only writes the changed columns and tag links, with an UPDATE
+    conditioned on the version of the task. The version defaults to the one
+    read by the request, clients send the version they have seen to make
+    sure that nobody changed the task since then. A conflict is returned as
+    409.
     """
     created_by = PrimaryKeyRelatedField(
         queryset=User.objects.all()
     )
-    tags = SlugRelatedField(
+    tags = BulkSlugRelatedField(
         slug_field="uuid",
         queryset=Tag.objects.all(),
         many=True
     )
+    version = IntegerField(min_value=1, required=False)
+
+    def create(self, validated_data):
+        validated_data.pop('version', None)
+        tags = validated_data.pop('tags', [])
+        # Saved through the instance and not the manager, so that the
+        # database router sees its creator (see todos/sharding.py)
+        task = Task(**validated_data)
+        using = router.db_for_write(Task, instance=task)
+        with transaction.atomic(using=using):
+            task.save(using=using)
+            task.tags.add(*tags)
+        return task
+
+    def get_changed_fields(self, instance, validated_data):
+        changed_fields = []
+        for field_name, value in validated_data.items():
+            field = instance._meta.get_field(field_name)
+            if field.is_relation:
+                changed = getattr(instance, field.attname) != value.pk
+            else:
+                changed = getattr(instance, field_name) != value
+            if changed:
+                changed_fields.append(field_name)
+        return changed_fields
+
+    def update(self, instance, validated_data):
+        version = validated_data.pop('version', instance.version)
+        if version != instance.version:
+            raise get_task_version_conflict(version)
+
+        tags = validated_data.pop('tags', None)
+        added_tag_ids = removed_tag_ids = set()
+        if tags is not None:
+            added_tag_ids, removed_tag_ids = diff_task_tags(
+                instance, [tag.id for tag in tags]
+            )
+
+        changed_fields = self.get_changed_fields(instance, validated_data)
+        if 'created_by' in changed_fields and is_sharded():
+            raise ValidationError(
+                detail={
+                    "message": (
+                        "The creator of a task can't be changed when the "
+                        "tasks are sharded"
+                    )
+                }
+            )
+        if not changed_fields and not added_tag_ids and not removed_tag_ids:
+            return instance
+        for field_name in changed_fields:
+            setattr(instance, field_name, validated_data[field_name])
+
+        try:
+            save_task(
+                instance,
+                update_fields=changed_fields,
+                added_tag_ids=added_tag_ids,
+                removed_tag_ids=removed_tag_ids
+            )
+        except VersionConflict:
+            raise get_task_version_conflict(version)
+        return instance
 
     class Meta:
         model = Task
-        exclude = ['id', 'created_date', 'modified_date']
+        exclude = ['id', 'created_date', 'modified_date', 'deleted_at']
 
 
-class TaskSerializer(ModelSerializer):
+class TaskTagsSerializer(Serializer):
+    """
+    This serializer is responsible for the de-serialization of the tags
+    added to or removed from a task, the tags are returned as their ids.
+    """
+    tags = ListField(child=UUIDField(), allow_empty=False)
+    version = IntegerField(min_value=1, required=False)
+
+    def validate_tags(self, tag_uuids):
+        # A single query instead of one per tag
+        tag_ids = get_tag_ids(tag_uuids)
+        unknown_uuids = set(tag_uuids) - tag_ids.keys()
+        if unknown_uuids:
+            raise ValidationError(
+                detail=(
+                    f"Unknown tags: "
+                    f"{', '.join(sorted(map(str, unknown_uuids)))}"
+                )
+            )
+        return list(tag_ids.values())
+
+
+class TaskStatFilterSerializer(Serializer):
+    """
+    This serializer is responsible for the validation of the filters of the
+    task stats, given as comma separated query params.
+    """
+    created_by = ListField(child=IntegerField(min_value=1), required=False)
+    completion_status = ListField(
+        child=ChoiceField(choices=Task.CompletionStatus.choices),
+        required=False,
+    )
+    tags = ListField(child=UUIDField(), required=False)
+
+    @classmethod
+    def from_query_params(cls, query_params):
+        return cls(data={
+            name: query_params[name].split(',')
+            for name in ("created_by", "completion_status", "tags")
+            if query_params.get(name)
+        })
+
+
+class TaskSerializer(NativeTypesMixin, ModelSerializer):
     """
     This serializer is responsible for the serialization
     for the Task model records.
     """
     tags = TagSerializer(many=True)
-    completion_status = SerializerMethodField()
+    # The label is resolved once per language, see ChoiceLabelField
+    completion_status = ChoiceLabelField()
     created_date = DateTimeField(format="%-d %B %Y, %A, %-I:%-M %p")
     modified_date = DateTimeField(format="%m/%d/%Y-%H:%M:%S")
     created_by = SerializerMethodField()
 
-    def get_completion_status(self, object):
-        return Task.CompletionStatus[object.completion_status].label
-
     def get_created_by(self, object):
+        # The creators are shared by the requests of a batch
+        created_by = get_batch_cached(
+            "users", object.created_by_id, lambda: object.created_by
+        )
         return {
-            "id": object.created_by.id,
-            "name": (
-                f"{object.created_by.first_name} {object.created_by.last_name}"
-            )
+            "id": created_by.id,
+            "name": f"{created_by.first_name} {created_by.last_name}"
         }
 
     class Meta:
@@ -118,5 +278,138 @@ class TaskSerializer(ModelSerializer):
             "created_by",
             "created_date",
             "modified_date",
+            "version",
             "tags"
         )
+
+
+class TaskImportSerializer(NativeTypesMixin, ModelSerializer):
+    """
+    This serializer is responsible for the serialization of the status and
+    progress of the TaskImport records.
+    """
+    status = SerializerMethodField()
+    rows_per_second = SerializerMethodField()
+    progress = SerializerMethodField()
+
+    def get_status(self, task_import):
+        # The job gave up on an import it couldn't finish
+        job = task_import.job
+        if (
+            job is not None and job.status == job.Status.FAILED
+            and task_import.status != TaskImport.Status.SUCCEEDED
+        ):
+            return TaskImport.Status.FAILED
+        return task_import.status
+
+    def get_rows_per_second(self, task_import):
+        if task_import.started_date is None:
+            return None
+        end = task_import.finished_date or timezone.now()
+        elapsed = (end - task_import.started_date).total_seconds()
+        return round(task_import.row_count / elapsed, 1) if elapsed else None
+
+    def get_progress(self, task_import):
+        """
+        Share of the uploaded file processed so far, between 0 and 1.
+        """
+        if not task_import.total_bytes:
+            return None
+        return round(
+            task_import.processed_bytes / task_import.total_bytes, 4
+        )
+
+    class Meta:
+        model = TaskImport
+        fields = (
+            "uuid",
+            "file_format",
+            "status",
+            "progress",
+            "rows_per_second",
+            "total_bytes",
+            "processed_bytes",
+            "row_count",
+            "imported_count",
+            "error_count",
+            "errors",
+            "failure",
+            "created_date",
+            "started_date",
+            "finished_date",
+        )
+
+
+class TaskExportSerializer(NativeTypesMixin, ModelSerializer):
+    """
+    This serializer is responsible for the serialization &
+    de-serialization of the TaskExport records.
+    """
+    file_format = ChoiceField(
+        choices=TaskExport.FileFormat.choices,
+        default=TaskExport.FileFormat.NDJSON_GZ
+    )
+    status = SerializerMethodField()
+    rows_per_second = SerializerMethodField()
+    progress = SerializerMethodField()
+    download_url = SerializerMethodField()
+
+    def get_status(self, task_export):
+        # The job gave up on an export it couldn't finish
+        job = task_export.job
+        if (
+            job is not None and job.status == job.Status.FAILED
+            and task_export.status != TaskExport.Status.SUCCEEDED
+        ):
+            return TaskExport.Status.FAILED
+        return task_export.status
+
+    def get_rows_per_second(self, task_export):
+        if task_export.started_date is None:
+            return None
+        end = task_export.finished_date or timezone.now()
+        elapsed = (end - task_export.started_date).total_seconds()
+        return round(task_export.row_count / elapsed, 1) if elapsed else None
+
+    def get_progress(self, task_export):
+        """
+        Share of the tasks exported so far, between 0 and 1.
+        """
+        if task_export.status == TaskExport.Status.SUCCEEDED:
+            return 1
+        if not task_export.total_rows:
+            return None
+        return round(task_export.row_count / task_export.total_rows, 4)
+
+    def get_download_url(self, task_export):
+        if task_export.status != TaskExport.Status.SUCCEEDED:
+            return None
+        request = self.context.get("request")
+        url = reverse(
+            "v4:task_export_download_v4",
+            kwargs={"uuid": task_export.uuid}
+        )
+        return request.build_absolute_uri(url) if request else url
+
+    class Meta:
+        model = TaskExport
+        fields = (
+            "uuid",
+            "file_format",
+            "status",
+            "progress",
+            "rows_per_second",
+            "total_rows",
+            "row_count",
+            "chunk_count",
+            "file_size",
+            "download_url",
+            "failure",
+            "created_date",
+            "started_date",
+            "finished_date",
+        )
+        read_only_fields = (
+            "total_rows", "row_count", "chunk_count", "file_size", "failure",
+            "created_date", "started_date", "finished_date",
+        )
@@ -0,0 +1,757 @@
+"""
+Partitioning of the tasks across several SQLite files by creator.
+
+SQLite serializes the writes to a database file, so a single file caps the
+write throughput of all the workers. With TASK_SHARDS["COUNT"] > 0 the
+`task` and `task_tags` tables are spread over COUNT more databases (the
+`shard_<k>` aliases added by core/settings.py), the tasks of a user living
+in shard `user id % COUNT` unless the user was moved by
+`manage.py rebalance_shards` (see TaskShardAssignment). The writes of users
+living on different shards don't wait for each other.
+
+- TaskShardRouter sends the tasks and their task_tags rows to the shard of
+  their creator, everything else stays on the default database.
+- The tags and the users are written to the default database and
+  replicated to every shard by the signal handlers, so the joins and the
+  foreign keys of a shard stay local to it.
+- Task ids are unique across the shards, the ids of shard k start at
+  (k + 1) << ID_BITS. A task moved to another shard gets a new id there,
+  its uuid doesn't change.
+- ShardedTaskQuery runs a TaskFilter on every shard it can match and merges
+  their sorted results, see TaskViewset (v4).
+
+The stats tables are global, on the default database, and are maintained
+from the writes of every shard. The writes made to a shard and to the
+default database are separate transactions.
+
+Only the v4 task APIs serve the sharded tasks. The v1 to v3 task APIs, the
+exports and the nested queries of todos/graph.py read the default database,
+which holds no tasks once they are moved: they return 400 when the tasks
+are sharded (see refuse_when_sharded), and the todos.E001 system check
+fails while the v1 to v3 APIs are in API_VERSIONS. The task index is
+disabled.
+
+Setting up the shards of an existing database:
+    manage.py migrate --database shard_<k>      (for every shard)
+    manage.py rebalance_shards --sync-replicas --from-default
+
+Settings (TASK_SHARDS):
+    COUNT: number of shards, 0 keeps everything on the default database
+    DIR: directory of the shard files
+    DIRECTORY_MAX_AGE: seconds after which a process reloads the shard
+        assignments of the moved users
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+from django_filters import utils
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException, NotFound, ValidationError
+)
+
+from todos.models import Tag, Task, TaskListEntry, TaskShardAssignment
+
+DEFAULT_SETTINGS = {
+    "COUNT": 0,
+    "DIR": settings.BASE_DIR / "shards",
+    "DIRECTORY_MAX_AGE": 30,
+}
+
+# The ids of the tasks created in shard k start at (k + 1) << ID_BITS
+ID_BITS = 40
+
+# Tables partitioned across the shards
+SHARDED_MODELS = {'todos.task', 'todos.task_tags'}
+# Tables copied from the default database to every shard
+REPLICATED_MODELS = {'todos.tag', 'auth.user'}
+# Apps migrated on the shards besides the models above, auth.User needs them
+SHARD_APPS = {'auth', 'contenttypes'}
+
+
+def get_shard_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_SHARDS", {}))
+    return config
+
+
+def get_shard_count():
+    return get_shard_settings()["COUNT"]
+
+
+def is_sharded():
+    return get_shard_count() > 0
+
+
+def get_shard_alias(shard):
+    return f"shard_{shard}"
+
+
+def get_shard_databases():
+    return [get_shard_alias(shard) for shard in range(get_shard_count())]
+
+
+def get_task_databases():
+    """
+    Return the aliases of the databases holding tasks.
+    """
+    return get_shard_databases() or [DEFAULT_DB_ALIAS]
+
+
+def refuse_when_sharded(feature):
+    """
+    Raise a 400 from the features reading the tasks of the default database
+    only, which would return nothing instead of the tasks of the shards.
+    """
+    if is_sharded():
+        raise ValidationError(
+            detail={
+                "message": (
+                    f"{feature} aren't available when the tasks are "
+                    f"sharded"
+                )
+            }
+        )
+
+
+class UserShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = {
+        "message": (
+            "The tasks of this user are being moved, retry in a moment"
+        )
+    }
+    default_code = "user_shard_moving"
+
+    def __init__(self, detail=None, code=None):
+        super().__init__(detail, code)
+        # Sent as the Retry-After header by DRF's exception handler
+        self.wait = max(get_shard_settings()["DIRECTORY_MAX_AGE"], 1)
+
+
+# |============================== Directory ===============================| #
+class ShardDirectory:
+    """
+    The shard assignments of the moved users, read from the default
+    database. Every process reloads it once it is older than
+    DIRECTORY_MAX_AGE, rebalance_shards waits as long between the steps of
+    a move.
+    """
+    __slots__ = ("shards", "moving", "loaded_at")
+
+    def __init__(self, assignments):
+        self.shards = {}
+        self.moving = set()
+        for user_id, shard, moving in assignments:
+            self.shards[user_id] = shard
+            if moving:
+                self.moving.add(user_id)
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        return cls(
+            TaskShardAssignment.objects
+            .values_list('user_id', 'shard', 'moving')
+        )
+
+    def get_shard(self, user_id):
+        shard = self.shards.get(user_id)
+        if shard is None or shard >= get_shard_count():
+            return user_id % get_shard_count()
+        return shard
+
+    def get_hidden_user_ids(self, shard):
+        """
+        Return the ids of the moved users whose rows on the shard, if any,
+        are copies being written or deleted by a move.
+        """
+        return [
+            user_id for user_id in self.shards
+            if self.get_shard(user_id) != shard
+        ]
+
+
+_directory = None
+_lock = threading.Lock()
+
+
+def get_shard_directory():
+    global _directory
+    directory = _directory
+    max_age = get_shard_settings()["DIRECTORY_MAX_AGE"]
+    if (
+        directory is None
+        or time.monotonic() - directory.loaded_at > max_age
+    ):
+        with _lock:
+            directory = _directory = ShardDirectory.load()
+    return directory
+
+
+def invalidate_shard_directory():
+    global _directory
+    _directory = None
+
+
+def get_user_shard(user_id):
+    return get_shard_directory().get_shard(user_id)
+
+
+def get_user_database(user_id, for_write=False):
+    directory = get_shard_directory()
+    if for_write and user_id in directory.moving:
+        raise UserShardMoving()
+    return get_shard_alias(directory.get_shard(user_id))
+
+
+def get_shard_queryset(queryset, shard):
+    """
+    Return the queryset run on the shard, leaving out the rows of the users
+    which don't live there.
+    """
+    queryset = queryset.using(get_shard_alias(shard))
+    hidden_user_ids = get_shard_directory().get_hidden_user_ids(shard)
+    if hidden_user_ids:
+        queryset = queryset.exclude(created_by_id__in=hidden_user_ids)
+    return queryset
+
+
+# |================================ Router ================================| #
+class TaskShardRouter:
+    """
+    Sends the tasks and their task_tags rows to the shard of their creator.
+    The queries without an instance hint go to the default database, the
+    queries of a shard are made with `.using()` (see get_shard_queryset).
+    """
+
+    def get_database(self, model, hints, for_write=False):
+        label = model._meta.label_lower
+        instance = hints.get('instance')
+        if instance is None or (
+            label not in SHARDED_MODELS and label not in REPLICATED_MODELS
+        ):
+            return None
+        if (
+            label in SHARDED_MODELS
+            and isinstance(instance, Task)
+            and instance._state.adding
+            and instance.created_by_id is not None
+        ):
+            # A new task, whose _state.db may have been set to the database
+            # of its creator by the foreign key
+            return get_user_database(
+                instance.created_by_id, for_write=for_write
+            )
+        # The related records of a task are read from its shard, the tags
+        # and users there are replicas
+        database = instance._state.db
+        if database in get_shard_databases():
+            return database
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.get_database(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.get_database(model, hints, for_write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        labels = {obj1._meta.label_lower, obj2._meta.label_lower}
+        if labels <= SHARDED_MODELS | REPLICATED_MODELS:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in get_shard_databases():
+            return None
+        if app_label in SHARD_APPS:
+            return True
+        return app_label == 'todos' and model_name in (
+            'tag', 'task', 'tasklistentry'
+        )
+
+
+# |=============================== Task ids ===============================| #
+def get_first_task_id(shard):
+    return (shard + 1) << ID_BITS
+
+
+def seed_task_ids(using):
+    """
+    Make the autoincrement of the task table of a shard start at the first
+    id of its range.
+    """
+    shard = get_shard_databases().index(using)
+    first_id = get_first_task_id(shard)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "UPDATE sqlite_sequence SET seq = %s "
+            "WHERE name = %s AND seq < %s",
+            [first_id, Task._meta.db_table, first_id],
+        )
+        cursor.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+            "WHERE NOT EXISTS "
+            "(SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+            [Task._meta.db_table, first_id, Task._meta.db_table],
+        )
+
+
+# |============================= Replication ==============================| #
+def get_field_values(instance):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    }
+
+
+def replicate(model, instances):
+    """
+    Write the given tags or users to every shard, inserting or updating
+    them with one query per shard.
+    """
+    rows = [get_field_values(instance) for instance in instances]
+    if not rows:
+        return
+    pk_name = model._meta.pk.name
+    update_fields = [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    for using in get_shard_databases():
+        model._base_manager.using(using).bulk_create(
+            [model(**values) for values in rows],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=[pk_name],
+            update_fields=update_fields,
+        )
+
+
+def delete_rows(using, model, column, values):
+    """
+    Delete the rows of the model's table whose column is in values with a
+    plain DELETE: the collector of QuerySet.delete() would follow relations
+    to tables which aren't on the shards, and send the delete signals.
+    """
+    values = list(values)
+    if not values:
+        return 0
+    quote_name = connections[using].ops.quote_name
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote_name(model._meta.db_table)} "
+            f"WHERE {quote_name(column)} IN "
+            f"({', '.join(['%s'] * len(values))})",
+            values,
+        )
+        return cursor.rowcount
+
+
+def delete_replicas(model, pks):
+    """
+    Delete the given tags or users from every shard.
+    """
+    pks = list(pks)
+    for using in get_shard_databases():
+        with transaction.atomic(using=using):
+            if model is Tag:
+                delete_rows(using, Task.tags.through, 'tag_id', pks)
+            delete_rows(using, model, model._meta.pk.column, pks)
+
+
+def sync_replicas(model, chunk_size=1000):
+    """
+    Copy every tag or user of the default database to the shards and delete
+    the ones missing from it.
+    """
+    pks = set()
+    queryset = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(
+            pk__gt=last_pk
+        )
+        instances = list(chunk[:chunk_size])
+        if not instances:
+            break
+        replicate(model, instances)
+        pks.update(instance.pk for instance in instances)
+        last_pk = instances[-1].pk
+
+    for using in get_shard_databases():
+        stale_pks = set(
+            model._base_manager.using(using).values_list('pk', flat=True)
+        ) - pks
+        if stale_pks:
+            with transaction.atomic(using=using):
+                if model is Tag:
+                    delete_rows(
+                        using, Task.tags.through, 'tag_id', stale_pks
+                    )
+                delete_rows(using, model, model._meta.pk.column, stale_pks)
+
+
+# |============================= Scatter-gather ===========================| #
+class Descending:
+    """
+    Sort key wrapper inverting the order of a value.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def get_sort_key(order_by):
+    """
+    Return a function giving the sort key of a task for the order_by of a
+    queryset, e.g. ['-created_date', '-id'].
+    """
+    fields = [
+        (name.lstrip('-'), name.startswith('-')) for name in order_by
+    ]
+
+    def sort_key(task):
+        return tuple(
+            Descending(getattr(task, name)) if descending
+            else getattr(task, name)
+            for name, descending in fields
+        )
+    return sort_key
+
+
+def get_sharded_task_or_404(uuid):
+    """
+    Return the task with the given uuid from whichever shard holds it.
+    """
+    for shard in range(get_shard_count()):
+        task = get_shard_queryset(
+            Task.objects.filter(uuid=uuid), shard
+        ).first()
+        if task is not None:
+            return task
+    raise NotFound(
+        detail={"message": "No Task matches the given query."}
+    )
+
+
+class ShardedTaskQuery:
+    """
+    The tasks matching a filterset on every shard, ordered and sliced like
+    a queryset: `count()` and slicing are what the paginators use.
+
+    A slice [offset:offset + n] reads the first offset + n tasks of every
+    shard in the requested order and merges them, so the deep pages cost
+    more on every shard, like OFFSET does on a single database.
+    """
+    ordered = True
+
+    def __init__(self, querysets):
+        # {shard: queryset} of the shards which may hold matching tasks
+        self.querysets = querysets
+        self.order_by = None
+        for queryset in querysets.values():
+            self.order_by = list(queryset.query.order_by)
+            break
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(
+                queryset.count() for queryset in self.querysets.values()
+            )
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = key.stop
+        if stop is None:
+            stop = self.count()
+        if stop <= start:
+            return []
+        sort_key = get_sort_key(self.order_by)
+        shard_tasks = [
+            list(queryset[:stop]) for queryset in self.querysets.values()
+        ]
+        return list(islice(
+            heapq.merge(*shard_tasks, key=sort_key), start, stop
+        ))
+
+
+class ShardedTaskFilterBackend(DjangoFilterBackend):
+    """
+    DjangoFilterBackend returning a ShardedTaskQuery when the tasks are
+    sharded. A `created_by` filter limits the query to the shards of the
+    given users.
+    """
+
+    def get_shards(self, request):
+        shards = range(get_shard_count())
+        created_by = request.query_params.get('created_by')
+        if created_by:
+            try:
+                shards = sorted({
+                    get_user_shard(int(user_id))
+                    for user_id in created_by.split(',')
+                })
+            except ValueError:
+                # Left to the filter
+                pass
+        return shards
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_sharded():
+            return super().filter_queryset(request, queryset, view)
+        querysets = {}
+        for shard in self.get_shards(request):
+            filterset = self.get_filterset(
+                request, get_shard_queryset(queryset, shard), view
+            )
+            if not filterset.is_valid() and self.raise_exception:
+                raise utils.translate_validation(filterset.errors)
+            # Ordered by the filterset, with an id tiebreaker
+            querysets[shard] = filterset.qs
+        return ShardedTaskQuery(querysets)
+
+
+# |============================== Rebalancing =============================| #
+def get_user_task_counts():
+    """
+    Return {shard: {user_id: task count}} of the users living on each
+    shard.
+    """
+    task_counts = defaultdict(dict)
+    for shard in range(get_shard_count()):
+        rows = (
+            get_shard_queryset(Task.all_objects.all(), shard)
+            .values('created_by_id')
+            .annotate(task_count=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            task_counts[shard][row['created_by_id']] = row['task_count']
+    return task_counts
+
+
+def plan_rebalance(max_moves):
+    """
+    Return [(user_id, source shard, target shard)] moves making the task
+    counts of the shards closer: the largest user whose move reduces the gap
+    between the fullest and the emptiest shard is moved, repeatedly.
+    """
+    task_counts = get_user_task_counts()
+    totals = {
+        shard: sum(task_counts[shard].values())
+        for shard in range(get_shard_count())
+    }
+    moves = []
+    while len(moves) < max_moves and len(totals) > 1:
+        source = max(totals, key=totals.get)
+        target = min(totals, key=totals.get)
+        gap = totals[source] - totals[target]
+        candidates = [
+            (task_count, user_id)
+            for user_id, task_count in task_counts[source].items()
+            if 0 < task_count < gap
+        ]
+        if not candidates:
+            break
+        task_count, user_id = max(candidates)
+        del task_counts[source][user_id]
+        task_counts[target][user_id] = task_count
+        totals[source] -= task_count
+        totals[target] += task_count
+        moves.append((user_id, source, target))
+    return moves
+
+
+def copy_user_tasks(user_ids, source, target, chunk_size=500):
+    """
+    Copy the tasks, soft deleted ones included, of the users, their
+    task_tags rows and their task list entries from the source database to
+    the target one. The copies get ids of the target's range. No signals are
+    sent: the stats don't depend on the shard of a task.
+    """
+    through = Task.tags.through
+    entry_field_names = [
+        field.attname for field in TaskListEntry._meta.concrete_fields
+        if not field.primary_key
+    ]
+    field_names = [
+        field.attname for field in Task._meta.concrete_fields
+        if not field.primary_key
+    ]
+    queryset = (
+        Task.all_objects.using(source)
+        .filter(created_by_id__in=user_ids)
+        .order_by('id')
+    )
+    last_id = 0
+    copied = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .values('id', *field_names)[:chunk_size]
+        )
+        if not rows:
+            return copied
+        last_id = rows[-1]['id']
+        tag_ids_by_task = defaultdict(list)
+        for task_id, tag_id in (
+            through.objects.using(source)
+            .filter(task_id__in=[row['id'] for row in rows])
+            .values_list('task_id', 'tag_id')
+        ):
+            tag_ids_by_task[task_id].append(tag_id)
+
+        copies = [
+            Task(**{name: row[name] for name in field_names})
+            for row in rows
+        ]
+        # The ids of the copies are returned by the INSERT
+        Task.all_objects.using(target).bulk_create(copies)
+        # bulk_create set the auto_now(_add) dates of the copies to now, a
+        # move keeps the dates of the tasks
+        for row, copy in zip(rows, copies):
+            copy.created_date = row['created_date']
+            copy.modified_date = row['modified_date']
+        Task.all_objects.using(target).bulk_update(
+            copies, ['created_date', 'modified_date']
+        )
+        through.objects.using(target).bulk_create(
+            [
+                through(task_id=copy.pk, tag_id=tag_id)
+                for row, copy in zip(rows, copies)
+                for tag_id in tag_ids_by_task[row['id']]
+            ],
+            batch_size=1000,
+        )
+        copy_ids = {row['id']: copy.pk for row, copy in zip(rows, copies)}
+        TaskListEntry.objects.using(target).bulk_create(
+            [
+                TaskListEntry(id=copy_ids[entry.pop('id')], **entry)
+                for entry in (
+                    TaskListEntry.objects.using(source)
+                    .filter(id__in=copy_ids)
+                    .values('id', *entry_field_names)
+                )
+            ],
+            batch_size=500,
+        )
+        copied += len(copies)
+
+
+def delete_user_tasks(user_ids, using):
+    """
+    Delete the tasks of the users, their task_tags rows and their task list
+    entries from a database, without signals.
+    """
+    task_ids = list(
+        Task.all_objects.using(using)
+        .filter(created_by_id__in=user_ids)
+        .values_list('id', flat=True)
+    )
+    for index in range(0, len(task_ids), 500):
+        chunk = task_ids[index:index + 500]
+        delete_rows(using, Task.tags.through, 'task_id', chunk)
+        delete_rows(using, TaskListEntry, 'id', chunk)
+        delete_rows(using, Task, 'id', chunk)
+    return len(task_ids)
+
+
+def move_users(moves, wait=None, log=print):
+    """
+    Move the tasks of users to other shards, `moves` being a list of
+    (user_id, source shard, target shard):
+    1. the users are marked as moving, their task writes are refused
+    2. once every process saw it, their tasks are copied to the target
+       shards, where they stay hidden
+    3. the users are assigned to the target shards
+    4. once every process saw it, their tasks are deleted from the source
+       shards and the users are marked as moved
+    """
+    if wait is None:
+        wait = get_shard_settings()["DIRECTORY_MAX_AGE"]
+    if not moves:
+        return
+
+    def assign(user_id, shard, moving):
+        if not moving and shard == user_id % get_shard_count():
+            TaskShardAssignment.objects.filter(user_id=user_id).delete()
+        else:
+            TaskShardAssignment.objects.update_or_create(
+                user_id=user_id,
+                defaults={"shard": shard, "moving": moving},
+            )
+
+    with transaction.atomic():
+        for user_id, source, _ in moves:
+            assign(user_id, source, True)
+    log(f"Marked {len(moves)} users as moving, waiting {wait}s")
+    time.sleep(wait)
+
+    for user_id, source, target in moves:
+        source_database = get_shard_alias(source)
+        target_database = get_shard_alias(target)
+        with transaction.atomic(using=target_database):
+            # Copies left by an interrupted move
+            delete_user_tasks([user_id], target_database)
+            copied = copy_user_tasks([user_id], source_database,
+                                     target_database)
+        log(f"Copied {copied} tasks of user {user_id} to shard {target}")
+
+    with transaction.atomic():
+        for user_id, _, target in moves:
+            assign(user_id, target, True)
+    log(f"Assigned the users to their new shards, waiting {wait}s")
+    time.sleep(wait)
+
+    for user_id, source, target in moves:
+        source_database = get_shard_alias(source)
+        with transaction.atomic(using=source_database):
+            deleted = delete_user_tasks([user_id], source_database)
+        assign(user_id, target, False)
+        log(f"Deleted {deleted} tasks of user {user_id} from shard {source}")
+    invalidate_shard_directory()
+
+
+def move_default_tasks(log=print):
+    """
+    Move the tasks left in the default database, written before the shards
+    were enabled, to the shards of their creators.
+    """
+    user_ids = list(
+        Task.all_objects.using(DEFAULT_DB_ALIAS)
+        .values_list('created_by_id', flat=True)
+        .distinct()
+        .order_by('created_by_id')
+    )
+    for user_id in user_ids:
+        target_database = get_user_database(user_id)
+        with transaction.atomic(using=target_database):
+            copied = copy_user_tasks(
+                [user_id], DEFAULT_DB_ALIAS, target_database
+            )
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            delete_user_tasks([user_id], DEFAULT_DB_ALIAS)
+        log(f"Moved {copied} tasks of user {user_id} to {target_database}")
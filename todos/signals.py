@@ -0,0 +1,472 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from core.signals import post_soft_delete, pre_soft_delete
+from todos.fragments import (
+    delete_tag_fragments, delete_task_fragments, delete_user_fragments,
+    get_task_stamps, is_fragment_cache_enabled
+)
+from todos.jobs import schedule_purge
+from todos.models import Tag, Task, TaskTagStat
+from todos.sharding import (
+    delete_replicas, get_shard_databases, get_task_databases, is_sharded,
+    replicate, seed_task_ids
+)
+from todos.task_index import apply_task_index_change, is_task_index_enabled
+from todos.task_list import (
+    get_tag_task_ids, refresh_tag_task_list, refresh_task_list,
+    rename_task_list_creator
+)
+from todos.toggles import discard_pending_toggle
+from todos.vocabulary import invalidate_tag_vocabulary
+from todos.stats import (
+    apply_task_stat_deltas,
+    apply_task_tag_stat_deltas,
+    get_created_day,
+    get_deltas,
+    get_tag_ids_by_task,
+    get_task_stat_keys,
+    get_task_tag_stat_keys,
+)
+
+
+# |========================= Task stats maintenance =======================| #
+def get_task_snapshot(task_ids, using=None):
+    """
+    Return {task_id: (created_by_id, completion_status, created_day, tags)}
+    for the given tasks of a database.
+    """
+    tag_ids_by_task = get_tag_ids_by_task(task_ids, using)
+    rows = (
+        Task.objects
+        .using(using)
+        .filter(id__in=task_ids)
+        .values_list(
+            'id', 'created_by_id', 'completion_status', 'created_date'
+        )
+    )
+    return {
+        task_id: (
+            created_by_id, completion_status, get_created_day(created_date),
+            tag_ids_by_task[task_id]
+        )
+        for task_id, created_by_id, completion_status, created_date in rows
+    }
+
+
+def get_instance_snapshot(task, using=None):
+    """
+    Return the get_task_snapshot() of a loaded task, only its tags are
+    read.
+    """
+    if task.deleted_at is not None:
+        return {}
+    return {
+        task.pk: (
+            task.created_by_id, task.completion_status,
+            get_created_day(task.created_date),
+            get_tag_ids_by_task([task.pk], using)[task.pk]
+        )
+    }
+
+
+def get_changed_tags_snapshot(snapshot, action, pk_set, using=None):
+    """
+    Return the snapshot of a task after the m2m_changed action on its tags
+    from the one before it, only the added tags are read to leave out the
+    deleted ones.
+    """
+    if action == 'post_add':
+        added_tag_ids = set(
+            Tag.objects
+            .using(using)
+            .filter(pk__in=pk_set)
+            .values_list('id', flat=True)
+        )
+    changed_snapshot = {}
+    for task_id, (*values, tag_ids) in snapshot.items():
+        if action == 'post_add':
+            tag_ids = tag_ids | added_tag_ids
+        elif action == 'post_remove':
+            tag_ids = tag_ids - pk_set
+        else:
+            tag_ids = set()
+        changed_snapshot[task_id] = (*values, tag_ids)
+    return changed_snapshot
+
+
+def update_task_index(method_name, *args):
+    """
+    Apply a change to the in-process task index once the transaction is
+    committed.
+    """
+    if is_task_index_enabled():
+        transaction.on_commit(
+            lambda: apply_task_index_change(method_name, *args)
+        )
+
+
+def get_snapshot_tag_stat_keys(snapshot):
+    keys = []
+    for created_by_id, completion_status, created_day, tag_ids in (
+        snapshot.values()
+    ):
+        keys += get_task_tag_stat_keys(
+            created_by_id, completion_status, created_day, tag_ids
+        )
+    return keys
+
+
+@receiver(pre_save, sender=Task)
+def task_pre_save(sender, instance, raw, using, **kwargs):
+    # Instances which were not loaded from the database (for example
+    # Task(pk=...).save()) or loaded with deferred fields need their previous
+    # values to be fetched
+    if raw or not instance.pk:
+        return
+    loaded_values = getattr(instance, '_loaded_values', {})
+    if {'created_by_id', 'completion_status'} <= loaded_values.keys():
+        return
+    instance._loaded_values = (
+        Task.objects
+        .using(using)
+        .filter(pk=instance.pk)
+        .values('created_by_id', 'completion_status')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Task)
+def task_post_save(
+    sender, instance, created, raw, using, update_fields, **kwargs
+):
+    if raw:
+        return
+    if update_fields is None or 'completion_status' in update_fields:
+        # The status written by this save wins over a toggle buffered
+        # before it
+        discard_pending_toggle(using, instance.pk)
+    created_day = get_created_day(instance.created_date)
+    loaded_values = getattr(instance, '_loaded_values', None)
+    instance._loaded_values = {
+        'created_by_id': instance.created_by_id,
+        'completion_status': instance.completion_status,
+    }
+
+    new_values = (instance.created_by_id, instance.completion_status)
+    if created or loaded_values is None:
+        update_task_index('add_task', instance.pk, *new_values)
+        # A new task has no tags yet, they are added after it is saved
+        apply_task_stat_deltas(
+            get_deltas([], get_task_stat_keys(*new_values, created_day))
+        )
+        apply_task_tag_stat_deltas(
+            get_deltas(
+                [], get_task_tag_stat_keys(*new_values, created_day, [])
+            )
+        )
+        return
+
+    old_values = (
+        loaded_values['created_by_id'], loaded_values['completion_status']
+    )
+    if old_values == new_values:
+        return
+    update_task_index('update_task', instance.pk, old_values, new_values)
+    apply_task_stat_deltas(
+        get_deltas(
+            get_task_stat_keys(*old_values, created_day),
+            get_task_stat_keys(*new_values, created_day),
+        )
+    )
+    tag_ids = get_tag_ids_by_task([instance.pk], using)[instance.pk]
+    apply_task_tag_stat_deltas(
+        get_deltas(
+            get_task_tag_stat_keys(*old_values, created_day, tag_ids),
+            get_task_tag_stat_keys(*new_values, created_day, tag_ids),
+        )
+    )
+
+
+# A soft deleted task is removed from the stats and the index when it is
+# marked as deleted, its snapshot is empty when it is purged later since
+# Task.objects doesn't return it anymore
+@receiver([pre_delete, pre_soft_delete], sender=Task)
+def task_pre_delete(sender, instance, using, **kwargs):
+    if instance.deleted_at is not None:
+        return
+    instance._stats_snapshot = get_task_snapshot([instance.pk], using)
+
+
+@receiver([post_delete, post_soft_delete], sender=Task)
+def task_post_delete(sender, instance, **kwargs):
+    snapshot = getattr(instance, '_stats_snapshot', None)
+    if not snapshot:
+        return
+    keys = []
+    for created_by_id, completion_status, created_day, _ in (
+        snapshot.values()
+    ):
+        keys += get_task_stat_keys(
+            created_by_id, completion_status, created_day
+        )
+    apply_task_stat_deltas(get_deltas(keys, []))
+    apply_task_tag_stat_deltas(
+        get_deltas(get_snapshot_tag_stat_keys(snapshot), [])
+    )
+    for task_id, (created_by_id, completion_status, _, tag_ids) in (
+        snapshot.items()
+    ):
+        update_task_index(
+            'remove_task', task_id, created_by_id, completion_status, tag_ids
+        )
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def task_tags_changed(
+    sender, instance, action, reverse, pk_set, using, **kwargs
+):
+    if action.startswith('pre_'):
+        if not reverse:
+            # The tags of a task are changed once it is saved, its columns
+            # don't need to be read again and its tags afterwards follow
+            # from the change
+            instance._stats_snapshot = get_instance_snapshot(instance, using)
+            return
+        if action == 'pre_clear':
+            task_ids = list(
+                instance.tasks.using(using).values_list('id', flat=True)
+            )
+        else:
+            task_ids = list(pk_set)
+        instance._stats_snapshot = get_task_snapshot(task_ids, using)
+        return
+
+    snapshot_before = getattr(instance, '_stats_snapshot', None)
+    if not snapshot_before:
+        return
+    del instance._stats_snapshot
+    if not reverse:
+        snapshot_after = get_changed_tags_snapshot(
+            snapshot_before, action, pk_set, using
+        )
+    else:
+        snapshot_after = get_task_snapshot(list(snapshot_before), using)
+    apply_task_tag_stat_deltas(
+        get_deltas(
+            get_snapshot_tag_stat_keys(snapshot_before),
+            get_snapshot_tag_stat_keys(snapshot_after),
+        )
+    )
+    for task_id, (*_, tag_ids_before) in snapshot_before.items():
+        tag_ids_after = snapshot_after.get(task_id, (set(),))[-1]
+        if tag_ids_before != tag_ids_after:
+            update_task_index(
+                'set_task_tags', task_id, tag_ids_before, tag_ids_after
+            )
+
+
+@receiver([pre_delete, pre_soft_delete], sender=Tag)
+def tag_pre_delete(sender, instance, **kwargs):
+    if instance.deleted_at is not None:
+        # Purge of a soft deleted tag, the stats were already updated when it
+        # was marked as deleted
+        return
+    # The tasks of the tag may be on every shard
+    instance._stats_snapshot = {}
+    for task_database in get_task_databases():
+        task_ids = list(
+            instance.tasks.using(task_database).values_list('id', flat=True)
+        )
+        instance._stats_snapshot.update(
+            get_task_snapshot(task_ids, task_database)
+        )
+
+
+@receiver(post_delete, sender=Tag)
+def tag_post_delete(sender, instance, **kwargs):
+    update_task_index('remove_tag', instance.pk)
+    snapshot = getattr(instance, '_stats_snapshot', None)
+    if not snapshot:
+        return
+    # The rows of the deleted tag are removed by the cascade, only the tasks
+    # left without any tag need to be counted in the empty tag rows
+    untagged_keys = []
+    for created_by_id, completion_status, created_day, tag_ids in (
+        snapshot.values()
+    ):
+        if tag_ids == {instance.pk}:
+            untagged_keys += get_task_tag_stat_keys(
+                created_by_id, completion_status, created_day, []
+            )
+    apply_task_tag_stat_deltas(get_deltas([], untagged_keys))
+
+
+@receiver(post_soft_delete, sender=Tag)
+def tag_post_soft_delete(sender, instance, **kwargs):
+    # Nothing is cascaded by a soft delete, the rows of the tag are removed
+    # here instead of by the cascade of the purge
+    TaskTagStat.objects.filter(tag_id=instance.pk).delete()
+    tag_post_delete(sender, instance, **kwargs)
+
+
+# |============================ Soft deletion ==============================| #
+@receiver(post_soft_delete, sender=Task)
+@receiver(post_soft_delete, sender=Tag)
+def soft_deleted(sender, instance, **kwargs):
+    schedule_purge()
+
+
+# |=========================== Tag vocabulary ==============================| #
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_soft_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_tag_vocabulary()
+
+
+# |============================== Sharding ================================| #
+# The tags and users are written to the default database and copied to the
+# shards, see todos/sharding.py
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=User)
+@receiver(post_soft_delete, sender=Tag)
+def replicated_record_saved(sender, instance, using, raw=False, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS or not is_sharded():
+        return
+    replicate(sender, [instance])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=User)
+def replicated_record_deleted(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS or not is_sharded():
+        return
+    delete_replicas(sender, [instance.pk])
+
+
+@receiver(post_migrate)
+def shard_migrated(sender, using, **kwargs):
+    if sender.label == 'todos' and using in get_shard_databases():
+        seed_task_ids(using)
+
+
+# |=========================== Task list table =============================| #
+# The entries of todos/task_list.py. The handlers of the tags and users come
+# after the replication handlers, the entries of a shard are rendered from
+# its replicas.
+@receiver(post_save, sender=Task)
+@receiver([post_delete, post_soft_delete], sender=Task)
+def task_list_task_changed(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        refresh_task_list(using, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def task_list_task_tags_changed(
+    sender, instance, action, reverse, pk_set, using, **kwargs
+):
+    if not reverse:
+        if action.startswith('post_'):
+            refresh_task_list(using, [instance.pk])
+    elif action == 'pre_clear':
+        instance._task_list_task_ids = list(
+            instance.tasks.using(using).values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        refresh_task_list(using, instance.__dict__.pop(
+            '_task_list_task_ids', []
+        ))
+    elif action.startswith('post_'):
+        refresh_task_list(using, pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_soft_delete, sender=Tag)
+def task_list_tag_changed(sender, instance, using, raw=False, **kwargs):
+    if raw or (is_sharded() and using != DEFAULT_DB_ALIAS):
+        return
+    refresh_tag_task_list(get_tag_task_ids(instance.pk))
+
+
+@receiver(pre_delete, sender=Tag)
+def task_list_tag_pre_delete(sender, instance, using, **kwargs):
+    if instance.deleted_at is not None or (
+        is_sharded() and using != DEFAULT_DB_ALIAS
+    ):
+        # Purge of a soft deleted tag, its entries were refreshed when it
+        # was marked as deleted
+        return
+    instance._task_list_task_ids = get_tag_task_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def task_list_tag_deleted(sender, instance, **kwargs):
+    task_ids_by_database = instance.__dict__.pop('_task_list_task_ids', None)
+    if task_ids_by_database:
+        refresh_tag_task_list(task_ids_by_database)
+
+
+@receiver(post_save, sender=User)
+def task_list_user_changed(
+    sender, instance, created, raw, using, update_fields, **kwargs
+):
+    if raw or created or (is_sharded() and using != DEFAULT_DB_ALIAS):
+        return
+    # Most saves of a user are its last_login
+    if update_fields is not None and not (
+        {'first_name', 'last_name'} & set(update_fields)
+    ):
+        return
+    rename_task_list_creator(instance)
+
+
+# |============================ Task fragments =============================| #
+# The JSON fragments of todos/fragments.py holding a tag or a user. The
+# writes of the tasks change their modified_date, and so the keys of their
+# fragments.
+@receiver(post_save, sender=Tag)
+@receiver([pre_delete, pre_soft_delete], sender=Tag)
+def fragments_tag_changed(sender, instance, using, raw=False, **kwargs):
+    if raw or kwargs.get('created') or (
+        is_sharded() and using != DEFAULT_DB_ALIAS
+    ):
+        return
+    if instance.deleted_at is not None:
+        # Purge of a soft deleted tag, or save of a deleted tag
+        return
+    delete_tag_fragments(instance, using)
+
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def fragments_task_tags_changed(
+    sender, instance, action, reverse, pk_set, using, **kwargs
+):
+    if not action.startswith('pre_') or not is_fragment_cache_enabled():
+        return
+    if not reverse:
+        stamps = [(instance.uuid, instance.modified_date)]
+    elif action == 'pre_clear':
+        stamps = get_task_stamps(instance.tasks.using(using))
+    else:
+        stamps = get_task_stamps(Task.objects.using(using).filter(
+            pk__in=pk_set
+        ))
+    delete_task_fragments(stamps, using=using)
+
+
+@receiver(post_save, sender=User)
+def fragments_user_changed(
+    sender, instance, created, raw, using, update_fields, **kwargs
+):
+    if raw or created or (is_sharded() and using != DEFAULT_DB_ALIAS):
+        return
+    if update_fields is not None and not (
+        {'first_name', 'last_name'} & set(update_fields)
+    ):
+        return
+    delete_user_fragments(instance, using)
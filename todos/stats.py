@@ -0,0 +1,234 @@
+"""
+Maintenance of the materialized task count tables (TaskStat & TaskTagStat).
+
+Every task contributes a count of 1 to one TaskStat row and to one
+TaskTagStat row per tag (or to the row with an empty tag when the task has
+no tags). The signal handlers compute the rows a task contributed to before
+and after a write and only apply the difference.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from todos.models import Task, TaskStat, TaskTagStat
+from todos.sharding import get_task_databases
+
+# Keys of the deltas written per query, the keys are OR-ed in the lookup
+# of their rows and SQLite limits the depth of an expression to 1000
+DELTA_CHUNK_SIZE = 200
+
+
+def get_created_day(created_date):
+    return timezone.localtime(created_date).date()
+
+
+def get_task_stat_keys(created_by_id, completion_status, created_day):
+    return [(created_by_id, completion_status, created_day)]
+
+
+def get_task_tag_stat_keys(
+    created_by_id, completion_status, created_day, tag_ids
+):
+    # Tasks without tags are counted with an empty tag
+    return [
+        (created_by_id, completion_status, tag_id, created_day)
+        for tag_id in (tag_ids or [None])
+    ]
+
+
+def get_tag_ids_by_task(task_ids, using=None):
+    """
+    Return a {task_id: set(tag_ids)} dict for the given tasks in one query.
+    The soft deleted tags are left out.
+    """
+    tag_ids_by_task = {task_id: set() for task_id in task_ids}
+    through_rows = (
+        Task.tags.through.objects
+        .using(using)
+        .filter(task_id__in=task_ids, tag__deleted_at__isnull=True)
+        .values_list('task_id', 'tag_id')
+    )
+    for task_id, tag_id in through_rows:
+        tag_ids_by_task[task_id].add(tag_id)
+    return tag_ids_by_task
+
+
+def get_deltas(keys_before, keys_after):
+    """
+    Return a Counter of {key: +n/-n} between two lists of keys.
+    """
+    deltas = Counter(keys_after)
+    deltas.subtract(Counter(keys_before))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_deltas(model, key_fields, deltas):
+    """
+    Add the deltas to the task_count of the matching rows, creating missing
+    rows and removing the ones dropping to zero.
+    The rows of a chunk of keys are read, updated, created and deleted with
+    one query each, whatever the number of keys.
+    """
+    if not deltas:
+        return
+    items = list(deltas.items())
+    # The writes of the signal handlers are already in a transaction, a
+    # savepoint would only add two queries
+    with transaction.atomic(savepoint=False):
+        for index in range(0, len(items), DELTA_CHUNK_SIZE):
+            apply_delta_chunk(
+                model, key_fields, dict(items[index:index + DELTA_CHUNK_SIZE])
+            )
+
+
+def apply_delta_chunk(model, key_fields, deltas):
+    # The empty tag is matched with IS NULL, which a unique constraint (and
+    # so an upsert) doesn't match: the rows are looked up first
+    key_filter = Q()
+    for key in deltas:
+        key_filter |= Q(**dict(zip(key_fields, key)))
+    ids_by_key = {
+        tuple(values): id
+        for id, *values in (
+            model.objects.filter(key_filter).values_list('id', *key_fields)
+        )
+    }
+    if ids_by_key:
+        model.objects.filter(id__in=ids_by_key.values()).update(
+            task_count=F('task_count') + Case(
+                *[
+                    When(id=id, then=Value(deltas[key]))
+                    for key, id in ids_by_key.items()
+                ],
+                default=Value(0),
+            )
+        )
+    model.objects.bulk_create([
+        model(task_count=delta, **dict(zip(key_fields, key)))
+        for key, delta in deltas.items()
+        if key not in ids_by_key and delta > 0
+    ])
+    # Rows of users, statuses or days without any task left
+    decreased_ids = [
+        id for key, id in ids_by_key.items() if deltas[key] < 0
+    ]
+    if decreased_ids:
+        model.objects.filter(
+            id__in=decreased_ids, task_count__lte=0
+        ).delete()
+
+
+TASK_STAT_FIELDS = ('created_by_id', 'completion_status', 'created_day')
+TASK_TAG_STAT_FIELDS = (
+    'created_by_id', 'completion_status', 'tag_id', 'created_day'
+)
+
+
+def apply_task_stat_deltas(deltas):
+    apply_deltas(TaskStat, TASK_STAT_FIELDS, deltas)
+
+
+def apply_task_tag_stat_deltas(deltas):
+    apply_deltas(TaskTagStat, TASK_TAG_STAT_FIELDS, deltas)
+
+
+# |=========================== Full rebuild ===============================| #
+def get_task_counts(using=None):
+    """
+    Return Counters of the TaskStat and TaskTagStat rows of the tasks of a
+    database, keyed like the deltas.
+    """
+    task_counts = (
+        Task.objects
+        .using(using)
+        .annotate(created_day=TruncDate('created_date'))
+        .values('created_by_id', 'completion_status', 'created_day')
+        .annotate(task_count=Count('id'))
+        .order_by()
+    )
+    # The rows of the through table are only removed when the soft deleted
+    # tasks and tags are purged
+    live_through_rows = Task.tags.through.objects.using(using).filter(
+        task__deleted_at__isnull=True, tag__deleted_at__isnull=True
+    )
+    tagged_counts = (
+        live_through_rows
+        .annotate(created_day=TruncDate('task__created_date'))
+        .values(
+            'task__created_by_id', 'task__completion_status',
+            'tag_id', 'created_day'
+        )
+        .annotate(task_count=Count('id'))
+        .order_by()
+    )
+    untagged_counts = (
+        Task.objects
+        .using(using)
+        .exclude(id__in=live_through_rows.values('task_id'))
+        .annotate(created_day=TruncDate('created_date'))
+        .values('created_by_id', 'completion_status', 'created_day')
+        .annotate(task_count=Count('id'))
+        .order_by()
+    )
+
+    task_stat_counts = Counter()
+    for row in task_counts:
+        task_stat_counts[
+            tuple(row[field] for field in TASK_STAT_FIELDS)
+        ] += row['task_count']
+    task_tag_stat_counts = Counter()
+    for row in tagged_counts:
+        task_tag_stat_counts[(
+            row['task__created_by_id'], row['task__completion_status'],
+            row['tag_id'], row['created_day'],
+        )] += row['task_count']
+    for row in untagged_counts:
+        task_tag_stat_counts[(
+            row['created_by_id'], row['completion_status'], None,
+            row['created_day'],
+        )] += row['task_count']
+    return task_stat_counts, task_tag_stat_counts
+
+
+def rebuild_task_stats():
+    """
+    Recompute both tables from the task and task_tags tables, of every
+    shard when the tasks are sharded (see todos/sharding.py).
+    This is needed after writes that don't send signals, such as
+    `QuerySet.update()` or `bulk_create()`.
+    """
+    task_stat_counts = Counter()
+    task_tag_stat_counts = Counter()
+    for using in get_task_databases():
+        database_task_stat_counts, database_task_tag_stat_counts = (
+            get_task_counts(using)
+        )
+        task_stat_counts.update(database_task_stat_counts)
+        task_tag_stat_counts.update(database_task_tag_stat_counts)
+
+    with transaction.atomic():
+        TaskStat.objects.all().delete()
+        TaskTagStat.objects.all().delete()
+        TaskStat.objects.bulk_create(
+            [
+                TaskStat(
+                    task_count=task_count,
+                    **dict(zip(TASK_STAT_FIELDS, key))
+                )
+                for key, task_count in task_stat_counts.items()
+            ],
+            batch_size=1000,
+        )
+        TaskTagStat.objects.bulk_create(
+            [
+                TaskTagStat(
+                    task_count=task_count,
+                    **dict(zip(TASK_TAG_STAT_FIELDS, key))
+                )
+                for key, task_count in task_tag_stat_counts.items()
+            ],
+            batch_size=1000,
+        )
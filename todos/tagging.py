@@ -0,0 +1,119 @@
+"""
+Changes of the tags of a task written as a diff of the through table.
+
+`task.tags.set(tags)` needs the tags to be loaded and is usually called with
+the whole set even when nothing changed. Here the current links of the task
+are read with a single query on the through table, and only the links which
+are added or removed are written, so changing the tags of a heavily tagged
+task costs queries in proportion to the change and not to its tags.
+
+Every change of the tags bumps the version of the task (see
+core.behaviours.VersionMixin), so tag changes conflict with concurrent
+updates of the task like the changes of its other fields do.
+
+The tasks are read and written on the database they were loaded from, their
+shard when the tasks are sharded (see todos/sharding.py).
+"""
+from django.db import transaction
+
+from todos.models import Tag, Task
+
+
+def get_tag_ids(tag_uuids):
+    """
+    Return {uuid: id} of the tags with the given uuids, the unknown and
+    deleted tags are missing from it.
+    """
+    return dict(
+        Tag.objects
+        .filter(uuid__in=tag_uuids)
+        .values_list('uuid', 'id')
+    )
+
+
+def get_task_tag_ids(task):
+    """
+    Return the ids of the (not deleted) tags of the task.
+    """
+    return set(
+        Task.tags.through.objects
+        .using(task._state.db)
+        .filter(task_id=task.pk, tag__deleted_at__isnull=True)
+        .values_list('tag_id', flat=True)
+    )
+
+
+def diff_task_tags(task, tag_ids):
+    """
+    Return (added tag ids, removed tag ids) turning the tags of the task
+    into the given ones.
+    """
+    tag_ids = set(tag_ids)
+    current_tag_ids = get_task_tag_ids(task)
+    return tag_ids - current_tag_ids, current_tag_ids - tag_ids
+
+
+def save_task(task, update_fields=(), added_tag_ids=(), removed_tag_ids=()):
+    """
+    Save the given fields of the task and add and remove its tags in a
+    single transaction.
+    Raises VersionConflict when the task was changed since its version was
+    read, nothing is written then.
+    """
+    with transaction.atomic(using=task._state.db):
+        # Changing only the tags still bumps the version and the modified
+        # date of the task
+        task.save(update_fields=[*update_fields, 'modified_date'])
+        if removed_tag_ids:
+            task.tags.remove(*removed_tag_ids)
+        if added_tag_ids:
+            task.tags.add(*added_tag_ids)
+
+
+def set_task_tags(task, tag_ids):
+    """
+    Make the given tags the tags of the task.
+    Returns (added tag ids, removed tag ids), nothing is written when both
+    are empty.
+    """
+    added_tag_ids, removed_tag_ids = diff_task_tags(task, tag_ids)
+    if added_tag_ids or removed_tag_ids:
+        save_task(
+            task,
+            added_tag_ids=added_tag_ids,
+            removed_tag_ids=removed_tag_ids
+        )
+    return added_tag_ids, removed_tag_ids
+
+
+def add_task_tags(task, tag_ids):
+    """
+    Add the given tags to the task, returns the ids of the tags which it
+    didn't have yet.
+    """
+    tag_ids = set(tag_ids)
+    added_tag_ids = tag_ids - set(
+        Task.tags.through.objects
+        .using(task._state.db)
+        .filter(task_id=task.pk, tag_id__in=tag_ids)
+        .values_list('tag_id', flat=True)
+    )
+    if added_tag_ids:
+        save_task(task, added_tag_ids=added_tag_ids)
+    return added_tag_ids
+
+
+def remove_task_tags(task, tag_ids):
+    """
+    Remove the given tags from the task, returns the ids of the tags which
+    it had.
+    """
+    removed_tag_ids = set(
+        Task.tags.through.objects
+        .using(task._state.db)
+        .filter(task_id=task.pk, tag_id__in=set(tag_ids))
+        .values_list('tag_id', flat=True)
+    )
+    if removed_tag_ids:
+        save_task(task, removed_tag_ids=removed_tag_ids)
+    return removed_tag_ids
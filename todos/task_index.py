@@ -0,0 +1,575 @@
+"""
+An optional in-process index of task ids for the hottest TaskFilter queries.
+
+The index keeps one bitset of task ids per tag, per user (created_by) and per
+completion status, so a combination of filters is answered without touching
+the database.
+
+The bitsets are compressed like roaring bitmaps: the ids are split in chunks
+of 65536 (the high 16 bits of the id), and each chunk holding ids is stored
+as a sorted array of the low 16 bits (2 bytes per id) while it has up to
+ARRAY_MAX_SIZE ids, as a bitmap of 8 KiB (a Python int, whose bitwise
+operators run in C) above. Setting a bit copies one chunk at most, and a
+user with a few tasks costs a few bytes whatever the largest task id. The
+bitsets are immutable: readers use them without a lock while the changes
+replace them.
+
+The index is kept current by the Task and Tag signal handlers of this process
+and is rebuilt when it is older than TASK_INDEX["MAX_AGE"] seconds, which
+picks up the writes made by other processes. The rebuild runs in a thread of
+its own: the requests keep using the previous index (or the database, before
+the first build) and the new index is swapped in once it is built, with the
+changes committed in the meantime replayed on it. A snapshot file makes the
+start of a process fast: it is loaded instead of scanning the tables when the
+tables didn't change since it was written.
+
+Settings (TASK_INDEX):
+    ENABLED: use the index in TaskFilter
+    MAX_AGE: seconds after which the index is rebuilt
+    MAX_IDS: result sets larger than this are left to the database
+    SNAPSHOT_PATH: path of the snapshot file, None to disable it
+"""
+import base64
+import bisect
+import itertools
+import json
+import logging
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max
+
+from todos.models import Tag, Task
+from todos.sharding import is_sharded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "ENABLED": False,
+    "MAX_AGE": 300,
+    "MAX_IDS": 5000,
+    "SNAPSHOT_PATH": None,
+}
+
+# Version of the snapshot files, older snapshots are ignored
+SNAPSHOT_VERSION = 2
+
+CHUNK_BITS = 16
+LOW_MASK = (1 << CHUNK_BITS) - 1
+# The chunks holding more ids are bitmaps (8 KiB) instead of sorted arrays
+# (2 bytes per id)
+ARRAY_MAX_SIZE = 4096
+
+
+def get_task_index_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_INDEX", {}))
+    return config
+
+
+def is_task_index_enabled():
+    config = get_task_index_settings()
+    return config["ENABLED"] and not is_sharded()
+
+
+# |=============================== Bitsets ================================| #
+def iter_bits(bitmap):
+    """
+    Yield the positions of the set bits of an int in increasing order.
+    """
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low_bit = byte & -byte
+            yield byte_index * 8 + low_bit.bit_length() - 1
+            byte ^= low_bit
+
+
+def to_bitmap(chunk):
+    if isinstance(chunk, int):
+        return chunk
+    data = bytearray(1 << (CHUNK_BITS - 3))
+    for low in chunk:
+        data[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(data, 'little')
+
+
+def compact(chunk):
+    """
+    Return the chunk in its smallest form, None when it is empty.
+    """
+    if isinstance(chunk, int):
+        size = chunk.bit_count()
+        if size > ARRAY_MAX_SIZE:
+            return chunk
+        chunk = array('H', iter_bits(chunk))
+    return chunk or None
+
+
+def intersect_chunks(chunk, other):
+    if isinstance(chunk, int) and isinstance(other, int):
+        return compact(chunk & other)
+    if isinstance(chunk, int) or isinstance(other, int):
+        return compact(to_bitmap(chunk) & to_bitmap(other))
+    return compact(array('H', sorted(set(chunk).intersection(other))))
+
+
+def unite_chunks(chunk, other):
+    if (
+        isinstance(chunk, int) or isinstance(other, int)
+        or len(chunk) + len(other) > ARRAY_MAX_SIZE
+    ):
+        return compact(to_bitmap(chunk) | to_bitmap(other))
+    return array('H', sorted(set(chunk).union(other)))
+
+
+class Bitset:
+    """
+    An immutable compressed set of task ids: {high 16 bits: chunk}, where a
+    chunk is a sorted array('H') or an int bitmap of the low 16 bits.
+    """
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        chunks = {}
+        for high, values in itertools.groupby(
+            sorted(set(ids)), key=lambda value: value >> CHUNK_BITS
+        ):
+            chunk = array('H', (value & LOW_MASK for value in values))
+            if len(chunk) > ARRAY_MAX_SIZE:
+                chunk = to_bitmap(chunk)
+            chunks[high] = chunk
+        return cls(chunks)
+
+    def __len__(self):
+        return sum(
+            chunk.bit_count() if isinstance(chunk, int) else len(chunk)
+            for chunk in self.chunks.values()
+        )
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        for high in sorted(self.chunks):
+            chunk = self.chunks[high]
+            base = high << CHUNK_BITS
+            lows = iter_bits(chunk) if isinstance(chunk, int) else chunk
+            for low in lows:
+                yield base + low
+
+    def __contains__(self, value):
+        chunk = self.chunks.get(value >> CHUNK_BITS)
+        if chunk is None:
+            return False
+        low = value & LOW_MASK
+        if isinstance(chunk, int):
+            return bool(chunk >> low & 1)
+        index = bisect.bisect_left(chunk, low)
+        return index < len(chunk) and chunk[index] == low
+
+    def __and__(self, other):
+        chunks = {}
+        for high in self.chunks.keys() & other.chunks.keys():
+            chunk = intersect_chunks(self.chunks[high], other.chunks[high])
+            if chunk is not None:
+                chunks[high] = chunk
+        return Bitset(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for high, chunk in other.chunks.items():
+            chunks[high] = (
+                unite_chunks(chunks[high], chunk) if high in chunks else chunk
+            )
+        return Bitset(chunks)
+
+    def add(self, value):
+        """
+        Return the bitset with the id added.
+        """
+        high, low = value >> CHUNK_BITS, value & LOW_MASK
+        chunk = self.chunks.get(high)
+        if chunk is None:
+            chunk = array('H', [low])
+        elif isinstance(chunk, int):
+            chunk |= 1 << low
+        else:
+            index = bisect.bisect_left(chunk, low)
+            if index < len(chunk) and chunk[index] == low:
+                return self
+            chunk = chunk[:index] + array('H', [low]) + chunk[index:]
+            if len(chunk) > ARRAY_MAX_SIZE:
+                chunk = to_bitmap(chunk)
+        return Bitset({**self.chunks, high: chunk})
+
+    def remove(self, value):
+        """
+        Return the bitset without the id.
+        """
+        if value not in self:
+            return self
+        high, low = value >> CHUNK_BITS, value & LOW_MASK
+        chunk = self.chunks[high]
+        if isinstance(chunk, int):
+            chunk = compact(chunk & ~(1 << low))
+        else:
+            index = bisect.bisect_left(chunk, low)
+            chunk = compact(chunk[:index] + chunk[index + 1:])
+        chunks = dict(self.chunks)
+        if chunk is None:
+            del chunks[high]
+        else:
+            chunks[high] = chunk
+        return Bitset(chunks)
+
+    # The snapshot format: [[high, "a" or "b", base64 of the chunk], ...]
+    def encode(self):
+        items = []
+        for high, chunk in self.chunks.items():
+            if isinstance(chunk, int):
+                kind, data = "b", chunk.to_bytes(
+                    (chunk.bit_length() + 7) // 8, 'little'
+                )
+            else:
+                if sys.byteorder == "big":
+                    chunk = array('H', chunk)
+                    chunk.byteswap()
+                kind, data = "a", chunk.tobytes()
+            items.append([high, kind, base64.b64encode(data).decode()])
+        return items
+
+    @classmethod
+    def decode(cls, items):
+        chunks = {}
+        for high, kind, data in items:
+            data = base64.b64decode(data)
+            if kind == "b":
+                chunks[high] = int.from_bytes(data, 'little')
+            else:
+                chunk = array('H')
+                chunk.frombytes(data)
+                if sys.byteorder == "big":
+                    chunk.byteswap()
+                chunks[high] = chunk
+        return cls(chunks)
+
+
+EMPTY_BITSET = Bitset()
+
+
+# |================================ Index =================================| #
+def get_tables_fingerprint():
+    """
+    A cheap summary of the task tables, used to check that a snapshot is
+    still up to date.
+    """
+    tasks = Task.objects.aggregate(
+        count=Count('id'), max_id=Max('id'), modified=Max('modified_date')
+    )
+    return [
+        tasks['count'],
+        tasks['max_id'],
+        tasks['modified'].isoformat() if tasks['modified'] else None,
+        Task.tags.through.objects.count(),
+        # Soft deleting a tag doesn't change the numbers above
+        str(Tag.all_objects.aggregate(deleted=Max('deleted_at'))['deleted']),
+    ]
+
+
+class TaskIndex:
+    """
+    Bitsets of task ids per tag id, user id and completion status.
+    """
+
+    def __init__(self):
+        self.all = EMPTY_BITSET
+        self.by_tag = {}
+        self.by_user = {}
+        self.by_status = {}
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    # |--------------------------- Building ------------------------------| #
+    @classmethod
+    def build(cls):
+        index = cls()
+        # The ids are collected first, a bitset is built once per key
+        all_ids = []
+        ids_by_user = {}
+        ids_by_status = {}
+        ids_by_tag = {}
+        rows = Task.objects.values_list(
+            'id', 'created_by_id', 'completion_status'
+        ).iterator(chunk_size=10000)
+        for task_id, created_by_id, completion_status in rows:
+            all_ids.append(task_id)
+            ids_by_user.setdefault(created_by_id, []).append(task_id)
+            ids_by_status.setdefault(completion_status, []).append(task_id)
+        through_rows = (
+            Task.tags.through.objects
+            .filter(
+                task__deleted_at__isnull=True, tag__deleted_at__isnull=True
+            )
+            .values_list('task_id', 'tag_id')
+            .iterator(chunk_size=10000)
+        )
+        for task_id, tag_id in through_rows:
+            ids_by_tag.setdefault(tag_id, []).append(task_id)
+
+        index.all = Bitset.from_ids(all_ids)
+        for bitsets, ids_by_key in (
+            (index.by_user, ids_by_user),
+            (index.by_status, ids_by_status),
+            (index.by_tag, ids_by_tag),
+        ):
+            for key, ids in ids_by_key.items():
+                bitsets[key] = Bitset.from_ids(ids)
+        return index
+
+    @staticmethod
+    def _set_bit(bitsets, key, task_id):
+        bitsets[key] = bitsets.get(key, EMPTY_BITSET).add(task_id)
+
+    @staticmethod
+    def _clear_bit(bitsets, key, task_id):
+        bitset = bitsets.get(key, EMPTY_BITSET).remove(task_id)
+        if bitset:
+            bitsets[key] = bitset
+        else:
+            bitsets.pop(key, None)
+
+    def _add(self, task_id, created_by_id, completion_status, tag_ids):
+        self.all = self.all.add(task_id)
+        self._set_bit(self.by_user, created_by_id, task_id)
+        self._set_bit(self.by_status, completion_status, task_id)
+        for tag_id in tag_ids:
+            self._set_bit(self.by_tag, tag_id, task_id)
+
+    # |--------------------------- Updating ------------------------------| #
+    def add_task(self, task_id, created_by_id, completion_status, tag_ids=()):
+        with self._lock:
+            self._add(task_id, created_by_id, completion_status, tag_ids)
+
+    def update_task(self, task_id, old_values, new_values):
+        """
+        Move a task between users/statuses, values are
+        (created_by_id, completion_status) tuples.
+        """
+        with self._lock:
+            self._clear_bit(self.by_user, old_values[0], task_id)
+            self._clear_bit(self.by_status, old_values[1], task_id)
+            self._set_bit(self.by_user, new_values[0], task_id)
+            self._set_bit(self.by_status, new_values[1], task_id)
+
+    def set_task_tags(self, task_id, old_tag_ids, new_tag_ids):
+        with self._lock:
+            for tag_id in set(old_tag_ids) - set(new_tag_ids):
+                self._clear_bit(self.by_tag, tag_id, task_id)
+            for tag_id in set(new_tag_ids) - set(old_tag_ids):
+                self._set_bit(self.by_tag, tag_id, task_id)
+
+    def remove_task(self, task_id, created_by_id, completion_status, tag_ids):
+        with self._lock:
+            self.all = self.all.remove(task_id)
+            self._clear_bit(self.by_user, created_by_id, task_id)
+            self._clear_bit(self.by_status, completion_status, task_id)
+            for tag_id in tag_ids:
+                self._clear_bit(self.by_tag, tag_id, task_id)
+
+    def remove_tag(self, tag_id):
+        with self._lock:
+            self.by_tag.pop(tag_id, None)
+
+    # |--------------------------- Querying ------------------------------| #
+    def query(
+        self, created_by_ids=None, completion_statuses=None,
+        any_tag_ids=None, all_tag_ids=None
+    ):
+        """
+        Return the Bitset of the tasks matching all the given filters.
+        Each filter is a list of values matched with OR, except all_tag_ids.
+        """
+        # The bitsets of the keys are subsets of `all`
+        result = None
+        for bitsets, keys in (
+            (self.by_user, created_by_ids),
+            (self.by_status, completion_statuses),
+            (self.by_tag, any_tag_ids),
+        ):
+            if keys is None:
+                continue
+            union = EMPTY_BITSET
+            for key in keys:
+                union |= bitsets.get(key, EMPTY_BITSET)
+            result = union if result is None else result & union
+        if all_tag_ids is not None:
+            for tag_id in all_tag_ids:
+                tag_bitset = self.by_tag.get(tag_id, EMPTY_BITSET)
+                result = tag_bitset if result is None else result & tag_bitset
+        return self.all if result is None else result
+
+    # |--------------------------- Snapshots -----------------------------| #
+    @staticmethod
+    def _encode_bitsets(bitsets):
+        return [[key, bitset.encode()] for key, bitset in bitsets.items()]
+
+    @staticmethod
+    def _decode_bitsets(items):
+        return {key: Bitset.decode(data) for key, data in items}
+
+    def save_snapshot(self, path, fingerprint):
+        with self._lock:
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "fingerprint": fingerprint,
+                "all": self.all.encode(),
+                "by_tag": self._encode_bitsets(self.by_tag),
+                "by_user": self._encode_bitsets(self.by_user),
+                "by_status": self._encode_bitsets(self.by_status),
+            }
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(zlib.compress(json.dumps(data).encode()))
+
+    @classmethod
+    def load_snapshot(cls, path, fingerprint):
+        """
+        Return the index stored in the snapshot or None when the file is
+        missing, of another version or doesn't match the current tables.
+        """
+        try:
+            with open(path, 'rb') as snapshot_file:
+                data = json.loads(zlib.decompress(snapshot_file.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+        if (
+            data.get("version") != SNAPSHOT_VERSION
+            or data["fingerprint"] != fingerprint
+        ):
+            return None
+        index = cls()
+        index.all = Bitset.decode(data["all"])
+        index.by_tag = cls._decode_bitsets(data["by_tag"])
+        index.by_user = cls._decode_bitsets(data["by_user"])
+        index.by_status = cls._decode_bitsets(data["by_status"])
+        return index
+
+
+_task_index = None
+# The changes committed while an index is built, replayed on it before it
+# is swapped in. None when no index is being built.
+_pending_changes = None
+_build_thread = None
+# Held while an index is built, one build at a time
+_build_lock = threading.Lock()
+# Held while the index is swapped or changed
+_swap_lock = threading.Lock()
+
+
+def build_task_index():
+    """
+    Build the index (or load its snapshot) and swap it in as the index of
+    this process.
+    """
+    global _task_index, _pending_changes
+    with _build_lock:
+        with _swap_lock:
+            _pending_changes = []
+        try:
+            snapshot_path = get_task_index_settings()["SNAPSHOT_PATH"]
+            index = None
+            if snapshot_path:
+                fingerprint = get_tables_fingerprint()
+                index = TaskIndex.load_snapshot(snapshot_path, fingerprint)
+            if index is None:
+                index = TaskIndex.build()
+                if snapshot_path:
+                    index.save_snapshot(snapshot_path, fingerprint)
+        except BaseException:
+            with _swap_lock:
+                _pending_changes = None
+            raise
+        with _swap_lock:
+            # The rows read by the build may predate these changes,
+            # replaying them is harmless when they don't
+            for method_name, args in _pending_changes:
+                getattr(index, method_name)(*args)
+            _pending_changes = None
+            _task_index = index
+    return index
+
+
+def run_task_index_build():
+    try:
+        build_task_index()
+    except Exception:
+        logger.exception("Building the task index failed")
+        # Retried after MAX_AGE instead of on every request
+        index = _task_index
+        if index is not None:
+            index.built_at = time.monotonic()
+    finally:
+        close_old_connections()
+
+
+def start_task_index_build():
+    """
+    Build the index in a thread of its own, unless a build is running.
+    """
+    global _build_thread
+    with _swap_lock:
+        if _build_thread is not None and _build_thread.is_alive():
+            return
+        _build_thread = threading.Thread(
+            target=run_task_index_build, name="task-index-build", daemon=True
+        )
+        _build_thread.start()
+
+
+def get_task_index(wait=False):
+    """
+    Return the index of this process, starting its build (or the load of
+    its snapshot) when it is missing or expired. The expired index is
+    returned until the new one is built, and None before the first build,
+    unless `wait` is set (the warm-up, the benchmarks).
+    Returns None when the index is disabled, or when the tasks are sharded
+    since it only covers the default database.
+    """
+    if not is_task_index_enabled():
+        return None
+    index = _task_index
+    if index is not None and (
+        time.monotonic() - index.built_at
+        <= get_task_index_settings()["MAX_AGE"]
+    ):
+        return index
+    if wait:
+        return build_task_index()
+    start_task_index_build()
+    return index
+
+
+def apply_task_index_change(method_name, *args):
+    """
+    Apply a committed change of the tasks to the index of this process, and
+    to the index being built.
+    """
+    with _swap_lock:
+        if _task_index is not None:
+            getattr(_task_index, method_name)(*args)
+        if _pending_changes is not None:
+            _pending_changes.append((method_name, args))
+
+
+def reset_task_index():
+    global _task_index
+    _task_index = None
@@ -0,0 +1,270 @@
+"""
+Materialized task list: the task_list_entries read table.
+
+Rendering a list page reads the tasks, their creators and their tags, and
+formats every row. TaskListEntry keeps one row per (not deleted) task with
+what the v4 list renders already formatted: the creator's name, the
+formatted dates and the tags as a JSON array. The label of the completion
+status is translated, it is resolved in the language of the request when
+the row is rendered.
+A page whose filters are answered by its columns (created_by,
+completion_status and ordering) is then a scan of this table alone, and
+its rows are turned into the response without a serializer.
+
+The rows are rendered by TaskSerializer, from the read models of
+todos/read_models.py, and written in the transaction of the change which
+makes them stale:
+    - the save, tag change and (soft) deletion of a task, by the signal
+      handlers of todos/signals.py
+    - the renaming and (soft) deletion of a tag, for the tasks of the tag
+    - the renaming of a user, for the tasks it created
+    - the writes which send no signals: the imports, the buffered toggles
+      and the moves of users between shards
+
+The entries live on the database of their task, a shard when the tasks are
+sharded. The changes of a tag or a user are written to every task database
+after the tag or the user is saved, not atomically with it.
+
+Writing the rows costs every task write a few queries, the table is filled
+and maintained only when ENABLED. Run `manage.py rebuild_task_list` when
+enabling it, and after changing how the tasks are rendered.
+
+Settings (TASK_LIST_TABLE):
+    ENABLED: maintain the table and serve the v4 list from it
+"""
+from django.conf import settings
+from django.db.models.query import ValuesListIterable
+
+from core.fields import get_choice_label
+from todos.api.v2.filters import TaskFilter
+from todos.models import Task, TaskListEntry
+from todos.read_models import as_task_rows
+from todos.serializers import TaskSerializer
+from todos.sharding import ShardedTaskQuery, get_task_databases
+
+DEFAULT_SETTINGS = {
+    "ENABLED": False,
+}
+
+# The query params of the list pages served from the table
+SERVED_QUERY_PARAMS = {
+    "created_by", "completion_status", "ordering", "page", "page_size",
+}
+
+# Tasks rendered per query when refreshing many entries
+CHUNK_SIZE = 500
+
+
+def get_task_list_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_LIST_TABLE", {}))
+    return config
+
+
+def is_task_list_enabled():
+    return get_task_list_settings()["ENABLED"]
+
+
+# |=============================== Writing ================================| #
+def render_entries(task_rows):
+    """
+    Return the TaskListEntry of the TaskRow read models.
+    """
+    data = TaskSerializer(task_rows, many=True).data
+    return [
+        TaskListEntry(
+            id=task_row.id,
+            uuid=task_row.uuid,
+            title=task_row.title,
+            text=task_row.text,
+            completion_status=task_row.completion_status,
+            created_by_id=task_row.created_by_id,
+            created_by_name=item["created_by"]["name"],
+            created_date=task_row.created_date,
+            created_date_display=item["created_date"],
+            modified_date=task_row.modified_date,
+            modified_date_display=item["modified_date"],
+            version=task_row.version,
+            tags=[dict(tag) for tag in item["tags"]],
+        )
+        for task_row, item in zip(task_rows, data)
+    ]
+
+
+ENTRY_UPDATE_FIELDS = [
+    field.name for field in TaskListEntry._meta.concrete_fields
+    if not field.primary_key
+]
+
+
+def write_entries(using, task_ids):
+    """
+    Render the entries of the tasks of a database again, and delete those
+    of the tasks which are deleted.
+    """
+    task_ids = sorted(set(task_ids))
+    for index in range(0, len(task_ids), CHUNK_SIZE):
+        chunk = task_ids[index:index + CHUNK_SIZE]
+        task_rows = list(
+            as_task_rows(Task.objects.using(using).filter(id__in=chunk))
+        )
+        TaskListEntry.objects.using(using).bulk_create(
+            render_entries(task_rows),
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=ENTRY_UPDATE_FIELDS,
+        )
+        deleted_ids = set(chunk) - {task_row.id for task_row in task_rows}
+        if deleted_ids:
+            TaskListEntry.objects.using(using).filter(
+                id__in=deleted_ids
+            ).delete()
+
+
+def refresh_task_list(using, task_ids):
+    if is_task_list_enabled():
+        write_entries(using, task_ids)
+
+
+def get_tag_task_ids(tag_id):
+    """
+    Return {database: ids of the tasks linked to the tag}.
+    """
+    return {
+        using: list(
+            Task.tags.through.objects
+            .using(using)
+            .filter(tag_id=tag_id)
+            .values_list("task_id", flat=True)
+        )
+        for using in get_task_databases()
+    }
+
+
+def refresh_tag_task_list(task_ids_by_database):
+    for using, task_ids in task_ids_by_database.items():
+        refresh_task_list(using, task_ids)
+
+
+def rename_task_list_creator(user):
+    """
+    Write the name of the user in the entries of its tasks.
+    """
+    if not is_task_list_enabled():
+        return
+    # What TaskSerializer.get_created_by renders
+    name = f"{user.first_name} {user.last_name}"
+    for using in get_task_databases():
+        TaskListEntry.objects.using(using).filter(
+            created_by_id=user.pk
+        ).exclude(created_by_name=name).update(created_by_name=name)
+
+
+def rebuild_task_list():
+    """
+    Render the entries of all the tasks again, enabled or not, returns the
+    number of entries.
+    """
+    entry_count = 0
+    for using in get_task_databases():
+        TaskListEntry.objects.using(using).all().delete()
+        task_ids = list(
+            Task.objects.using(using).order_by("id")
+            .values_list("id", flat=True)
+        )
+        write_entries(using, task_ids)
+        entry_count += TaskListEntry.objects.using(using).count()
+    return entry_count
+
+
+# |=============================== Serving ================================| #
+def can_serve_task_list(request):
+    """
+    True when the list page requested is answered by the table: its
+    filters are columns of the table and it is rendered as text.
+    """
+    if not is_task_list_enabled():
+        return False
+    if not set(request.query_params) <= SERVED_QUERY_PARAMS:
+        return False
+    # The UUIDs and dates are stored as text, MessagePack and CBOR encode
+    # them natively
+    renderer = getattr(request, "accepted_renderer", None)
+    return not getattr(renderer, "native_types", False)
+
+
+class TaskListFilter(TaskFilter):
+    """
+    TaskFilter on the entries, only its created_by, completion_status and
+    ordering filters are used (see SERVED_QUERY_PARAMS).
+    """
+
+    class Meta(TaskFilter.Meta):
+        model = TaskListEntry
+
+
+class TaskListRow:
+    """
+    An entry read from the table. The columns needed to merge the pages of
+    the shards (see ShardedTaskQuery) are attributes, like on the tasks.
+    """
+    # The columns read from the table, in the order of the rows
+    fields = (
+        "id", "uuid", "title", "text", "completion_status",
+        "created_by_id", "created_by_name", "created_date",
+        "created_date_display", "modified_date", "modified_date_display",
+        "version", "tags",
+    )
+    __slots__ = fields + ("using",)
+
+    def __init__(self, *values, using=None):
+        for name, value in zip(self.fields, values):
+            setattr(self, name, value)
+        self.using = using
+
+    @property
+    def pk(self):
+        return self.id
+
+    def render(self):
+        # The fields of TaskSerializer, in its order
+        return {
+            "title": self.title,
+            "text": self.text,
+            "uuid": str(self.uuid),
+            # In the language of the request
+            "completion_status": get_choice_label(
+                Task, "completion_status", self.completion_status
+            ),
+            "created_by": {
+                "id": self.created_by_id,
+                "name": self.created_by_name,
+            },
+            "created_date": self.created_date_display,
+            "modified_date": self.modified_date_display,
+            "version": self.version,
+            "tags": self.tags,
+        }
+
+
+class TaskListRowIterable(ValuesListIterable):
+
+    def __iter__(self):
+        using = self.queryset.db
+        for values in super().__iter__():
+            yield TaskListRow(*values, using=using)
+
+
+def as_task_list_rows(queryset):
+    """
+    Return the queryset (or ShardedTaskQuery) of TaskListEntry yielding
+    TaskListRow objects.
+    """
+    if isinstance(queryset, ShardedTaskQuery):
+        return ShardedTaskQuery({
+            shard: as_task_list_rows(shard_queryset)
+            for shard, shard_queryset in queryset.querysets.items()
+        })
+    queryset = queryset.values_list(*TaskListRow.fields)
+    queryset._iterable_class = TaskListRowIterable
+    return queryset
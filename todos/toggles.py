@@ -0,0 +1,350 @@
+"""
+Write-behind buffer of the completion status toggles.
+
+Checking and unchecking tasks is the most frequent write of the clients, a
+PATCH of the task costs a full validation, save and serialization, and a
+commit (an fsync) of its own. POST /api/v4/tasks/<uuid>/toggle instead
+records the new status in a buffer of the process, where the toggles of a
+task are coalesced into its last status, and a flusher thread writes the
+buffered statuses in one transaction per database every FLUSH_INTERVAL
+seconds, or as soon as MAX_PENDING tasks are waiting. A task toggled back
+to its stored status is not written at all.
+
+The flush writes the statuses with one UPDATE per status, bumps the version
+and the modified date of the tasks, and applies the stats deltas and the
+task index changes that the signal handlers would have applied.
+
+DURABILITY:
+    SYNC: the toggle is written by the request, nothing is buffered
+    GROUP_COMMIT: the request waits until the flush including its toggle
+        is committed, the toggles of concurrent requests share a commit
+    WRITE_BEHIND: the request returns (202) as soon as the toggle is
+        buffered, the toggles of the last FLUSH_INTERVAL are lost if the
+        process dies
+
+Reads through the v4 task APIs see the buffered statuses (see
+apply_pending_toggles), the filters and the other APIs see the committed
+ones. A task saved with its completion_status by another request drops its
+buffered toggle, the later write wins.
+
+Settings (TASK_TOGGLES):
+    DURABILITY: SYNC, GROUP_COMMIT or WRITE_BEHIND
+    FLUSH_INTERVAL: seconds a toggle waits for others to be flushed with
+    MAX_PENDING: number of buffered tasks flushed without waiting more
+    WAIT_TIMEOUT: seconds a GROUP_COMMIT request waits for its flush
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from todos.models import Task
+from todos.stats import (
+    apply_task_stat_deltas,
+    apply_task_tag_stat_deltas,
+    get_created_day,
+    get_deltas,
+    get_tag_ids_by_task,
+    get_task_stat_keys,
+    get_task_tag_stat_keys,
+)
+from todos.task_index import apply_task_index_change, is_task_index_enabled
+from todos.task_list import refresh_task_list
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "DURABILITY": "GROUP_COMMIT",
+    "FLUSH_INTERVAL": 0.05,
+    "MAX_PENDING": 200,
+    "WAIT_TIMEOUT": 5.0,
+}
+
+
+def get_toggle_settings():
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, "TASK_TOGGLES", {}))
+    return config
+
+
+class ToggleFlushError(Exception):
+    """
+    The flush of a buffered toggle failed.
+    """
+
+
+# |================================ Writing ===============================| #
+def write_toggles(toggles):
+    """
+    Write {(database, task_id): completion_status}, one transaction per
+    database. Returns the number of tasks whose status changed.
+    """
+    statuses_by_database = defaultdict(dict)
+    for (using, task_id), completion_status in toggles.items():
+        statuses_by_database[using][task_id] = completion_status
+
+    changed_count = 0
+    for using, statuses in statuses_by_database.items():
+        with transaction.atomic(using=using):
+            changed_count += write_database_toggles(using, statuses)
+    return changed_count
+
+
+def write_database_toggles(using, statuses):
+    rows = (
+        Task.objects
+        .using(using)
+        .filter(id__in=statuses)
+        .values_list(
+            'id', 'created_by_id', 'completion_status', 'created_date'
+        )
+    )
+    changes = [
+        (task_id, created_by_id, completion_status, statuses[task_id],
+         get_created_day(created_date))
+        for task_id, created_by_id, completion_status, created_date in rows
+        if completion_status != statuses[task_id]
+    ]
+    if not changes:
+        return 0
+
+    task_ids_by_status = defaultdict(list)
+    for task_id, _, _, new_status, _ in changes:
+        task_ids_by_status[new_status].append(task_id)
+    now = timezone.now()
+    for completion_status, task_ids in task_ids_by_status.items():
+        Task.objects.using(using).filter(id__in=task_ids).update(
+            completion_status=completion_status,
+            version=F('version') + 1,
+            modified_date=now,
+        )
+
+    # What the Task signal handlers do for a save
+    tag_ids_by_task = get_tag_ids_by_task(
+        [task_id for task_id, *_ in changes], using
+    )
+    task_keys_before, task_keys_after = [], []
+    tag_keys_before, tag_keys_after = [], []
+    for task_id, created_by_id, old_status, new_status, created_day in (
+        changes
+    ):
+        tag_ids = tag_ids_by_task[task_id]
+        task_keys_before += get_task_stat_keys(
+            created_by_id, old_status, created_day
+        )
+        task_keys_after += get_task_stat_keys(
+            created_by_id, new_status, created_day
+        )
+        tag_keys_before += get_task_tag_stat_keys(
+            created_by_id, old_status, created_day, tag_ids
+        )
+        tag_keys_after += get_task_tag_stat_keys(
+            created_by_id, new_status, created_day, tag_ids
+        )
+    apply_task_stat_deltas(get_deltas(task_keys_before, task_keys_after))
+    apply_task_tag_stat_deltas(get_deltas(tag_keys_before, tag_keys_after))
+    refresh_task_list(using, [task_id for task_id, *_ in changes])
+
+    if is_task_index_enabled():
+        def update_task_index():
+            for task_id, created_by_id, old_status, new_status, _ in changes:
+                apply_task_index_change(
+                    'update_task', task_id, (created_by_id, old_status),
+                    (created_by_id, new_status)
+                )
+        transaction.on_commit(update_task_index, using=using)
+    return len(changes)
+
+
+# |================================ Buffer ================================| #
+class ToggleBatch:
+    """
+    The toggles flushed together, GROUP_COMMIT requests wait for it.
+    """
+    __slots__ = ("flushed", "error")
+
+    def __init__(self):
+        self.flushed = threading.Event()
+        self.error = None
+
+    def wait(self, timeout):
+        if not self.flushed.wait(timeout):
+            raise ToggleFlushError("The toggle wasn't flushed in time")
+        if self.error is not None:
+            raise ToggleFlushError(str(self.error)) from self.error
+
+
+class ToggleBuffer:
+
+    def __init__(self):
+        self.config = get_toggle_settings()
+        self.pending = {}
+        self.batch = ToggleBatch()
+        self.condition = threading.Condition()
+        self.flusher = None
+        self.flusher_pid = None
+
+    # |------------------------------ Requests ----------------------------| #
+    def get_status(self, using, task_id):
+        return self.pending.get((using, task_id))
+
+    def toggle(self, using, task_id, stored_status, completion_status=None):
+        """
+        Buffer the new status of the task: the given one, or the opposite
+        of its current (buffered or stored) status.
+        Returns (new status, batch flushing it).
+        """
+        key = (using, task_id)
+        with self.condition:
+            if completion_status is None:
+                current_status = self.pending.get(key, stored_status)
+                completion_status = (
+                    Task.CompletionStatus.INCOMPLETE
+                    if current_status == Task.CompletionStatus.COMPLETED
+                    else Task.CompletionStatus.COMPLETED
+                )
+            self.pending[key] = completion_status
+            batch = self.batch
+            if len(self.pending) == 1 or (
+                len(self.pending) >= self.config["MAX_PENDING"]
+            ):
+                self.condition.notify()
+        self.start_flusher()
+        return completion_status, batch
+
+    def discard(self, using, task_id):
+        if self.pending:
+            with self.condition:
+                self.pending.pop((using, task_id), None)
+
+    # |------------------------------ Flushing ----------------------------| #
+    def start_flusher(self):
+        # Started in the process which toggles, after the workers forked
+        if self.flusher_pid == os.getpid() and self.flusher.is_alive():
+            return
+        with self.condition:
+            if self.flusher_pid == os.getpid() and self.flusher.is_alive():
+                return
+            self.flusher = threading.Thread(
+                target=self.run, name="task-toggle-flusher", daemon=True
+            )
+            self.flusher_pid = os.getpid()
+            self.flusher.start()
+
+    def wait_for_toggles(self):
+        interval = self.config["FLUSH_INTERVAL"]
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            # The toggles of the next FLUSH_INTERVAL are flushed together
+            deadline = time.monotonic() + interval
+            while len(self.pending) < self.config["MAX_PENDING"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+    def run(self):
+        while True:
+            self.wait_for_toggles()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """
+        Write the buffered toggles, returns the number of changed tasks.
+        """
+        with self.condition:
+            pending, self.pending = self.pending, {}
+            batch, self.batch = self.batch, ToggleBatch()
+        changed_count = 0
+        try:
+            if pending:
+                changed_count = write_toggles(pending)
+        except Exception as error:
+            logger.exception("Flushing %d task toggles failed", len(pending))
+            batch.error = error
+            if self.config["DURABILITY"] == "WRITE_BEHIND":
+                # Nobody was told about the failure, the toggles are written
+                # with the next flush unless they were toggled again
+                with self.condition:
+                    for key, completion_status in pending.items():
+                        self.pending.setdefault(key, completion_status)
+        finally:
+            batch.flushed.set()
+        return changed_count
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_toggle_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ToggleBuffer()
+                # The toggles buffered when the process exits normally
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+# |================================== API =================================| #
+def toggle_task(task, completion_status=None):
+    """
+    Toggle (or set) the completion status of the task according to the
+    DURABILITY setting. Returns (new status, True when it is committed).
+    Raises ToggleFlushError when a GROUP_COMMIT flush fails.
+    """
+    config = get_toggle_settings()
+    using = task._state.db
+    toggle_buffer = get_toggle_buffer()
+    if config["DURABILITY"] == "SYNC":
+        if completion_status is None:
+            completion_status = (
+                Task.CompletionStatus.INCOMPLETE
+                if task.completion_status == Task.CompletionStatus.COMPLETED
+                else Task.CompletionStatus.COMPLETED
+            )
+        toggle_buffer.discard(using, task.pk)
+        write_toggles({(using, task.pk): completion_status})
+        return completion_status, True
+
+    completion_status, batch = toggle_buffer.toggle(
+        using, task.pk, task.completion_status, completion_status
+    )
+    if config["DURABILITY"] == "WRITE_BEHIND":
+        return completion_status, False
+    batch.wait(config["WAIT_TIMEOUT"])
+    return completion_status, True
+
+
+def apply_pending_toggles(tasks):
+    """
+    Set the buffered status of the given tasks on them (read-through). The
+    tasks are Task instances, TaskRow read models or TaskListRow entries.
+    """
+    toggle_buffer = _buffer
+    if toggle_buffer is None or not toggle_buffer.pending:
+        return tasks
+    for task in tasks:
+        using = task._state.db if isinstance(task, Task) else task.using
+        completion_status = toggle_buffer.get_status(using, task.pk)
+        if completion_status is not None:
+            task.completion_status = completion_status
+    return tasks
+
+
+def discard_pending_toggle(using, task_id):
+    if _buffer is not None:
+        _buffer.discard(using, task_id)
@@ -0,0 +1,72 @@
+"""
+An immutable in-process snapshot of the Tag table.
+
+The tag vocabulary is small and read far more often than it is written, so
+every process keeps a read only copy of it. The snapshot is built before the
+WSGI workers are forked (see core/warmup.py) so that its memory pages are
+shared between the workers.
+
+Writes made in this process replace the snapshot through the Tag signals.
+Writes made by other processes are picked up once the snapshot is older
+than the TAG_VOCABULARY_MAX_AGE setting (in seconds).
+"""
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.conf import settings
+
+from todos.models import Tag
+
+TagEntry = namedtuple("TagEntry", ["id", "uuid", "name"])
+
+
+class TagVocabulary:
+    """
+    Read only lookups of tags by id and by uuid.
+    """
+    __slots__ = ("by_id", "by_uuid", "loaded_at")
+
+    def __init__(self, entries):
+        entries = list(entries)
+        self.by_id = MappingProxyType({entry.id: entry for entry in entries})
+        self.by_uuid = MappingProxyType(
+            {entry.uuid: entry for entry in entries}
+        )
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    @classmethod
+    def load(cls):
+        return cls(
+            TagEntry(*row)
+            for row in Tag.objects.values_list("id", "uuid", "name")
+        )
+
+
+_vocabulary = None
+_lock = threading.Lock()
+
+
+def get_tag_vocabulary():
+    """
+    Return the current snapshot, loading it if it is missing or expired.
+    """
+    global _vocabulary
+    vocabulary = _vocabulary
+    max_age = getattr(settings, "TAG_VOCABULARY_MAX_AGE", 60)
+    if (
+        vocabulary is None
+        or time.monotonic() - vocabulary.loaded_at > max_age
+    ):
+        with _lock:
+            vocabulary = _vocabulary = TagVocabulary.load()
+    return vocabulary
+
+
+def invalidate_tag_vocabulary():
+    global _vocabulary
+    _vocabulary = None